@@ -0,0 +1,150 @@
+import os
+import sys
+import time
+from collections import OrderedDict
+from loguru import logger
+
+# Defaults, overridable from .env
+AGENT_POOL_MAX_SIZE = int(os.getenv("AGENT_POOL_MAX_SIZE", 200))
+AGENT_POOL_IDLE_TTL_SECONDS = int(os.getenv("AGENT_POOL_IDLE_TTL_SECONDS", 30 * 60))
+AGENT_POOL_MAX_MB = int(os.getenv("AGENT_POOL_MAX_MB", 256))
+# Rough fixed cost of one MCPAgent (LLM client, langgraph executor, tool wrappers)
+AGENT_BASE_BYTES = 2 * 1024 * 1024
+
+
+def estimate_agent_bytes(agent) -> int:
+    """Approximate memory held by an agent: a fixed base plus its conversation memory."""
+    size = AGENT_BASE_BYTES
+    try:
+        for message in agent.get_conversation_history():
+            content = getattr(message, "content", message)
+            size += sys.getsizeof(content if isinstance(content, str) else str(content))
+    except Exception:
+        pass
+    return size
+
+
+class _Entry:
+    __slots__ = ("agent", "worker", "prompt_key", "created_at", "last_used", "size_bytes")
+
+    def __init__(self, agent, worker=None, prompt_key=None):
+        self.agent = agent
+        self.worker = worker  # MCP worker the agent's tools are bound to
+        self.prompt_key = prompt_key  # context its system prompt was built for
+        self.created_at = time.monotonic()
+        self.last_used = self.created_at
+        self.size_bytes = estimate_agent_bytes(agent)
+
+
+class AgentPool:
+    """
+    Bounded session_id -> MCPAgent cache with LRU + idle-TTL eviction.
+
+    Entries are kept in least-recently-used order, so idle ones are always at the front and
+    each sweep only looks at the agents it actually evicts. Evicted agents are just dropped
+    (never close()d: that would close the MCP sessions shared by every agent); the next
+    request for that session builds a fresh one.
+    """
+
+    def __init__(self, max_size: int = AGENT_POOL_MAX_SIZE, idle_ttl: float = AGENT_POOL_IDLE_TTL_SECONDS,
+                 max_bytes: int = AGENT_POOL_MAX_MB * 1024 * 1024):
+        self.max_size = max_size
+        self.idle_ttl = idle_ttl
+        self.max_bytes = max_bytes
+        self._entries: "OrderedDict[str, _Entry]" = OrderedDict()
+        self._total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = {"lru": 0, "ttl": 0, "memory": 0, "worker_restart": 0}
+
+    def __contains__(self, session_id) -> bool:
+        return session_id in self._entries
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def _evict(self, session_id: str, reason: str):
+        entry = self._entries.pop(session_id)
+        self._total_bytes -= entry.size_bytes
+        self.evictions[reason] += 1
+        logger.info(f"♻️ Evicted agent for session {session_id} ({reason}, ~{entry.size_bytes // 1024} KB)")
+
+    def evict_idle(self):
+        """Drop agents idle for longer than idle_ttl."""
+        now = time.monotonic()
+        while self._entries:
+            session_id, entry = next(iter(self._entries.items()))
+            if now - entry.last_used < self.idle_ttl:
+                break
+            self._evict(session_id, "ttl")
+
+    def _enforce_limits(self, keep: str = None):
+        while len(self._entries) > self.max_size:
+            self._evict(next(iter(self._entries)), "lru")
+        while self._total_bytes > self.max_bytes and len(self._entries) > 1:
+            oldest = next(iter(self._entries))
+            if oldest == keep:
+                break
+            self._evict(oldest, "memory")
+
+    def get(self, session_id: str):
+        """The session's agent (marked most recently used), or None on a miss."""
+        self.evict_idle()
+        entry = self._entries.get(session_id)
+        if entry is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        entry.last_used = time.monotonic()
+        self._entries.move_to_end(session_id)
+        return entry.agent
+
+    def put(self, session_id: str, agent, worker=None, prompt_key=None):
+        if session_id in self._entries:
+            self._total_bytes -= self._entries.pop(session_id).size_bytes
+        entry = _Entry(agent, worker, prompt_key)
+        self._entries[session_id] = entry
+        self._total_bytes += entry.size_bytes
+        self._enforce_limits(keep=session_id)
+
+    def worker_of(self, session_id: str):
+        entry = self._entries.get(session_id)
+        return entry.worker if entry else None
+
+    def prompt_key_of(self, session_id: str):
+        entry = self._entries.get(session_id)
+        return entry.prompt_key if entry else None
+
+    def set_prompt_key(self, session_id: str, prompt_key):
+        entry = self._entries.get(session_id)
+        if entry is not None:
+            entry.prompt_key = prompt_key
+
+    def evict_worker(self, worker):
+        """Drop every agent bound to a worker (its tool connections are gone after a restart)."""
+        for session_id in [sid for sid, entry in self._entries.items() if entry.worker is worker]:
+            self._evict(session_id, "worker_restart")
+
+    def update_size(self, session_id: str):
+        """Re-measure an agent after a run (its conversation memory grows every turn)."""
+        entry = self._entries.get(session_id)
+        if entry is None:
+            return
+        new_size = estimate_agent_bytes(entry.agent)
+        self._total_bytes += new_size - entry.size_bytes
+        entry.size_bytes = new_size
+        self._enforce_limits(keep=session_id)
+
+    def metrics(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._entries),
+            "max_size": self.max_size,
+            "idle_ttl_seconds": self.idle_ttl,
+            "approx_bytes": self._total_bytes,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 3) if lookups else None,
+            "evictions": dict(self.evictions),
+        }
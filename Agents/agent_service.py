@@ -1,18 +1,36 @@
 import asyncio
 import os
+import time
+from contextlib import aclosing
 from dotenv import load_dotenv
-from langchain_groq import ChatGroq
-from mcp_use import MCPAgent, MCPClient
+from llm_client import get_chat_model
+from mcp_use import MCPAgent
 from loguru import logger
 from app_context import get_bid
+from Agents.agent_pool import AgentPool
+from Agents.mcp_pool import MCPWorkerPool
+from Agents.scheduler import AgentBusy, RunScheduler
+from Agents.supervisor import RunSupervisor
+from Agents.tool_memo import ToolMemo
+from Agents.tracing import AgentTracer
+from Agents.prompt_builder import build_system_prompt, context_key, count_tokens, message_tokens, trim_history
 from database import SessionLocal
+from tenant_cache import tenant_cache
 import models
-from sqlalchemy import desc
+from datetime import datetime
 import tweepy
 # Load .env explicitly from the project root
 #root_env_path = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), ".env")
 load_dotenv()
 
+# Rolling chat summary: new turns folded in per background update, and how much of each answer is kept
+SUMMARY_MAX_NEW_TURNS = 20
+SUMMARY_MAX_TURN_CHARS = 1500
+# Tool results are truncated in streamed progress events (the agent still sees them in full)
+STREAM_TOOL_OUTPUT_CHARS = 2000
+# What MCPAgent.run() answers when a run ends without a final message (step limit, supervisor stop)
+NO_OUTPUT_RESPONSE = "No output generated"
+
 class AgentService:
     def __init__(self):
         # Resolve absolute path to server.py
@@ -31,15 +49,25 @@ class AgentService:
                 }
             }
         }
-        self.client = None
-        self.active_agents = {} # Key: session_id (e.g., email), Value: MCPAgent instance
+        self.workers = None  # MCPWorkerPool: one MCPClient + server.py subprocess per worker
+        self._summary_tasks = {}  # email -> running summary update task
+        self._summary_pending = set()  # emails with turns logged while their update was running
+        self.active_agents = AgentPool() # Key: session_id (e.g., email), Value: MCPAgent instance (bounded LRU/TTL)
+        self.scheduler = RunScheduler()  # one run per session at a time, bounded concurrency overall
+        self.supervisor = RunSupervisor()  # loop detection and per-run step/time budgets (tool-call middleware)
+        self.tool_memo = ToolMemo()  # per-run cache of idempotent tool results, in front of the supervisor
+        self.tracer = AgentTracer()  # per-run LLM/tool spans and latency percentiles for /agent/traces
+        self.prompt_stats = {"turns": 0, "estimated_input_tokens": 0, "input_tokens": 0, "trimmed_messages": 0}
         
     async def start(self):
         """Initializes the MCP Client and Agent."""
         try:
             logger.info("🚀 Starting AgentService...")
-            self.client = MCPClient.from_dict(self.config)
-            logger.info("✅ AgentService started (Client Connected).")
+            started = time.monotonic()
+            workers = MCPWorkerPool(self.config, on_restart=self.active_agents.evict_worker, middleware=[self.tool_memo, self.supervisor, self.tracer])
+            await workers.start()
+            self.workers = workers
+            logger.info(f"✅ AgentService started in {time.monotonic() - started:.1f}s (tool sessions ready).")
             
         except Exception as e:
             logger.error(f"Failed to start AgentService: {e}")
@@ -47,115 +75,172 @@ class AgentService:
 
     async def stop(self):
         """Closes the MCP Client connection."""
-        if self.client:
+        for task in list(self._summary_tasks.values()):
+            task.cancel()
+        if self.workers:
             logger.info("🛑 Stopping AgentService...")
             try:
-                await self.client.close_all_sessions()
+                await self.workers.stop()
             except asyncio.CancelledError:
                 logger.info("⚠️ AgentService shutdown cancelled (normal during reload).")
             except Exception as e:
                 logger.error(f"Error checking/stopping agent service: {e}")
             logger.info("✅ AgentService stopped.")
 
+    def metrics(self) -> dict:
+        """Runtime metrics for the /agent/metrics endpoint."""
+        return {
+            "agent_pool": self.active_agents.metrics(),
+            "mcp_workers": self.workers.metrics() if self.workers else None,
+            "scheduler": self.scheduler.metrics(),
+            "prompts": dict(self.prompt_stats),
+            "supervisor": self.supervisor.metrics(),
+            "memoized_tools": sorted(self.tool_memo.idempotent),
+        }
+
     async def _get_chat_history_summary(self, email: str) -> str:
         """
-        Fetches recent chat history for the user and summarizes it.
+        Returns the persisted rolling summary for the user (one indexed lookup, no LLM call).
+        The summary is kept up to date in the background by update_chat_summary().
         """
         if not email:
             return ""
 
         try:
-            # 1. Fetch recent history from DB
-            # Use sync DB call in thread or just quick sync? 
-            # Ideally async, but SessionLocal is sync. We'll do it quickly.
-            # Limiting to last 10 interactions to avoid massive context
-            history_text = ""
-            with SessionLocal() as db:
-                chats = db.query(models.ChatHistory)\
-                    .filter(models.ChatHistory.username == email)\
-                    .order_by(desc(models.ChatHistory.id))\
-                    .limit(10)\
-                    .all()
-                
-                if not chats:
-                    return ""
-                
-                # Reverse to chronological order
-                chats = chats[::-1]
-                
-                history_text = "\n".join([f"User: {c.input_message}\nAI: {c.agent_response}" for c in chats])
-
-            if not history_text:
-                return ""
-
-            # 2. Summarize using a separate LLM call (lightweight model)
-            # We use a direct Groq call here to avoid recursion with the main agent
+            return await asyncio.to_thread(self._read_summary, email)
+        except Exception as e:
+            logger.error(f"Failed to load chat summary: {e}")
+            return ""
+
+    @staticmethod
+    def _read_summary(email: str) -> str:
+        with SessionLocal() as db:
+            row = db.query(models.ChatSummary).filter(models.ChatSummary.username == email).first()
+            return row.summary if row and row.summary else ""
+
+    def schedule_summary_update(self, email: str):
+        """
+        Fold the user's newest chat turns into their rolling summary, off the request path.
+        At most one update runs per user; turns logged meanwhile are picked up by a follow-up run.
+        """
+        if not email:
+            return
+        task = self._summary_tasks.get(email)
+        if task and not task.done():
+            self._summary_pending.add(email)
+            return
+        self._summary_tasks[email] = asyncio.create_task(self._summary_worker(email))
+
+    async def _summary_worker(self, email: str):
+        try:
+            while True:
+                self._summary_pending.discard(email)
+                await self.update_chat_summary(email)
+                if email not in self._summary_pending:
+                    break
+        finally:
+            self._summary_tasks.pop(email, None)
+
+    async def update_chat_summary(self, email: str):
+        """
+        Incrementally update the rolling summary: only ChatHistory rows newer than the
+        last one already summarized are sent to the LLM, together with the previous summary.
+        Database reads and writes run in a worker thread.
+        """
+        try:
+            pending = await asyncio.to_thread(self._unsummarized_turns, email)
+            if pending is None:
+                return
+            previous_summary, new_turns, new_last_id, turn_count = pending
+
             groq_api_key = os.getenv("GROQ_API_KEY")
             if not groq_api_key:
-                return ""
-            
-            client = ChatGroq(model="openai/gpt-oss-20b", groq_api_key=groq_api_key) # Use smaller model for summary
-            
+                return
+
+            client = get_chat_model("openai/gpt-oss-20b") # Use smaller model for summary
+
             summary_prompt = f"""
-            Summarize the following conversation history into a concise context for the AI agent.
-            Highlight key user preferences, tasks in progress, and recent topics.
-            
-            History:
-            {history_text}
-            
-            Summary:
+            Update the running summary of a conversation between a user and an AI marketing agent.
+            Keep key user preferences, tasks in progress, and recent topics. Drop stale details.
+            Keep it under 200 words.
+
+            Current summary:
+            {previous_summary or "(none yet)"}
+
+            New turns:
+            {new_turns}
+
+            Updated summary:
             """
-            
-            # Invoking invoke() which is sync or async? ChatGroq invoke is sync usually?
-            # Langchain invoke is sync. ainvoke is async.
             response = await client.ainvoke(summary_prompt)
-            summary = response.content
-            
-            logger.info(f"Generated chat history summary for {email}")
-            return summary
+            await asyncio.to_thread(self._write_summary, email, response.content, new_last_id)
+
+            logger.info(f"Updated rolling chat summary for {email} (+{turn_count} turns)")
 
         except Exception as e:
-            logger.error(f"Failed to summarize chat history: {e}")
-            return ""
+            logger.error(f"Failed to update chat summary: {e}")
 
+    @staticmethod
+    def _unsummarized_turns(email: str):
+        """(previous summary, new turns as text, id of the newest turn, turn count), or None if up to date."""
+        with SessionLocal() as db:
+            row = db.query(models.ChatSummary).filter(models.ChatSummary.username == email).first()
+            last_chat_id = row.last_chat_id if row else 0
+            previous_summary = row.summary if row else ""
+            # Newest turns first, so a user with a long backlog starts from recent context
+            chats = db.query(models.ChatHistory)\
+                .filter(models.ChatHistory.username == email, models.ChatHistory.id > (last_chat_id or 0))\
+                .order_by(models.ChatHistory.id.desc())\
+                .limit(SUMMARY_MAX_NEW_TURNS)\
+                .all()
+            if not chats:
+                return None
+            chats = chats[::-1]
+            new_turns = "\n".join([
+                f"User: {c.input_message}\nAI: {(c.agent_response or '')[:SUMMARY_MAX_TURN_CHARS]}" for c in chats
+            ])
+            return previous_summary, new_turns, chats[-1].id, len(chats)
 
-    async def run_query(self, query: str, context: dict = None):
-        """
-        Runs a query against the MCP Agent.
-        
-        Args:
-            query: The user's prompt.
-            context: Optional dictionary containing session details (e.g., 'bid', 'user_id', 'tokens').
-        """
-        if not self.client:
+    @staticmethod
+    def _write_summary(email: str, summary: str, last_chat_id: int):
+        with SessionLocal() as db:
+            row = db.query(models.ChatSummary).filter(models.ChatSummary.username == email).first()
+            if row is None:
+                row = models.ChatSummary(username=email)
+                db.add(row)
+            row.summary = summary
+            row.last_chat_id = last_chat_id
+            row.updated_at = datetime.now().isoformat()
+            db.commit()
+
+
+    async def _ensure_client(self) -> bool:
+        if not self.workers:
             # Lazy init if not started (fallback)
             logger.warning("AgentService not started. Attempting lazy start...")
             await self.start()
-            
-        if not self.client:
-             return "❌ Error: Agent failed to initialize."
-        
+        return self.workers is not None
+
+    async def _resolve_context(self, context: dict = None):
+        """Resolves the business context. Returns (session_id, context)."""
         # Ensure context is a dict
         if context is None:
             context = {}
 
         # Resolve Business ID: Explicit context > Global Context > Email Lookup (Fallback)
         bid = context.get('bid')
-        logger.info(f"DEBUG: agent_service.run_query START - Explicit BID: {bid}, Global get_bid(): {get_bid()}")
+        logger.info(f"DEBUG: agent_service query START - Explicit BID: {bid}, Global get_bid(): {get_bid()}")
         email = context.get('email')
         
         if not bid:
             bid = get_bid()
-            # If still no BID, try DB lookup by email
+            # If still no BID, look the email up (tenant cache, DB on a miss)
             if not bid and email:
                 try:
-                    from database import SessionLocal
-                    import models
-                    with SessionLocal() as db:
-                        user = db.query(models.UserCredentials).filter(models.UserCredentials.email == email.lower()).first()
-                        if user:
-                            bid = user.bid
-                            logger.info(f"✅ Resolved BID {bid} from DB for email {email}")
+                    profile = tenant_cache.get_by_email(email)
+                    if profile:
+                        bid = profile.bid
+                        logger.info(f"✅ Resolved BID {bid} for email {email}")
                 except Exception as e:
                     logger.error(f"Failed to resolve BID from DB: {e}")
 
@@ -166,67 +251,191 @@ class AgentService:
 
         # Determine Session ID
         session_id = context.get('email') if context.get('email') else "anonymous"
+        return session_id, context
 
-        # Get Chat History Summary
-        history_summary = ""
-        if session_id != "anonymous":
-            history_summary = await self._get_chat_history_summary(session_id)
-
-
-        # Construct Contextual Prompt (Prepend only if not already in history? 
-        # Actually, for robust per-query context update, we prefer prepending context instructions 
-        # to the current user message, so the LLM knows the *current* context even if history exists.)
-        full_query = query
-        if context:
-            system_instruction = f"""
-            [SYSTEM CONTEXT]
-            You are acting on behalf of a specific user/business.
-            - Business ID (bid): {context.get('bid')}
-            - User Email: {context.get('email')}
-            - Facebook Page ID: {os.getenv('FB_PAGE_ID')}
-            - Instagram ID: {os.getenv('INSTA_PAGE_ID')}
-            - Facebook Access Token: {os.getenv('FB_SYSTEM_TOKEN')}
-            - Instagram Access Token: {os.getenv('FB_SYSTEM_TOKEN')}
-            
-            IMPORTANT:
-            1. For 'search_social_sphere_context', YOU MUST USE the 'bid' provided above. IF BID IS 'None', YOU MUST NOT CALL THIS TOOL.
-            2. For **IMAGE GENERATION** (posters, ads, etc.):
-               - FIRST, call `write_image_prompt` with the user's idea to get a detailed prompt.
-               - SECOND, call `generate_marketing_poster` with that detailed prompt AND the `bid`.
-               - **CRITICAL**: Once `generate_marketing_poster` returns the URL, YOUR TASK IS COMPLETE. Return the URL to the user and STOP. DO NOT loop.
-            3. For Facebook and Instagram tools, do NOT ask for or pass 'page_id', 'ig_id', or tokens. The system handles authentication automatically.
-            4. Do NOT ask the user for these IDs.
-            5. IF 'retrieve_business_context' fails or returns no info, DO NOT RETRY it. Proceed with your best general knowledge.
-            
-            [PREVIOUS CHAT HISTORY SUMMARY]
-            {history_summary}
-            
-            [USER QUERY]
-            {query}
-            """
-            full_query = system_instruction
+    async def _get_agent(self, session_id: str, context: dict):
+        """
+        The session's agent, with its system prompt and memory fitted to the token budget,
+        and the MCP worker it is bound to. Returns (agent, worker).
+        """
+        # Check for existing agent (evicted/expired sessions are rebuilt transparently)
+        agent = self.active_agents.get(session_id)
+        if agent is not None:
+            logger.info(f"Adding to existing conversation for session: {session_id}")
+            await self._fit_prompt(session_id, agent, context)
+            return agent, self.active_agents.worker_of(session_id)
+
+        logger.info(f"Initializing NEW agent for session: {session_id}")
+        # Groq LLM (shared client, reused by every session)
+        llm = get_chat_model("openai/gpt-oss-20b")
+
+        # The instructions go in the system message once, not in front of every user message.
+        # Earlier conversations reach a new agent through the rolling summary.
+        history_summary = await self._get_chat_history_summary(session_id) if session_id != "anonymous" else ""
+        system_prompt = build_system_prompt(context, history_summary)
+
+        # Create persistent agent instance on the least busy worker's MCPClient connection
+        worker = self.workers.pick()
+        # The supervisor enforces the real per-query budget; max_steps is only a backstop on LLM calls
+        agent = MCPAgent(llm=llm, client=worker.client, max_steps=50, system_prompt=system_prompt,
+                         callbacks=self.tracer.callbacks)
+        # Initialized here from the worker's already loaded tools, rather than inside the first run
+        # (an agent initialized by run() also closes the worker's shared sessions if that run fails).
+        # When priming isn't supported, initialize() lists and converts the tools itself.
+        worker.prime(agent)
+        await agent.initialize()
+        self.active_agents.put(session_id, agent, worker=worker, prompt_key=context_key(context))
+        logger.info(f"Bound session {session_id} to MCP worker {worker.id}")
+        return agent, worker
+
+    async def _fit_prompt(self, session_id: str, agent, context: dict):
+        """
+        Keep the agent's memory inside AGENT_HISTORY_TOKEN_BUDGET (a sliding window of whole turns).
+        The system prompt is only rebuilt when the context changed or turns were dropped, and then
+        picks up the current rolling summary so the dropped turns are not lost entirely.
+        """
+        history = agent.get_conversation_history()
+        kept, dropped = trim_history(history)
+        # The newest turn may also come back shortened (new message objects) when it alone is over budget
+        if dropped or any(k is not h for k, h in zip(kept, history)):
+            agent.clear_conversation_history()
+            for message in kept:
+                agent.add_to_history(message)
+            self.prompt_stats["trimmed_messages"] += dropped
+            logger.info(f"✂️ Trimmed {dropped} old messages from session {session_id}'s memory")
+
+        key = context_key(context)
+        if dropped or key != self.active_agents.prompt_key_of(session_id):
+            history_summary = await self._get_chat_history_summary(session_id) if session_id != "anonymous" else ""
+            system_prompt = build_system_prompt(context, history_summary)
+            agent.system_prompt = system_prompt  # what a re-initialize would rebuild the system message from
+            agent.set_system_message(system_prompt)
+            self.active_agents.set_prompt_key(session_id, key)
+
+    def _estimate_input_tokens(self, agent, query: str) -> int:
+        """Prompt size of the first model call of a turn: system message + memory + the new message."""
+        system = agent.get_system_message()
+        system_tokens = count_tokens(system.content) if system is not None else count_tokens(agent.system_prompt or "")
+        return system_tokens + sum(message_tokens(m) for m in agent.get_conversation_history()) + count_tokens(query)
+
+    def _log_turn_tokens(self, session_id: str, agent, history_len: int, estimated: int):
+        """Log the turn's input tokens: the estimate, and what Groq reported over all of the turn's model calls."""
+        reported = 0
+        for message in agent.get_conversation_history()[history_len:]:
+            usage = getattr(message, "usage_metadata", None) or {}
+            reported += usage.get("input_tokens", 0)
+        self.prompt_stats["turns"] += 1
+        self.prompt_stats["estimated_input_tokens"] += estimated
+        self.prompt_stats["input_tokens"] += reported
+        logger.info(f"🧮 Session {session_id}: ~{estimated} prompt tokens estimated, {reported} input tokens used this turn")
+
+    async def run_query(self, query: str, context: dict = None):
+        """
+        Runs a query against the MCP Agent.
+        
+        Args:
+            query: The user's prompt.
+            context: Optional dictionary containing session details (e.g., 'bid', 'user_id', 'tokens').
+
+        Raises:
+            AgentBusy: the run queue is full or the wait for a slot timed out.
+        """
+        if not await self._ensure_client():
+             return "❌ Error: Agent failed to initialize."
+
+        session_id, context = await self._resolve_context(context)
             
         try:
-            # Check for existing agent
-            if session_id in self.active_agents:
-                logger.info(f"Adding to existing conversation for session: {session_id}")
-                agent = self.active_agents[session_id]
-            else:
-                logger.info(f"Initializing NEW agent for session: {session_id}")
-                # Groq LLM
-                groq_api_key = os.getenv("GROQ_API_KEY")
-                llm = ChatGroq(model="openai/gpt-oss-20b", groq_api_key=groq_api_key)
-                
-                # Create persistent agent instance reusing the heavy MCPClient connection
-                agent = MCPAgent(llm=llm, client=self.client, max_steps=50)
-                self.active_agents[session_id] = agent
-            
-            logger.info(f"Running agent query with context: {context}")
-            result = await agent.run(full_query)
+            with self.tracer.trace(query) as trace:
+                async with self.scheduler.slot(session_id):
+                    trace.mark("queue")
+                    agent, worker = await self._get_agent(session_id, context)
+                    logger.info(f"Running agent query with context: {context}")
+                    history_len = len(agent.get_conversation_history())
+                    estimated = self._estimate_input_tokens(agent, query)
+                    trace.mark("prepare")
+                    async with self.workers.lease(worker):
+                        with self.supervisor.run(query) as run:
+                            trace.attach(run)
+                            result = await asyncio.wait_for(agent.run(query), timeout=run.remaining)
+                    self._log_turn_tokens(session_id, agent, history_len, estimated)
+                    self.active_agents.update_size(session_id)
             return result
+        except AgentBusy:
+            raise
+        except asyncio.TimeoutError:
+            self.supervisor.record_timeout()
+            logger.error(f"Agent run for session {session_id} exceeded its time budget")
+            return "❌ Agent Error: the request took too long and was stopped. Please try a simpler request."
         except Exception as e:
             logger.error(f"Agent execution failed: {e}")
             return f"❌ Agent Error: {str(e)}"
 
+    async def stream_query(self, query: str, context: dict = None):
+        """
+        Same as run_query, but yields progress events while the agent works:
+            {"type": "token", "content": ...}                 LLM output as it is generated
+            {"type": "tool_start", "tool": ..., "input": ...}
+            {"type": "tool_end", "tool": ..., "output": ...}
+            {"type": "final", "response": ...}                the answer run_query would return
+            {"type": "error", "message": ...}                ("busy": true when the run was refused or timed out queueing)
+        """
+        if not await self._ensure_client():
+            yield {"type": "error", "message": "❌ Error: Agent failed to initialize."}
+            return
+
+        session_id, context = await self._resolve_context(context)
+
+        try:
+            with self.tracer.trace(query) as trace:
+                async with self.scheduler.slot(session_id):
+                    trace.mark("queue")
+                    agent, worker = await self._get_agent(session_id, context)
+                    logger.info(f"Streaming agent query with context: {context}")
+                    history_len = len(agent.get_conversation_history())
+                    estimated = self._estimate_input_tokens(agent, query)
+                    final_response = ""
+                    trace.mark("prepare")
+                    async with self.workers.lease(worker):
+                        with self.supervisor.run(query) as run:
+                            trace.attach(run)
+                            async with aclosing(agent.stream_events(query)) as events:
+                                while True:
+                                    # The budget covers waiting on the agent, not the client reading events
+                                    try:
+                                        async with asyncio.timeout(run.remaining):
+                                            event = await anext(events)
+                                    except StopAsyncIteration:
+                                        break
+                                    kind = event.get("event")
+                                    data = event.get("data", {})
+                                    if kind == "on_chat_model_stream":
+                                        content = getattr(data.get("chunk"), "content", "")
+                                        if isinstance(content, str) and content:
+                                            yield {"type": "token", "content": content}
+                                    elif kind == "on_chat_model_end":
+                                        message = data.get("output")
+                                        # The last model message without tool calls is the agent's answer
+                                        if message is not None and not getattr(message, "tool_calls", None):
+                                            final_response = message.content if isinstance(message.content, str) else str(message.content)
+                                    elif kind == "on_tool_start":
+                                        yield {"type": "tool_start", "tool": event.get("name"), "input": data.get("input")}
+                                    elif kind == "on_tool_end":
+                                        output = data.get("output")
+                                        output = getattr(output, "content", output)
+                                        yield {"type": "tool_end", "tool": event.get("name"), "output": str(output)[:STREAM_TOOL_OUTPUT_CHARS]}
+                    self._log_turn_tokens(session_id, agent, history_len, estimated)
+                    self.active_agents.update_size(session_id)
+            yield {"type": "final", "response": final_response or NO_OUTPUT_RESPONSE}
+        except AgentBusy as e:
+            yield {"type": "error", "message": f"❌ {e}", "busy": True}
+        except asyncio.TimeoutError:
+            self.supervisor.record_timeout()
+            logger.error(f"Agent run for session {session_id} exceeded its time budget")
+            yield {"type": "error", "message": "❌ Agent Error: the request took too long and was stopped. Please try a simpler request."}
+        except Exception as e:
+            logger.error(f"Agent execution failed: {e}")
+            yield {"type": "error", "message": f"❌ Agent Error: {str(e)}"}
+
 # Singleton instance for easy import
 agent_service = AgentService()
\ No newline at end of file
@@ -0,0 +1,93 @@
+"""
+Micro-benchmarks for the agent layer.
+
+Run from the project root, e.g.:
+    python -m Agents.benchmark transport
+"""
+import os
+import sys
+import argparse
+import asyncio
+import time
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from mcp.server.fastmcp import FastMCP
+
+# Trivial tool, so the numbers are transport overhead rather than tool work
+echo_server = FastMCP("bench-echo", log_level="WARNING")
+
+
+@echo_server.tool()
+async def echo(text: str) -> str:
+    """Return the input unchanged."""
+    return text
+
+
+def _percentile(samples, pct):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+def _report(label, samples_ms):
+    print(f"{label:<28} n={len(samples_ms):<6} p50={_percentile(samples_ms, 50):7.3f} ms  "
+          f"p95={_percentile(samples_ms, 95):7.3f} ms  max={max(samples_ms):7.3f} ms")
+
+
+async def _measure(client, text: str, calls: int):
+    session = client.get_session("bench")
+    for _ in range(10):  # warm-up
+        await session.call_tool("echo", {"text": text})
+    samples = []
+    for _ in range(calls):
+        start = time.perf_counter()
+        await session.call_tool("echo", {"text": text})
+        samples.append((time.perf_counter() - start) * 1000)
+    return samples
+
+
+async def _bench_transport(calls: int, payload_sizes):
+    # Imported here: mcp_use logs to stdout on import, which would corrupt the `serve` subprocess' stdio
+    from mcp_use import MCPClient
+    from Agents.inprocess import attach_inprocess_server
+
+    stdio = MCPClient.from_dict({"mcpServers": {"bench": {"command": sys.executable, "args": [os.path.abspath(__file__), "serve"]}}})
+    inprocess = MCPClient()
+    try:
+        start = time.perf_counter()
+        await stdio.create_all_sessions()
+        print(f"{'stdio startup':<28} {(time.perf_counter() - start) * 1000:7.1f} ms")
+        start = time.perf_counter()
+        await attach_inprocess_server(inprocess, "bench", echo_server)
+        print(f"{'inprocess startup':<28} {(time.perf_counter() - start) * 1000:7.1f} ms")
+
+        for size in payload_sizes:
+            text = "x" * size
+            _report(f"stdio {size} B", await _measure(stdio, text, calls))
+            _report(f"inprocess {size} B", await _measure(inprocess, text, calls))
+    finally:
+        await stdio.close_all_sessions()
+        await inprocess.close_all_sessions()
+
+
+def bench_transport(calls: int = 500, payload_sizes=(16, 4096, 65536)):
+    """Per tool-call latency through an MCPClient session: stdio subprocess vs in-process."""
+    asyncio.run(_bench_transport(calls, payload_sizes))
+
+
+BENCHMARKS = {
+    "transport": bench_transport,
+}
+
+if __name__ == "__main__":
+    if sys.argv[1:] == ["serve"]:
+        echo_server.run(transport="stdio")  # the stdio side of bench_transport
+        sys.exit()
+    parser = argparse.ArgumentParser(description="Agent micro-benchmarks")
+    parser.add_argument("names", nargs="*", help=f"benchmarks to run: {', '.join(BENCHMARKS)} (default: all)")
+    args = parser.parse_args()
+    unknown = [n for n in args.names if n not in BENCHMARKS]
+    if unknown:
+        parser.error(f"unknown benchmark(s): {', '.join(unknown)}")
+    for name in args.names or BENCHMARKS:
+        BENCHMARKS[name]()
@@ -0,0 +1,105 @@
+import json
+from mcp import types
+from mcp_use.client.connectors.base import BaseConnector
+from mcp_use.client.middleware import CallbackClientSession
+from mcp_use.client.session import MCPSession
+from loguru import logger
+
+
+class InProcessToolSession:
+    """
+    Stand-in for an mcp ClientSession that calls a FastMCP server's tools directly.
+    Same results as the stdio transport (CallToolResult etc.), minus the JSON-RPC
+    serialization and the pipe to a subprocess.
+    """
+
+    def __init__(self, server):
+        self.server = server
+
+    async def initialize(self, *args, **kwargs) -> types.InitializeResult:
+        return types.InitializeResult(
+            protocolVersion=types.LATEST_PROTOCOL_VERSION,
+            capabilities=types.ServerCapabilities(
+                tools=types.ToolsCapability(),
+                resources=types.ResourcesCapability(),
+                prompts=types.PromptsCapability(),
+            ),
+            serverInfo=types.Implementation(name=self.server.name, version="in-process"),
+        )
+
+    async def list_tools(self, *args, **kwargs) -> types.ListToolsResult:
+        return types.ListToolsResult(tools=await self.server.list_tools())
+
+    async def call_tool(self, name: str, arguments: dict = None, *args, **kwargs) -> types.CallToolResult:
+        try:
+            result = await self.server.call_tool(name, arguments or {})
+        except Exception as e:
+            # Same shape the MCP server sends back over stdio for a failing tool
+            return types.CallToolResult(content=[types.TextContent(type="text", text=str(e))], isError=True)
+        if isinstance(result, tuple):  # (content, structured) for tools with an output schema
+            content, structured = result
+            return types.CallToolResult(content=list(content), structuredContent=structured)
+        if isinstance(result, dict):
+            return types.CallToolResult(
+                content=[types.TextContent(type="text", text=json.dumps(result, indent=2))], structuredContent=result
+            )
+        return types.CallToolResult(content=list(result))
+
+    async def list_resources(self, *args, **kwargs) -> types.ListResourcesResult:
+        return types.ListResourcesResult(resources=await self.server.list_resources())
+
+    async def read_resource(self, uri, *args, **kwargs) -> types.ReadResourceResult:
+        contents = await self.server.read_resource(uri)
+        return types.ReadResourceResult(contents=[
+            types.TextResourceContents(uri=uri, mimeType=c.mime_type, text=c.content)
+            if isinstance(c.content, str) else
+            types.BlobResourceContents(uri=uri, mimeType=c.mime_type, blob=c.content)
+            for c in contents
+        ])
+
+    async def list_prompts(self, *args, **kwargs) -> types.ListPromptsResult:
+        return types.ListPromptsResult(prompts=await self.server.list_prompts())
+
+    async def get_prompt(self, name: str, arguments: dict = None, *args, **kwargs) -> types.GetPromptResult:
+        return await self.server.get_prompt(name, arguments)
+
+    async def send_ping(self, *args, **kwargs) -> types.EmptyResult:
+        return types.EmptyResult()
+
+    async def __aexit__(self, *exc):
+        return None
+
+
+class InProcessConnector(BaseConnector):
+    """
+    mcp_use connector for a FastMCP server living in this process. The session is wrapped in
+    CallbackClientSession like every other connector, so client middleware still sees each call.
+    """
+
+    def __init__(self, server, middleware=None):
+        super().__init__(middleware=middleware)
+        self.server = server
+
+    async def connect(self) -> None:
+        if self._connected:
+            return
+        self.client_session = CallbackClientSession(
+            InProcessToolSession(self.server), self.public_identifier, self.middleware_manager
+        )
+        self._connected = True
+
+    @property
+    def public_identifier(self) -> str:
+        return f"inprocess:{self.server.name}"
+
+
+async def attach_inprocess_server(client, server_name: str, server) -> MCPSession:
+    """Register `server` as an (already initialized) session of an MCPClient, as if it came from its config."""
+    connector = InProcessConnector(server, middleware=client.middleware)
+    session = MCPSession(connector)
+    await session.initialize()
+    client.sessions[server_name] = session
+    if server_name not in client.active_sessions:
+        client.active_sessions.append(server_name)
+    logger.info(f"🔌 Attached in-process MCP server '{server.name}' ({len(connector.tools)} tools)")
+    return session
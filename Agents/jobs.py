@@ -0,0 +1,306 @@
+import asyncio
+import ipaddress
+import os
+import socket
+import uuid
+from datetime import datetime
+from typing import Optional
+from urllib.parse import urlsplit
+import aiohttp
+from aiohttp.abc import AbstractResolver
+from loguru import logger
+from database import SessionLocal
+import models
+from Agents.scheduler import AgentBusy
+
+# Defaults, overridable from .env
+AGENT_JOB_WORKERS = int(os.getenv("AGENT_JOB_WORKERS", 2))
+AGENT_JOB_MAX_QUEUED = int(os.getenv("AGENT_JOB_MAX_QUEUED", 500))
+AGENT_JOB_BUSY_RETRY_SECONDS = 5
+WEBHOOK_TIMEOUT_SECONDS = 10
+WEBHOOK_ATTEMPTS = 3
+# Comma-separated hosts callback URLs may point to. When unset, any public host is allowed;
+# private, loopback and link-local addresses are always refused.
+AGENT_JOB_CALLBACK_HOSTS = {h.strip().lower() for h in os.getenv("AGENT_JOB_CALLBACK_HOSTS", "").split(",") if h.strip()}
+
+
+class JobQueueFull(RuntimeError):
+    """Too many jobs are already waiting."""
+
+
+class InvalidCallbackUrl(ValueError):
+    """callback_url is malformed or points somewhere the server must not call."""
+
+
+async def check_callback_url(url: str) -> list:
+    """
+    Refuse callback URLs that would make the server call into its own network: non-http(s)
+    schemes, hosts outside AGENT_JOB_CALLBACK_HOSTS (when set), and any host resolving to a
+    private, loopback, link-local or otherwise non-public address. Returns the checked
+    addresses as (ip, family) pairs, for connecting to exactly those.
+    """
+    parts = urlsplit(url)
+    if parts.scheme not in ("http", "https") or not parts.hostname:
+        raise InvalidCallbackUrl("callback_url must be an http(s) URL")
+    host = parts.hostname.lower()
+    if AGENT_JOB_CALLBACK_HOSTS and host not in AGENT_JOB_CALLBACK_HOSTS:
+        raise InvalidCallbackUrl(f"callback_url host {host} is not allowed")
+    try:
+        port = parts.port or (443 if parts.scheme == "https" else 80)
+        infos = await asyncio.get_running_loop().getaddrinfo(host, port, type=socket.SOCK_STREAM)
+    except (OSError, ValueError) as e:
+        raise InvalidCallbackUrl(f"callback_url host {host} could not be resolved: {e}")
+    addresses = []
+    for info in infos:
+        address = ipaddress.ip_address(info[4][0].split("%")[0])
+        if not address.is_global or address.is_multicast:
+            raise InvalidCallbackUrl(f"callback_url host {host} resolves to a non-public address")
+        if (str(address), info[0]) not in addresses:
+            addresses.append((str(address), info[0]))
+    return addresses
+
+
+class _PinnedResolver(AbstractResolver):
+    """
+    Resolves the callback host to the addresses check_callback_url accepted, so a DNS answer
+    that changes between the check and the connection (DNS rebinding) can't redirect the POST.
+    """
+
+    def __init__(self, host: str, addresses: list):
+        self.host = host
+        self.addresses = addresses
+
+    async def resolve(self, host: str, port: int = 0, family: int = socket.AF_INET) -> list:
+        if host.lower() != self.host:
+            raise OSError(f"{host} is not the checked callback host")
+        return [{"hostname": host, "host": ip, "port": port, "family": ip_family,
+                 "proto": 0, "flags": socket.AI_NUMERICHOST}
+                for ip, ip_family in self.addresses if family in (socket.AF_UNSPEC, ip_family)]
+
+    async def close(self):
+        pass
+
+
+def job_to_dict(job: models.AgentJob) -> dict:
+    return {
+        "job_id": job.id,
+        "status": job.status,
+        "query": job.query,
+        "result": job.result,
+        "error": job.error,
+        "attempts": job.attempts,
+        "created_at": job.created_at,
+        "started_at": job.started_at,
+        "finished_at": job.finished_at,
+    }
+
+
+class AgentJobRunner:
+    """
+    Background execution of agent queries submitted through /agent/jobs.
+
+    Jobs are rows in the agent_jobs table, so queued work survives a restart: on start, jobs
+    left 'queued' are picked up again (oldest first). Jobs that were 'running' are failed as
+    interrupted rather than rerun, since they may already have published a post or sent an
+    email; the client sees the error and can resubmit. A fixed number of workers
+    pull job ids from an in-memory queue and call `run_query`; each run still goes through the
+    AgentService scheduler, so jobs share the per-session ordering and global concurrency limit
+    with interactive chats. When a job finishes, `on_finished(job)` is called and, if the job
+    has a callback_url, the job is POSTed there as JSON. Database work runs in worker threads,
+    never on the event loop.
+    """
+
+    def __init__(self, run_query, on_finished=None, workers: int = AGENT_JOB_WORKERS):
+        self.run_query = run_query
+        self.on_finished = on_finished
+        self.size = max(1, workers)
+        self._queue: "asyncio.Queue[str]" = asyncio.Queue()
+        self._workers = []
+        self._tasks = set()  # completion hooks/callbacks of jobs interrupted by the last restart
+
+    async def start(self):
+        recovered, interrupted = await asyncio.to_thread(self._recover)
+        for job_id in recovered:
+            self._queue.put_nowait(job_id)
+        self._workers = [asyncio.create_task(self._worker(i)) for i in range(self.size)]
+        for job in interrupted:
+            logger.warning(f"Agent job {job.id} was interrupted while running and will not be rerun")
+            task = asyncio.create_task(self._finished(job))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+        logger.info(f"✅ Agent job runner started ({self.size} workers, {len(recovered)} jobs recovered, "
+                    f"{len(interrupted)} interrupted).")
+
+    def _recover(self) -> tuple:
+        """
+        Jobs the previous process left behind: ids of the queued ones (oldest first), and the
+        running ones, now marked failed (detached rows).
+        """
+        recovered, interrupted = [], []
+        with SessionLocal() as db:
+            pending = db.query(models.AgentJob)\
+                .filter(models.AgentJob.status.in_(["queued", "running"]))\
+                .order_by(models.AgentJob.created_at).all()
+            for job in pending:
+                if job.status == "running":
+                    job.status = "failed"
+                    job.error = ("Interrupted by a server restart while running. It was not retried because it may "
+                                 "already have published or sent something; check before submitting it again.")
+                    job.finished_at = datetime.now().isoformat()
+                    interrupted.append(job)
+                    continue
+                recovered.append(job.id)
+            db.commit()
+            for job in interrupted:
+                db.refresh(job)
+                db.expunge(job)
+        return recovered, interrupted
+
+    async def stop(self):
+        for task in [*self._workers, *self._tasks]:
+            task.cancel()
+        await asyncio.gather(*self._workers, *self._tasks, return_exceptions=True)
+        self._workers = []
+        self._tasks.clear()
+
+    async def submit(self, email: str, bid: Optional[int], query: str, callback_url: Optional[str] = None) -> dict:
+        """Store and queue a job. Raises JobQueueFull, or InvalidCallbackUrl for a refused callback_url."""
+        if self._queue.qsize() >= AGENT_JOB_MAX_QUEUED:
+            raise JobQueueFull("Too many agent jobs are waiting, please retry later.")
+        if callback_url:
+            await check_callback_url(callback_url)
+        data = await asyncio.to_thread(self._insert, email, bid, query, callback_url)
+        self._queue.put_nowait(data["job_id"])
+        return data
+
+    def _insert(self, email: str, bid: Optional[int], query: str, callback_url: Optional[str]) -> dict:
+        with SessionLocal() as db:
+            job = models.AgentJob(
+                id=uuid.uuid4().hex,
+                username=email,
+                bid=bid,
+                query=query,
+                callback_url=callback_url,
+                status="queued",
+                attempts=0,
+                created_at=datetime.now().isoformat(),
+            )
+            db.add(job)
+            db.commit()
+            return job_to_dict(job)
+
+    def get(self, job_id: str) -> Optional[dict]:
+        with SessionLocal() as db:
+            job = db.query(models.AgentJob).filter(models.AgentJob.id == job_id).first()
+            if job is None:
+                return None
+            data = job_to_dict(job)
+            data["username"] = job.username
+            return data
+
+    def metrics(self) -> dict:
+        return {"workers": self.size, "queued": self._queue.qsize()}
+
+    async def _worker(self, worker_id: int):
+        while True:
+            job_id = await self._queue.get()
+            try:
+                await self._execute(job_id)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Agent job {job_id} failed in worker {worker_id}: {e}")
+            finally:
+                self._queue.task_done()
+
+    def _update(self, job_id: str, **fields) -> Optional[models.AgentJob]:
+        with SessionLocal() as db:
+            job = db.query(models.AgentJob).filter(models.AgentJob.id == job_id).first()
+            if job is None:
+                return None
+            for name, value in fields.items():
+                setattr(job, name, value)
+            db.commit()
+            db.refresh(job)
+            db.expunge(job)
+            return job
+
+    def _claim(self, job_id: str) -> Optional[tuple]:
+        """Mark a queued job running; returns (attempts, query, context), or None if it isn't queued."""
+        with SessionLocal() as db:
+            job = db.query(models.AgentJob).filter(models.AgentJob.id == job_id).first()
+            if job is None or job.status != "queued":
+                return None
+            attempts = (job.attempts or 0) + 1
+            job.status, job.attempts, job.started_at = "running", attempts, datetime.now().isoformat()
+            db.commit()
+            return attempts, job.query, {"bid": job.bid, "email": job.username}
+
+    async def _execute(self, job_id: str):
+        claimed = await asyncio.to_thread(self._claim, job_id)
+        if claimed is None:
+            return
+        attempts, query, context = claimed
+
+        try:
+            response = str(await self.run_query(query, context=context))
+        except AgentBusy:
+            # The agent is saturated: put the job back and let interactive traffic through first
+            await asyncio.to_thread(self._update, job_id, status="queued", attempts=attempts - 1)
+            await asyncio.sleep(AGENT_JOB_BUSY_RETRY_SECONDS)
+            self._queue.put_nowait(job_id)
+            return
+        except asyncio.CancelledError:
+            # Shutdown: left 'running', so the next start reports it as interrupted like a crash
+            raise
+        except Exception as e:
+            job = await asyncio.to_thread(self._update, job_id, status="failed", error=str(e),
+                                          finished_at=datetime.now().isoformat())
+        else:
+            failed = response.startswith("❌")  # run_query reports agent errors in its answer
+            job = await asyncio.to_thread(
+                self._update,
+                job_id,
+                status="failed" if failed else "succeeded",
+                result=response,
+                error=response if failed else None,
+                finished_at=datetime.now().isoformat(),
+            )
+        if job is None:
+            return
+        logger.info(f"📦 Agent job {job_id} {job.status} after attempt {job.attempts}")
+        await self._finished(job)
+
+    async def _finished(self, job: models.AgentJob):
+        if self.on_finished:
+            try:
+                self.on_finished(job)
+            except Exception as e:
+                logger.error(f"Agent job {job.id} completion hook failed: {e}")
+        if job.callback_url:
+            await self._notify(job)
+
+    async def _notify(self, job: models.AgentJob):
+        """POST the finished job to its callback URL (a few attempts with backoff)."""
+        try:
+            # Checked again at delivery: the host may resolve differently than at submission
+            addresses = await check_callback_url(job.callback_url)
+        except InvalidCallbackUrl as e:
+            logger.warning(f"Callback for agent job {job.id} skipped: {e}")
+            return
+        resolver = _PinnedResolver(urlsplit(job.callback_url).hostname.lower(), addresses)
+        payload = job_to_dict(job)
+        timeout = aiohttp.ClientTimeout(total=WEBHOOK_TIMEOUT_SECONDS)
+        for attempt in range(1, WEBHOOK_ATTEMPTS + 1):
+            try:
+                connector = aiohttp.TCPConnector(resolver=resolver, use_dns_cache=False)
+                async with aiohttp.ClientSession(timeout=timeout, connector=connector) as session:
+                    async with session.post(job.callback_url, json=payload, allow_redirects=False) as resp:
+                        if resp.status < 400:
+                            return
+                        error = f"HTTP {resp.status}"
+            except Exception as e:
+                error = repr(e)
+            logger.warning(f"Callback for agent job {job.id} failed (attempt {attempt}): {error}")
+            if attempt < WEBHOOK_ATTEMPTS:
+                await asyncio.sleep(2 ** attempt)
@@ -0,0 +1,256 @@
+import asyncio
+import os
+import time
+from contextlib import asynccontextmanager
+from mcp_use import MCPClient
+from mcp_use.agents.adapters import LangChainAdapter
+from loguru import logger
+
+# Defaults, overridable from .env
+MCP_WORKERS = int(os.getenv("MCP_WORKERS", min(4, os.cpu_count() or 1)))
+MCP_HEALTH_INTERVAL_SECONDS = int(os.getenv("MCP_HEALTH_INTERVAL_SECONDS", 30))
+MCP_HEALTH_TIMEOUT_SECONDS = int(os.getenv("MCP_HEALTH_TIMEOUT_SECONDS", 10))
+# "stdio": tools run in server.py subprocesses (default). "inprocess": the same @mcp.tool
+# functions are called directly in the API process, without the JSON-RPC/pipe hop.
+AGENT_TOOL_TRANSPORT = os.getenv("AGENT_TOOL_TRANSPORT", "stdio").lower()
+# 1: keep one extra stdio worker started and warmed up, swapped in when a worker has to be restarted
+MCP_HOT_SPARE = int(os.getenv("MCP_HOT_SPARE", 0))
+MCP_START_TIMEOUT_SECONDS = int(os.getenv("MCP_START_TIMEOUT_SECONDS", 120))
+# Private mcp_use adapter cache of converted tools per connector (mcp-use 1.7). Pre-filling it lets
+# agents skip tools/list; without it (other mcp_use versions) agents just load tools normally.
+TOOL_CACHE_ATTR = "_connector_tool_map"
+
+
+class MCPWorker:
+    """One MCP tool-server subprocess (Agents/server.py) and the MCPClient that talks to it."""
+
+    def __init__(self, worker_id: int, config: dict, transport: str = AGENT_TOOL_TRANSPORT, middleware=None):
+        self.id = worker_id
+        self.config = config
+        self.transport = transport
+        self.middleware = middleware or []  # mcp_use middleware applied to every tool call
+        self.client = self._new_client()
+        self.tools = {}  # connector -> LangChain tools built from its schemas, shared by the worker's agents
+        self.startup_ms = {}  # warm-up timings of the current client
+        self.in_flight = 0
+        self.restarts = 0
+        self.healthy = True
+        self.last_error = None
+        self._restart_lock = asyncio.Lock()
+
+    def _new_client(self) -> MCPClient:
+        # In-process workers get an empty client; start() attaches the server to it
+        config = None if self.transport == "inprocess" else self.config
+        return MCPClient(config=config, middleware=self.middleware)
+
+    async def start(self):
+        """
+        Create the session and load the tool schemas up front, so the first agent on this worker
+        doesn't pay for the server.py launch, its imports and tools/list.
+        """
+        started = time.monotonic()
+        if self.transport == "inprocess":
+            from Agents.inprocess import attach_inprocess_server
+            from Agents.server import mcp, warm_up
+            await warm_up()
+            # Registered under the configured server name (server.py), so tool names are unchanged
+            name = next(iter(self.config["mcpServers"]))
+            await attach_inprocess_server(self.client, name, mcp)
+        else:
+            # Launches server.py (which warms its models before answering initialize) and lists its tools
+            await asyncio.wait_for(self.client.create_all_sessions(), timeout=MCP_START_TIMEOUT_SECONDS)
+        session_done = time.monotonic()
+
+        # Convert the tool schemas to LangChain tools once; every agent on this worker reuses them
+        adapter = LangChainAdapter()
+        await adapter.create_tools(self.client)
+        tool_map = getattr(adapter, TOOL_CACHE_ATTR, None)
+        if tool_map is None:
+            logger.warning(f"mcp_use adapter has no {TOOL_CACHE_ATTR}; agents will load their tools on initialize()")
+        self.tools = dict(tool_map or {})
+        self.startup_ms = {
+            "session": round((session_done - started) * 1000, 1),
+            "tools": round((time.monotonic() - session_done) * 1000, 1),
+            "tool_count": len(adapter.tools),
+        }
+
+    def prime(self, agent) -> bool:
+        """
+        Give a new agent the worker's converted tools, so its initialize() skips tools/list and the
+        schema conversion. Returns False (initialize() does the full load) if that isn't possible.
+        """
+        tool_map = getattr(getattr(agent, "adapter", None), TOOL_CACHE_ATTR, None)
+        if not self.tools or not isinstance(tool_map, dict):
+            return False
+        tool_map.update({c: list(tools) for c, tools in self.tools.items()})
+        return True
+
+    @property
+    def started(self) -> bool:
+        return bool(self.client.get_all_active_sessions())
+
+    async def check(self) -> bool:
+        """
+        Idle workers get an MCP ping. Busy ones are only checked for a live connection:
+        a long blocking tool can delay the ping, and must not get a healthy worker killed.
+        """
+        sessions = self.client.get_all_active_sessions()
+        if not sessions:
+            return True  # not started yet
+        for session in sessions.values():
+            connector = session.connector
+            if not connector.is_connected:
+                self.last_error = "connection lost"
+                return False
+            if self.in_flight == 0:
+                try:
+                    await asyncio.wait_for(connector.client_session.send_ping(), timeout=MCP_HEALTH_TIMEOUT_SECONDS)
+                except Exception as e:
+                    self.last_error = f"ping failed: {e!r}"
+                    return False
+        return True
+
+    async def restart(self, spare: "MCPWorker" = None):
+        """Replace the client with a fresh one, or with an already warmed-up `spare`'s."""
+        async with self._restart_lock:
+            logger.warning(f"🔁 Restarting MCP worker {self.id} ({self.last_error})")
+            try:
+                await asyncio.wait_for(self.client.close_all_sessions(), timeout=MCP_HEALTH_TIMEOUT_SECONDS)
+            except Exception as e:
+                logger.error(f"Error closing MCP worker {self.id}: {e}")
+            # A fresh client, so nothing can keep using the dead subprocess' connectors
+            if spare is not None:
+                self.client, self.tools, self.startup_ms = spare.client, spare.tools, spare.startup_ms
+            else:
+                self.client = self._new_client()
+                await self.start()
+            self.restarts += 1
+            self.healthy = True
+            logger.info(f"✅ MCP worker {self.id} restarted.")
+
+    async def close(self):
+        await self.client.close_all_sessions()
+
+
+class MCPWorkerPool:
+    """
+    N tool-server subprocesses instead of one shared by every user, so blocking work inside
+    tools (sync Tavily calls, embedding/model loads) in one session doesn't stall the others.
+
+    Agents are bound to a worker when they are created (an MCPAgent's tools belong to one
+    MCPClient) and new agents go to the least busy healthy worker. A background health check
+    restarts crashed workers; `on_restart(worker)` lets the caller drop agents bound to them.
+
+    With AGENT_TOOL_TRANSPORT=inprocess there is a single worker: every "worker" would call
+    the same functions on the same event loop, so more of them would not add any isolation.
+    """
+
+    def __init__(self, config: dict, size: int = MCP_WORKERS, on_restart=None, transport: str = AGENT_TOOL_TRANSPORT,
+                 middleware=None):
+        self.config = config
+        self.transport = transport
+        self.middleware = middleware
+        self.size = 1 if transport == "inprocess" else max(1, size)
+        self.on_restart = on_restart
+        self.workers = []
+        self.hot_spare = MCP_HOT_SPARE > 0 and transport != "inprocess"
+        self.spare = None  # started worker waiting to replace a failed one
+        self.spares_used = 0
+        self.startup_ms = None
+        self._spare_task = None
+        self._health_task = None
+
+    async def start(self):
+        started = time.monotonic()
+        self.workers = [MCPWorker(i, self.config, self.transport, self.middleware) for i in range(self.size)]
+        # The subprocesses start (and import their dependencies) in parallel
+        await asyncio.gather(*(worker.start() for worker in self.workers))
+        self.startup_ms = round((time.monotonic() - started) * 1000, 1)
+        self._health_task = asyncio.create_task(self._health_loop())
+        if self.hot_spare:
+            self._spare_task = asyncio.create_task(self._prepare_spare())
+        slowest = max(self.workers, key=lambda w: w.startup_ms["session"])
+        logger.info(f"✅ MCP worker pool ready in {self.startup_ms / 1000:.1f}s ({self.size} workers, "
+                    f"{self.transport} transport, {slowest.startup_ms['tool_count']} tools; slowest worker: "
+                    f"session {slowest.startup_ms['session']:.0f}ms, tools {slowest.startup_ms['tools']:.0f}ms).")
+
+    async def _prepare_spare(self):
+        spare = MCPWorker("spare", self.config, self.transport, self.middleware)
+        try:
+            await spare.start()
+        except asyncio.CancelledError:
+            await spare.close()
+            raise
+        except Exception as e:
+            logger.error(f"Could not start a hot spare MCP worker: {e}")
+            return
+        self.spare = spare
+        logger.info(f"🔥 Hot spare MCP worker ready (session {spare.startup_ms['session']:.0f}ms).")
+
+    async def stop(self):
+        if self._health_task:
+            self._health_task.cancel()
+        if self._spare_task:
+            self._spare_task.cancel()
+            await asyncio.gather(self._spare_task, return_exceptions=True)
+        spare, self.spare = self.spare, None
+        for worker in self.workers + ([spare] if spare else []):
+            try:
+                await worker.close()
+            except Exception as e:
+                logger.error(f"Error stopping MCP worker {worker.id}: {e}")
+
+    def pick(self) -> MCPWorker:
+        """Least busy healthy worker (ties go to the lowest id)."""
+        candidates = [w for w in self.workers if w.healthy] or self.workers
+        return min(candidates, key=lambda w: (w.in_flight, w.id))
+
+    @asynccontextmanager
+    async def lease(self, worker: MCPWorker):
+        """Count a run against the worker for least-busy routing."""
+        worker.in_flight += 1
+        try:
+            yield worker
+        finally:
+            worker.in_flight -= 1
+
+    async def _health_loop(self):
+        while True:
+            await asyncio.sleep(MCP_HEALTH_INTERVAL_SECONDS)
+            for worker in self.workers:
+                try:
+                    if await worker.check():
+                        continue
+                    worker.healthy = False
+                    if self.on_restart:
+                        self.on_restart(worker)
+                    spare, self.spare = self.spare, None
+                    await worker.restart(spare)
+                    if spare is not None:
+                        self.spares_used += 1
+                        self._spare_task = asyncio.create_task(self._prepare_spare())
+                except asyncio.CancelledError:
+                    raise
+                except Exception as e:
+                    worker.last_error = f"restart failed: {e!r}"
+                    logger.error(f"MCP worker {worker.id} health check failed: {e}")
+
+    def metrics(self) -> dict:
+        return {
+            "size": self.size,
+            "transport": self.transport,
+            "startup_ms": self.startup_ms,
+            "hot_spare": {"enabled": self.hot_spare, "ready": self.spare is not None, "used": self.spares_used},
+            "workers": [
+                {
+                    "id": w.id,
+                    "started": w.started,
+                    "startup_ms": w.startup_ms,
+                    "healthy": w.healthy,
+                    "in_flight": w.in_flight,
+                    "restarts": w.restarts,
+                    "last_error": w.last_error,
+                }
+                for w in self.workers
+            ],
+        }
@@ -0,0 +1,121 @@
+import json
+import os
+from typing import List, Tuple
+from langchain_core.messages import BaseMessage, HumanMessage
+
+try:
+    import tiktoken
+except ImportError:
+    tiktoken = None
+
+# Defaults, overridable from .env
+# Conversation memory replayed to the model each turn (older turns fall back to the rolling summary)
+AGENT_HISTORY_TOKEN_BUDGET = int(os.getenv("AGENT_HISTORY_TOKEN_BUDGET", 6000))
+AGENT_SUMMARY_TOKEN_BUDGET = int(os.getenv("AGENT_SUMMARY_TOKEN_BUDGET", 400))
+# Per-message framing the chat template adds around the content
+MESSAGE_OVERHEAD_TOKENS = 4
+
+# Exact counts with tiktoken when it is installed (o200k is the gpt-oss vocabulary); ~4 chars/token otherwise
+_encoding = tiktoken.get_encoding("o200k_base") if tiktoken else None
+
+
+def count_tokens(text: str) -> int:
+    if not text:
+        return 0
+    if _encoding is not None:
+        return len(_encoding.encode(text, disallowed_special=()))
+    return len(text) // 4 + 1
+
+
+def message_tokens(message: BaseMessage) -> int:
+    content = message.content if isinstance(message.content, str) else json.dumps(message.content, default=str)
+    tokens = count_tokens(content) + MESSAGE_OVERHEAD_TOKENS
+    for call in getattr(message, "tool_calls", None) or []:
+        tokens += count_tokens(call.get("name", "")) + count_tokens(json.dumps(call.get("args", {}), default=str))
+    return tokens
+
+
+def _truncate(text: str, budget: int) -> str:
+    if count_tokens(text) <= budget:
+        return text
+    # Keep the end: the rolling summary puts the most recent topics last
+    return "..." + text[-budget * 4:]
+
+
+def build_system_prompt(context: dict, history_summary: str = "") -> str:
+    """
+    Static instructions for one session's agent. Set once as the agent's system message
+    (and again only when the context changes or memory is trimmed), instead of being
+    prepended to every user message.
+    """
+    summary_block = ""
+    if history_summary:
+        summary_block = f"""
+
+[PREVIOUS CHAT HISTORY SUMMARY]
+{_truncate(history_summary, AGENT_SUMMARY_TOKEN_BUDGET)}"""
+
+    return f"""You are a helpful social media marketing assistant. Use the available tools to complete the user's tasks.
+
+[SYSTEM CONTEXT]
+You are acting on behalf of a specific user/business.
+- Business ID (bid): {context.get('bid')}
+- User Email: {context.get('email')}
+- Facebook Page ID: {os.getenv('FB_PAGE_ID')}
+- Instagram ID: {os.getenv('INSTA_PAGE_ID')}
+- Facebook Access Token: {os.getenv('FB_SYSTEM_TOKEN')}
+- Instagram Access Token: {os.getenv('FB_SYSTEM_TOKEN')}
+
+IMPORTANT:
+1. For 'search_social_sphere_context', YOU MUST USE the 'bid' provided above. IF BID IS 'None', YOU MUST NOT CALL THIS TOOL.
+2. For **IMAGE GENERATION** (posters, ads, etc.):
+   - FIRST, call `write_image_prompt` with the user's idea to get a detailed prompt.
+   - SECOND, call `generate_marketing_poster` with that detailed prompt AND the `bid`.
+   - **CRITICAL**: Once `generate_marketing_poster` returns the URL, YOUR TASK IS COMPLETE. Return the URL to the user and STOP. DO NOT loop.
+3. For Facebook and Instagram tools, do NOT ask for or pass 'page_id', 'ig_id', or tokens. The system handles authentication automatically.
+4. Do NOT ask the user for these IDs.
+5. IF 'retrieve_business_context' fails or returns no info, DO NOT RETRY it. Proceed with your best general knowledge.{summary_block}"""
+
+
+def context_key(context: dict) -> tuple:
+    """The parts of the context the system prompt depends on (a change means it must be rebuilt)."""
+    return context.get('bid'), context.get('email')
+
+
+def trim_history(messages: List[BaseMessage], budget: int = AGENT_HISTORY_TOKEN_BUDGET) -> Tuple[List[BaseMessage], int]:
+    """
+    Newest messages that fit in `budget` tokens. The window always starts at a user message,
+    so a tool result is never kept without the assistant call that requested it.
+    The newest turn is always kept: if it alone is over budget, its longest texts are shortened.
+    Returns (kept messages, number dropped).
+    """
+    used = 0
+    start = len(messages)
+    for i in range(len(messages) - 1, -1, -1):
+        used += message_tokens(messages[i])
+        if used > budget:
+            break
+        if isinstance(messages[i], HumanMessage):
+            start = i
+    if start == len(messages) and messages:
+        start = max((i for i, m in enumerate(messages) if isinstance(m, HumanMessage)), default=0)
+        return _fit_turn(messages[start:], budget), start
+    return messages[start:], start
+
+
+def _fit_turn(turn: List[BaseMessage], budget: int) -> List[BaseMessage]:
+    """Copy of one turn with text contents cut down to fit `budget`, smallest messages kept whole first."""
+    sizes = [message_tokens(m) for m in turn]
+    allowed = [0] * len(turn)
+    left = budget
+    order = sorted(range(len(turn)), key=lambda i: sizes[i])
+    for n, i in enumerate(order):
+        allowed[i] = min(sizes[i], max(0, left // (len(turn) - n)))
+        left -= allowed[i]
+    fitted = []
+    for message, size, share in zip(turn, sizes, allowed):
+        if size > share and isinstance(message.content, str):
+            keep_chars = max(0, share - MESSAGE_OVERHEAD_TOKENS - 1) * 4  # 1 for the "..."
+            message = message.model_copy(update={"content": message.content[:keep_chars] + "..."})
+        fitted.append(message)
+    return fitted
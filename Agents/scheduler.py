@@ -0,0 +1,125 @@
+import asyncio
+import os
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from loguru import logger
+
+# Defaults, overridable from .env
+AGENT_MAX_CONCURRENT_RUNS = int(os.getenv("AGENT_MAX_CONCURRENT_RUNS", 8))
+AGENT_MAX_QUEUED_RUNS = int(os.getenv("AGENT_MAX_QUEUED_RUNS", 100))
+AGENT_MAX_SESSION_QUEUE = int(os.getenv("AGENT_MAX_SESSION_QUEUE", 5))
+AGENT_QUEUE_TIMEOUT_SECONDS = float(os.getenv("AGENT_QUEUE_TIMEOUT_SECONDS", 120))
+# Recent queue waits kept for the p50/p95 in metrics
+WAIT_SAMPLES = 500
+
+
+class AgentBusy(RuntimeError):
+    """A run was refused (queue full) or waited too long for its turn."""
+
+
+class _SessionQueue:
+    __slots__ = ("lock", "pending")
+
+    def __init__(self):
+        self.lock = asyncio.Lock()  # FIFO: a session's messages run in the order they arrived
+        self.pending = 0  # runs of this session waiting or running
+
+
+class RunScheduler:
+    """
+    Admission control for agent runs.
+
+    Each session runs one message at a time (its MCPAgent keeps conversation memory, so two
+    concurrent runs would interleave it), and at most `max_concurrent` runs execute overall.
+    A run takes its session lock before queueing for a global slot, so every session has at most
+    one run waiting for a slot: slots are handed out first-come-first-served across sessions,
+    and a user sending a burst of messages can't crowd out everyone else.
+
+    When the queue is full, or a run has waited `queue_timeout` seconds, AgentBusy is raised
+    instead of piling up more work.
+    """
+
+    def __init__(self, max_concurrent: int = AGENT_MAX_CONCURRENT_RUNS, max_queued: int = AGENT_MAX_QUEUED_RUNS,
+                 max_per_session: int = AGENT_MAX_SESSION_QUEUE, queue_timeout: float = AGENT_QUEUE_TIMEOUT_SECONDS):
+        self.max_concurrent = max(1, max_concurrent)
+        self.max_queued = max_queued
+        self.max_per_session = max(1, max_per_session)
+        self.queue_timeout = queue_timeout
+        self._slots = asyncio.Semaphore(self.max_concurrent)
+        self._sessions = {}  # session_id -> _SessionQueue, only while it has pending runs
+        self.running = 0
+        self.queued = 0
+        self.admitted = 0
+        self.rejected = 0
+        self.timed_out = 0
+        self._waits_ms = deque(maxlen=WAIT_SAMPLES)
+
+    @asynccontextmanager
+    async def slot(self, session_id: str):
+        """Wait for the session's turn and a free run slot, then hold both for the body of the block."""
+        if self.queued >= self.max_queued:
+            self.rejected += 1
+            raise AgentBusy("The agent is at capacity, please retry shortly.")
+        session = self._sessions.setdefault(session_id, _SessionQueue())
+        if session.pending >= self.max_per_session:
+            self.rejected += 1
+            raise AgentBusy("Too many messages are still being processed for this session.")
+
+        session.pending += 1
+        self.queued += 1
+        start = time.monotonic()
+        has_lock = has_slot = False
+        try:
+            try:
+                # Not wait_for(): on Python 3.11 it can acquire and still raise TimeoutError,
+                # leaking the lock. Each flag is set right after its acquire, with no await between.
+                async with asyncio.timeout(self.queue_timeout):
+                    await session.lock.acquire()
+                    has_lock = True
+                    await self._slots.acquire()
+                    has_slot = True
+            except TimeoutError:
+                self.timed_out += 1
+                raise AgentBusy("Timed out waiting for the agent, please retry shortly.")
+            finally:
+                self.queued -= 1
+
+            waited_ms = (time.monotonic() - start) * 1000
+            self._waits_ms.append(waited_ms)
+            self.admitted += 1
+            if waited_ms > 1000:
+                logger.info(f"⏳ Session {session_id} waited {waited_ms / 1000:.1f}s for an agent slot")
+            self.running += 1
+            try:
+                yield
+            finally:
+                self.running -= 1
+        finally:
+            if has_slot:
+                self._slots.release()
+            if has_lock:
+                session.lock.release()
+            session.pending -= 1
+            if session.pending == 0:
+                self._sessions.pop(session_id, None)
+
+    def metrics(self) -> dict:
+        waits = sorted(self._waits_ms)
+
+        def pct(p):
+            return round(waits[min(len(waits) - 1, int(len(waits) * p / 100))], 1) if waits else None
+
+        return {
+            "running": self.running,
+            "queued": self.queued,
+            "max_concurrent": self.max_concurrent,
+            "max_queued": self.max_queued,
+            "sessions_active": len(self._sessions),
+            "deepest_session_queue": max((s.pending for s in self._sessions.values()), default=0),
+            "admitted": self.admitted,
+            "rejected": self.rejected,
+            "timed_out": self.timed_out,
+            "wait_ms_p50": pct(50),
+            "wait_ms_p95": pct(95),
+        }
@@ -4,9 +4,10 @@ import hashlib
 import urllib.parse
 from loguru import logger
 import aiohttp
-from groq import Groq
 from mcp.server.fastmcp import FastMCP
+from mcp.types import ToolAnnotations
 import asyncio
+from contextlib import asynccontextmanager
 from tavily import TavilyClient
 import requests
 import time
@@ -20,18 +21,25 @@ from pathlib import Path
 # Ensure RAG/tools.py is accessible. RAG is a sibling package.
 try:
     from RAG.tools import search_social_sphere_context as rag_search_tool
+    from RAG.tools import lookup_business_digest as rag_digest_lookup
+    from RAG.embedding import get_embedding_model
     import gmail_sender
+    from llm_client import get_async_groq
 except ImportError:
     # Fallback or specific handling if running from inside Agents/
     import sys
     sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
     sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
     from RAG.tools import search_social_sphere_context as rag_search_tool
+    from RAG.tools import lookup_business_digest as rag_digest_lookup
+    from RAG.embedding import get_embedding_model
     import gmail_sender
+    from llm_client import get_async_groq
 
 from database import SessionLocal
 from database import SessionLocal
 from models import PostHistory, UserCredentials, ChatHistory
+from history_writer import history_writer
 from datetime import datetime
 
 # Load .env explicitly from the project root
@@ -39,8 +47,35 @@ from datetime import datetime
 #root_env_path = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), ".env")
 load_dotenv()
 
+# Embedding model the RAG tools load on first use; loaded at server start instead ("" to skip)
+MCP_WARM_UP_EMBEDDING_MODEL = os.getenv("MCP_WARM_UP_EMBEDDING_MODEL", "all-MiniLM-L6-v2")
+
+async def warm_up():
+    """Load what the first tool call would otherwise wait for, before the server takes requests."""
+    if not MCP_WARM_UP_EMBEDDING_MODEL:
+        return
+    started = time.monotonic()
+    try:
+        await asyncio.to_thread(get_embedding_model, MCP_WARM_UP_EMBEDDING_MODEL)
+        logger.info(f"🔥 Embedding model warmed up in {time.monotonic() - started:.1f}s")
+    except Exception as e:
+        logger.warning(f"Embedding model warm-up failed (it will load on first use): {e}")
+
+@asynccontextmanager
+async def server_lifespan(server: FastMCP):
+    await warm_up()
+    history_writer.start()
+    try:
+        yield
+    finally:
+        # Write out PostHistory/ChatHistory rows still queued before the server process exits
+        await history_writer.stop()
+
 # Initialize FastMCP server
-mcp = FastMCP("social-sphere-agent")
+mcp = FastMCP("social-sphere-agent", lifespan=server_lifespan)
+
+# Read-only tools: same arguments, same answer within one request. The agent memoizes these per run.
+IDEMPOTENT = ToolAnnotations(readOnlyHint=True, idempotentHint=True)
 
 # Load Keys from Env
 TAVILY_API_KEY = os.getenv("TAVILY_API_KEY")
@@ -158,22 +193,16 @@ async def post_to_x(bid: int, text: str | None = None, image_path: str | None =
         success_msg = f"🚀 Successfully posted to X! Tweet ID: {result['id']} ({result['url']})"
         logger.info(success_msg)
 
-        # 3. Log to PostHistory
+        # 3. Log to PostHistory (written in the background; username resolved from bid)
         try:
-            db = SessionLocal()
-            user = db.query(UserCredentials).filter(UserCredentials.bid == bid).first()
-            email = user.email if user else f"Unknown_bid_{bid}"
-            
-            new_post = PostHistory(
-                username=email,
+            history_writer.log(
+                PostHistory,
+                bid=bid,
                 text=text or "[Image Only]",
                 image_url=image_path, # using path as url for now since it's local upload
                 timestamp=datetime.now().isoformat(),
                 media_used="Twitter/X"
             )
-            db.add(new_post)
-            db.commit()
-            db.close()
         except Exception as db_e:
             logger.error(f"Failed to log post to database: {db_e}")
 
@@ -183,7 +212,7 @@ async def post_to_x(bid: int, text: str | None = None, image_path: str | None =
         return f"❌ Error posting to X: {e}"
 
 
-@mcp.tool()
+@mcp.tool(annotations=IDEMPOTENT)
 async def write_image_prompt(query: str, business_name: str | None = None) -> str:
     """
     Generates a high-quality image generation prompt for Flux.1 using Groq.
@@ -304,30 +333,17 @@ async def generate_marketing_poster(prompt: str, bid: int) -> str:
         # 5. Log to ChatHistory (User Request: "end logic where and how to stop... add in chat_history")
         # This mimics the "final action" behavior of posting tools.
         try:
-            from models import ChatHistory, UserCredentials
-            db = SessionLocal()
-            
-            # Resolve email from BID
-            user = db.query(UserCredentials).filter(UserCredentials.bid == bid).first()
-            email = user.email if user else f"Unknown_bid_{bid}"
-            
-            # Log the successful generation as a completed interaction
-            # Note: valid ChatHistory usually needs input_message. We'll use the prompt.
-            new_chat_log = ChatHistory(
-                username=email,
+            # Log the successful generation as a completed interaction (written in the background;
+            # the username is resolved from the BID). We use the prompt as the input_message.
+            history_writer.log(
+                ChatHistory,
+                bid=bid,
                 input_message=f"Generate poster: {prompt[:50]}...",
                 agent_response=f"Poster generated successfully. Local: {db_image_path}",
+                image_url=db_image_path, # Storing local path as requested
                 timestamp=datetime.now().isoformat(),
-                chat_id=f"gen_{int(time.time())}", 
             )
-            
-            if hasattr(new_chat_log, 'image_url'):
-                new_chat_log.image_url = db_image_path # Storing local path as requested
-            
-            db.add(new_chat_log)
-            db.commit()
-            db.close()
-            logger.info(f"✅ Logged generated poster to ChatHistory for {email}")
+            logger.info(f"✅ Queued generated poster for ChatHistory (bid {bid})")
             
         except Exception as db_e:
             logger.error(f"Failed to log to ChatHistory: {db_e}")
@@ -404,20 +420,14 @@ async def post_to_facebook(message: str, bid: int) -> str:
                     
                     # Log to PostHistory
                     try:
-                        db = SessionLocal()
-                        user = db.query(UserCredentials).filter(UserCredentials.bid == bid).first()
-                        email = user.email if user else f"Unknown_bid_{bid}"
-                        
-                        new_post = PostHistory(
-                            username=email,
+                        history_writer.log(
+                            PostHistory,
+                            bid=bid,
                             text=message,
                             image_url=None,
                             timestamp=datetime.now().isoformat(),
                             media_used="Facebook"
                         )
-                        db.add(new_post)
-                        db.commit()
-                        db.close()
                     except Exception as db_e:
                         logger.error(f"Failed to log post to database: {db_e}")
 
@@ -501,20 +511,14 @@ async def post_to_instagram(image_url: str, caption: str, bid: int) -> str:
 
                     # Log to PostHistory
                     try:
-                        db = SessionLocal()
-                        user = db.query(UserCredentials).filter(UserCredentials.bid == bid).first()
-                        email = user.email if user else f"Unknown_bid_{bid}"
-                        
-                        new_post = PostHistory(
-                            username=email,
+                        history_writer.log(
+                            PostHistory,
+                            bid=bid,
                             text=caption,
                             image_url=image_url,
                             timestamp=datetime.now().isoformat(),
                             media_used="Instagram"
                         )
-                        db.add(new_post)
-                        db.commit()
-                        db.close()
                     except Exception as db_e:
                         logger.error(f"Failed to log post to database: {db_e}")
 
@@ -531,8 +535,14 @@ async def post_to_instagram(image_url: str, caption: str, bid: int) -> str:
         logger.error(f"❌ Error in post_to_instagram: {e}")
         return f"❌ Error: {e}"
 
-@mcp.tool()
-async def retrieve_business_context(query: str, bid: int = None) -> str:
+@mcp.tool(annotations=IDEMPOTENT)
+async def retrieve_business_context(
+    query: str,
+    bid: int = None,
+    source: str | None = None,
+    file_type: str | None = None,
+    uploaded_after: str | None = None
+) -> str:
     """
     Use this tool to retrieve BUSINESS-SPECIFIC CONTEXT from the knowledge base
     using Retrieval-Augmented Generation (RAG).
@@ -546,7 +556,10 @@ async def retrieve_business_context(query: str, bid: int = None) -> str:
       for a business.
 
     WHAT THIS TOOL DOES:
-    - Searches the vector database using the user's query.
+    - Direct questions about the business profile ("what is our brand voice?")
+      are answered from a precomputed business profile.
+    - Otherwise searches the vector database using the user's query, with the
+      business profile included ahead of the retrieved context.
     - Retrieves the most relevant document chunks related to the given business_id.
     - Returns clean, text-based context for the LLM to use in generation.
 
@@ -554,6 +567,12 @@ async def retrieve_business_context(query: str, bid: int = None) -> str:
     - query (str): The user request or content generation instruction.
     - business_id (str): Unique identifier of the business whose data
       should be retrieved.
+    - source (str, optional): Only use this uploaded document, e.g. "menu.pdf"
+      (a partial name like "menu" also works).
+    - file_type (str, optional): Only use documents of this type, e.g. "pdf", "csv".
+    - uploaded_after (str, optional): Only use documents uploaded on/after this
+      ISO date, e.g. "2025-01-31".
+    When any of these is set, only the business's own documents are searched.
 
     OUTPUT:
     - A plain text string containing relevant business-specific context.
@@ -567,8 +586,20 @@ async def retrieve_business_context(query: str, bid: int = None) -> str:
     if bid is None:
         return "❌ Error: 'bid' (Business ID) is missing. The Agent MUST provide it from the session context."
     
+    filters = {
+        key: value
+        for key, value in {"source": source, "file_type": file_type, "uploaded_after": uploaded_after}.items()
+        if value
+    }
+
+    # 0. Explicit profile questions are answered from the digest built at upload time
+    if not filters:
+        digest_answer = await asyncio.to_thread(rag_digest_lookup, bid=bid, query=query)
+        if digest_answer:
+            return digest_answer
+
     # 1. Retrieve Context (Run sync RAG tool in thread)
-    context = await asyncio.to_thread(rag_search_tool, bid=bid, query=query)
+    context = await asyncio.to_thread(rag_search_tool, bid=bid, query=query, filters=filters or None)
     #context = rag_search_tool(bid=bid, query=query)
     
     # 2. Use LLM to Summarize/Answer based on Context 
@@ -671,20 +702,14 @@ async def send_gmail(bid: int, recipient: str, query: str) -> str:
         if "successfully" in msg.lower():
              # Log to PostHistory
             try:
-                db = SessionLocal()
-                user = db.query(UserCredentials).filter(UserCredentials.bid == bid).first()
-                email = user.email if user else f"Unknown_bid_{bid}"
-                
-                new_post = PostHistory(
-                    username=email,
+                history_writer.log(
+                    PostHistory,
+                    bid=bid,
                     text=f"Query: {query}\nTo: {to_header}\nSubject: {subject}\nBody: {body[:200]}...",
                     image_url=None,
                     timestamp=datetime.now().isoformat(),
                     media_used="Gmail"
                 )
-                db.add(new_post)
-                db.commit()
-                db.close()
             except Exception as db_e:
                 logger.error(f"Failed to log email to database: {db_e}")
         
@@ -704,7 +729,7 @@ async def resolve_content(content: str | None, url: str | None) -> str:
     URL takes priority.
     """
     if url:
-        search_data = tavily.search(url)
+        search_data = await asyncio.to_thread(tavily.search, url)
         return f"Content fetched from URL:\n{search_data}"
 
     if content:
@@ -714,18 +739,14 @@ async def resolve_content(content: str | None, url: str | None) -> str:
 
 
 async def call_groq_async(prompt):
-    """Run Groq sync client in a non-blocking thread."""
-    def _call():
-        client = Groq(api_key=GROQ_API_KEY)
-        return client.chat.completions.create(
-            model="openai/gpt-oss-120b",
-            messages=[{"role": "user", "content": prompt}],
-            temperature=0.3
-        )
-
-    return await asyncio.to_thread(_call)
-
-@mcp.tool()
+    """Call Groq through the shared async client (pooled keep-alive connection, no worker thread)."""
+    return await get_async_groq().chat.completions.create(
+        model="openai/gpt-oss-120b",
+        messages=[{"role": "user", "content": prompt}],
+        temperature=0.3
+    )
+
+@mcp.tool(annotations=IDEMPOTENT)
 async def content_summarizer(
     content: str | None = None,
     url: str | None = None,
@@ -772,7 +793,7 @@ Return JSON only.
     return res.choices[0].message.content
 
 
-@mcp.tool()
+@mcp.tool(annotations=IDEMPOTENT)
 async def seo_keyword_finder(
     topic: str | None = None,
     content: str | None = None,
@@ -897,12 +918,12 @@ Return JSON only.
     return res.choices[0].message.content
 
 
-@mcp.tool()
+@mcp.tool(annotations=IDEMPOTENT)
 async def topic_researcher(topic: str, use_web_search: bool = True) -> dict:
 
     search_data = ""
     if use_web_search:
-        search_data = tavily.search(topic)
+        search_data = await asyncio.to_thread(tavily.search, topic)
 
     prompt = f"""
 Using the research data below, summarize the topic:
@@ -924,7 +945,7 @@ Return JSON:
     return res.choices[0].message.content
 
 
-@mcp.tool()
+@mcp.tool(annotations=IDEMPOTENT)
 async def hashtag_optimizer(
     topic: str,
     platform: str = "instagram",
@@ -936,7 +957,7 @@ async def hashtag_optimizer(
 
     search_data = ""
     if use_web_search:
-        search_data = tavily.search(f"Trending hashtags for {topic} on {platform}")
+        search_data = await asyncio.to_thread(tavily.search, f"Trending hashtags for {topic} on {platform}")
 
     prompt = f"""
 Generate 40–50 viral hashtags for the following:
@@ -959,7 +980,7 @@ Return JSON:
     response = await call_groq_async(prompt)
     return response.choices[0].message.content
 
-@mcp.tool()
+@mcp.tool(annotations=IDEMPOTENT)
 async def caption_analyzer(caption: str) -> dict:
     """
     Analyze the quality of a social media caption.
@@ -990,7 +1011,7 @@ Return JSON with:
     return resp.choices[0].message.content
 
 
-@mcp.tool()
+@mcp.tool(annotations=IDEMPOTENT)
 async def tone_converter(content: str, tone: str) -> dict:
 
     prompt = f"""
@@ -1033,7 +1054,8 @@ async def refine_content(
     web_context = ""
     if use_web_search:
         try:
-            result = tavily.search(
+            result = await asyncio.to_thread(
+                tavily.search,
                 query=f"latest info, trends, or insights related to: {content}",
                 search_depth="basic",
                 include_answer=True,
@@ -1077,7 +1099,7 @@ Return only the refined content as text.
     }
 
 
-@mcp.tool()
+@mcp.tool(annotations=IDEMPOTENT)
 async def get_trending_headlines(
     niche: str | None = None,
     use_web_search: bool = True
@@ -1102,7 +1124,8 @@ async def get_trending_headlines(
     web_context = ""
     try:
         # Perform Tavily search
-        result = tavily.search(
+        result = await asyncio.to_thread(
+            tavily.search,
             query=search_query,
             search_depth="basic",
             include_answer=True,
@@ -1168,7 +1191,8 @@ async def generate_social_content(
 
     if use_web_search:
         try:
-            result = tavily.search(
+            result = await asyncio.to_thread(
+                tavily.search,
                 query=f"{topic} latest news trends facts insights social media buzz",
                 search_depth="basic",
                 include_answer=True,
@@ -1264,7 +1288,7 @@ Don't include emojis unless they elevate the content naturally.
         "generated": llm_output
     }
 
-@mcp.tool()
+@mcp.tool(annotations=IDEMPOTENT)
 def normalizeemails(emails: Union[str, List[str]]) -> List[str]:
     """Robust email normalization for to/cc/bcc fields"""
     if not emails:
@@ -1323,7 +1347,8 @@ async def generate_email_with_llm(
 
     if use_web_search:
         try:
-            result = tavily.search(
+            result = await asyncio.to_thread(
+                tavily.search,
                 query=f"{company} latest news hiring funding products",
                 search_depth="basic",
                 include_answer=True,
@@ -1368,7 +1393,7 @@ DO NOT use trending headlines or other tools first.
     }
 
 
-@mcp.tool()
+@mcp.tool(annotations=IDEMPOTENT)
 def normalizeemails(emails: Union[str, List[str]]) -> List[str]:
     """Robust email normalization for to/cc/bcc fields"""
     if not emails:
@@ -1392,7 +1417,7 @@ def normalizeemails(emails: Union[str, List[str]]) -> List[str]:
     
     return list(set(email_list))
  
-@mcp.tool()
+@mcp.tool(annotations=IDEMPOTENT)
 async def get_latest_headlines_today(topic: str | None = None,
                                use_web_search: bool = True,
                                max_headlines: int | None = None) -> dict:
@@ -1411,7 +1436,8 @@ async def get_latest_headlines_today(topic: str | None = None,
     web_context = ""
     try:
         # Perform Tavily search
-        result = tavily.search(
+        result = await asyncio.to_thread(
+            tavily.search,
             query=search_query,
             search_depth="basic",
             include_answer=True,
@@ -0,0 +1,234 @@
+import asyncio
+import json
+import math
+import os
+import re
+import time
+from collections import Counter, deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Optional
+from mcp.types import CallToolResult, TextContent
+from mcp_use.client.middleware import Middleware
+from loguru import logger
+
+# Defaults, overridable from .env
+AGENT_RUN_TIMEOUT_SECONDS = float(os.getenv("AGENT_RUN_TIMEOUT_SECONDS", 180))
+# Past this share of the timeout, tool calls are refused so the model wraps up with what it has
+AGENT_SOFT_DEADLINE_RATIO = float(os.getenv("AGENT_SOFT_DEADLINE_RATIO", 0.75))
+AGENT_MAX_TOOL_CALLS = int(os.getenv("AGENT_MAX_TOOL_CALLS", 20))
+AGENT_MIN_TOOL_CALLS = int(os.getenv("AGENT_MIN_TOOL_CALLS", 3))
+AGENT_MAX_IDENTICAL_CALLS = int(os.getenv("AGENT_MAX_IDENTICAL_CALLS", 1))
+# Identical calls that returned an error may be retried this many times (transient API failures)
+AGENT_MAX_RETRIES_AFTER_ERROR = int(os.getenv("AGENT_MAX_RETRIES_AFTER_ERROR", 1))
+# Independent tool calls requested in one model step run concurrently, at most this many at a time
+AGENT_MAX_PARALLEL_TOOL_CALLS = int(os.getenv("AGENT_MAX_PARALLEL_TOOL_CALLS", 4))
+# Runs of a query type needed before its step budget follows the observed p95
+ADAPT_MIN_SAMPLES = 20
+STEP_SAMPLES = 200
+
+# Tools whose success finishes the user's task: a repeat with the same arguments returns the first result
+TERMINAL_TOOLS = {"generate_marketing_poster", "post_to_facebook", "post_to_instagram", "post_to_x", "send_gmail"}
+TERMINAL_MAX_CALLS = 3  # distinct calls of one terminal tool per query (e.g. a few poster variants)
+
+# Query types (first match wins) and their starting tool-call budgets
+QUERY_TYPES = {
+    "publish": [r"\bpublish", r"\bpost (it|this|that|to|on)\b", r"\bshare (it|this|on|to)\b", r"\btweet", r"\bupload"],
+    "poster": [r"\bposter", r"\bimage", r"\bbanner", r"\bflyer", r"\bvisual", r"\bpicture", r"\bgraphic"],
+    "email": [r"\be-?mail", r"\bgmail", r"\bnewsletter"],
+    "research": [r"\btrend", r"\bresearch", r"\bheadline", r"\bnews\b", r"\bkeyword", r"\bseo\b", r"\bcompetitor"],
+    "content": [r"\bwrite", r"\bcaption", r"\bhashtag", r"\bcontent", r"\bthread", r"\bcarousel", r"\bsummar", r"\brewrite", r"\btone"],
+}
+DEFAULT_STEP_BUDGETS = {"publish": 8, "poster": 6, "email": 5, "research": 8, "content": 6, "chat": 4}
+
+
+def classify_query(query: str) -> str:
+    q = query.lower()
+    for query_type, patterns in QUERY_TYPES.items():
+        if any(re.search(p, q) for p in patterns):
+            return query_type
+    return "chat"
+
+
+def _tool_message(text: str, is_error: bool = True) -> CallToolResult:
+    return CallToolResult(content=[TextContent(type="text", text=text)], isError=is_error)
+
+
+class RunState:
+    """Tool calls made during one agent run (one user message)."""
+
+    def __init__(self, query_type: str, step_budget: int, timeout: float):
+        self.query_type = query_type
+        self.step_budget = step_budget
+        self.started = time.monotonic()
+        self.soft_deadline = self.started + timeout * AGENT_SOFT_DEADLINE_RATIO
+        self.deadline = self.started + timeout
+        self.steps = 0
+        self.calls = Counter()  # (tool, arguments) -> successful executions
+        self.running_calls = Counter()  # (tool, arguments) -> executions in progress
+        self.failed_calls = Counter()  # (tool, arguments) -> executions that returned an error
+        self.terminal_results = {}  # (tool, arguments) -> result of a successful terminal call
+        self.terminal_calls = Counter()  # tool -> distinct successful calls
+        self.interventions = Counter()
+        self.memo = {}  # (tool, arguments) -> future of an idempotent call's result (see ToolMemo)
+        self.memo_hits = 0  # tool calls answered from the memo
+        self.tool_slots = asyncio.Semaphore(max(1, AGENT_MAX_PARALLEL_TOOL_CALLS))
+        self.in_flight = 0
+        self.peak_parallel = 0  # most tool calls executing at once
+
+    @property
+    def remaining(self) -> float:
+        return max(0.0, self.deadline - time.monotonic())
+
+
+_current_run: ContextVar[Optional[RunState]] = ContextVar("agent_run", default=None)
+
+
+def current_run() -> Optional[RunState]:
+    return _current_run.get()
+
+
+class RunSupervisor(Middleware):
+    """
+    Guards agent runs at the tool-call layer (mcp_use client middleware, so it works for the
+    stdio and in-process transports alike). Within one run it:
+      - refuses repeats of an identical tool call once it has succeeded (a failed call may be
+        retried AGENT_MAX_RETRIES_AFTER_ERROR times),
+      - returns the earlier result when a terminal tool (poster, publish, email) is called again
+        with the same arguments, instead of generating or publishing twice,
+      - stops executing tools once the run's step budget or soft deadline is used up, telling the
+        model to answer with what it has,
+      - bounds how many of the run's tool calls execute at once (the agent dispatches the
+        independent calls of one model step concurrently).
+    Step budgets start per query type and adapt to the observed p95 once enough runs are seen.
+    """
+
+    def __init__(self):
+        self.steps = {t: deque(maxlen=STEP_SAMPLES) for t in DEFAULT_STEP_BUDGETS}
+        self.runs = Counter()
+        self.interventions = Counter()
+        self.memo_hits = 0
+        self.timeouts = 0
+        self.parallel_runs = 0  # runs that executed more than one tool call at once
+        self.peak_parallel = 0
+
+    def step_budget(self, query_type: str) -> int:
+        samples = self.steps[query_type]
+        if len(samples) < ADAPT_MIN_SAMPLES:
+            return DEFAULT_STEP_BUDGETS[query_type]
+        ordered = sorted(samples)
+        p95 = ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))]
+        return max(AGENT_MIN_TOOL_CALLS, min(AGENT_MAX_TOOL_CALLS, math.ceil(p95 * 1.5) + 1))
+
+    @contextmanager
+    def run(self, query: str, timeout: float = AGENT_RUN_TIMEOUT_SECONDS):
+        """Supervise the tool calls made inside the block (one agent run)."""
+        query_type = classify_query(query)
+        state = RunState(query_type, self.step_budget(query_type), timeout)
+        previous = _current_run.get()
+        _current_run.set(state)
+        try:
+            yield state
+        finally:
+            # set() rather than reset(): a streamed run can be closed from another task's context
+            _current_run.set(previous)
+            self.runs[query_type] += 1
+            self.steps[query_type].append(state.steps)
+            self.interventions.update(state.interventions)
+            self.memo_hits += state.memo_hits
+            if state.peak_parallel > 1:
+                self.parallel_runs += 1
+                self.peak_parallel = max(self.peak_parallel, state.peak_parallel)
+            if state.interventions:
+                logger.warning(f"🛑 Supervisor intervened in a '{query_type}' run: {dict(state.interventions)}")
+            logger.info(f"📏 '{query_type}' run used {state.steps}/{state.step_budget} tool calls "
+                        f"({state.memo_hits} avoided by memo) in {time.monotonic() - state.started:.1f}s")
+
+    def record_timeout(self):
+        self.timeouts += 1
+
+    async def on_call_tool(self, context, call_next):
+        state = _current_run.get()
+        if state is None:
+            return await call_next(context)
+
+        name = context.params.name
+        key = (name, json.dumps(context.params.arguments or {}, sort_keys=True, default=str))
+
+        if key in state.terminal_results:
+            state.interventions["terminal_repeat"] += 1
+            return _tool_message(
+                f"{name} already completed in this request with these arguments. Result: "
+                f"{state.terminal_results[key]}\nDo not call it again; give the user this result.",
+                is_error=False,
+            )
+        # Calls still running count too, so concurrent identical calls don't both execute
+        if state.calls[key] + state.running_calls[key] >= AGENT_MAX_IDENTICAL_CALLS:
+            state.interventions["repeat_call"] += 1
+            return _tool_message(f"{name} was already called with identical arguments. "
+                                 f"Use the earlier result instead of calling it again.")
+        if state.failed_calls[key] > AGENT_MAX_RETRIES_AFTER_ERROR:
+            state.interventions["failed_retry"] += 1
+            return _tool_message(f"{name} has failed {state.failed_calls[key]} times with these arguments. "
+                                 f"Do not retry it; tell the user what went wrong or try another approach.")
+        if name in TERMINAL_TOOLS and state.terminal_calls[name] >= TERMINAL_MAX_CALLS:
+            state.interventions["terminal_limit"] += 1
+            return _tool_message(f"{name} has already run {TERMINAL_MAX_CALLS} times for this request. "
+                                 f"Stop and report the results to the user.")
+        if state.steps >= state.step_budget:
+            state.interventions["step_budget"] += 1
+            return _tool_message("Tool budget for this request is used up. "
+                                 "Answer the user now with the information you already have.")
+        if time.monotonic() >= state.soft_deadline:
+            state.interventions["time_budget"] += 1
+            return _tool_message("Time budget for this request is almost used up. "
+                                 "Answer the user now with the information you already have.")
+
+        state.steps += 1
+        state.running_calls[key] += 1
+        result = None
+        try:
+            async with state.tool_slots:
+                state.in_flight += 1
+                state.peak_parallel = max(state.peak_parallel, state.in_flight)
+                try:
+                    result = await call_next(context)
+                finally:
+                    state.in_flight -= 1
+        finally:
+            state.running_calls[key] -= 1
+            # Only a usable result counts as "already called"; errors leave room for a retry
+            if result is None or getattr(result, "isError", False):
+                state.failed_calls[key] += 1
+            else:
+                state.calls[key] += 1
+        if name in TERMINAL_TOOLS and not getattr(result, "isError", False):
+            state.terminal_calls[name] += 1
+            state.terminal_results[key] = " ".join(
+                getattr(block, "text", "") for block in getattr(result, "content", None) or []
+            )
+        return result
+
+    def metrics(self) -> dict:
+        query_types = {}
+        for query_type, samples in self.steps.items():
+            if not samples:
+                continue
+            ordered = sorted(samples)
+            query_types[query_type] = {
+                "runs": self.runs[query_type],
+                "steps_p50": ordered[len(ordered) // 2],
+                "steps_p95": ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))],
+                "steps_max": ordered[-1],
+                "step_budget": self.step_budget(query_type),
+            }
+        return {
+            "timeout_seconds": AGENT_RUN_TIMEOUT_SECONDS,
+            "query_types": query_types,
+            "interventions": dict(self.interventions),
+            "memo_hits": self.memo_hits,
+            "timeouts": self.timeouts,
+            "max_parallel_tool_calls": AGENT_MAX_PARALLEL_TOOL_CALLS,
+            "parallel_runs": self.parallel_runs,
+            "peak_parallel_tool_calls": self.peak_parallel,
+        }
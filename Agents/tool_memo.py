@@ -0,0 +1,56 @@
+import asyncio
+import json
+from mcp_use.client.middleware import Middleware
+from loguru import logger
+from Agents.supervisor import current_run
+
+
+class ToolMemo(Middleware):
+    """
+    Run-scoped memo for idempotent tools: a repeat of an identical call within one agent run
+    gets the first call's result instead of another LLM/RAG/web round trip.
+
+    Tools opt in with the MCP `idempotentHint` annotation (see IDEMPOTENT in Agents/server.py);
+    the names are picked up from the tools/list response when a session starts. Concurrent
+    identical calls share one execution, and error results are never cached.
+    Install it in front of RunSupervisor, so memo hits don't count against the step budget.
+    """
+
+    def __init__(self):
+        self.idempotent = set()
+
+    async def on_list_tools(self, context, call_next):
+        result = await call_next(context)
+        for tool in getattr(result, "tools", None) or []:
+            annotations = getattr(tool, "annotations", None)
+            if annotations is not None and annotations.idempotentHint:
+                self.idempotent.add(tool.name)
+        return result
+
+    async def on_call_tool(self, context, call_next):
+        run = current_run()
+        name = context.params.name
+        if run is None or name not in self.idempotent:
+            return await call_next(context)
+
+        key = (name, json.dumps(context.params.arguments or {}, sort_keys=True, default=str))
+        pending = run.memo.get(key)
+        if pending is not None:
+            result = await asyncio.shield(pending)
+            if result is not None:
+                run.memo_hits += 1
+                logger.info(f"♻️ Reusing result of {name} (identical call earlier in this run)")
+                return result
+            return await call_next(context)  # the first call failed: run it for real
+
+        pending = asyncio.get_running_loop().create_future()
+        run.memo[key] = pending
+        result = None
+        try:
+            result = await call_next(context)
+            return result
+        finally:
+            if result is None or getattr(result, "isError", False):
+                run.memo.pop(key, None)
+                result = None
+            pending.set_result(result)  # None tells concurrent waiters to make the call themselves
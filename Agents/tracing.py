@@ -0,0 +1,255 @@
+import asyncio
+import json
+import os
+import time
+import uuid
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import datetime
+from typing import Optional
+from langchain_core.callbacks import AsyncCallbackHandler
+from mcp_use.client.middleware import Middleware
+from loguru import logger
+from Agents.scheduler import AgentBusy
+
+# Defaults, overridable from .env
+AGENT_TRACE_BUFFER = int(os.getenv("AGENT_TRACE_BUFFER", 200))  # most recent runs kept for /agent/traces
+AGENT_TRACE_MAX_SPANS = int(os.getenv("AGENT_TRACE_MAX_SPANS", 100))  # per run; later spans are only counted
+AGENT_SLOW_RUN_SECONDS = float(os.getenv("AGENT_SLOW_RUN_SECONDS", 30))
+# Recent durations kept per tool / model / phase for the p50/p95
+LATENCY_SAMPLES = 500
+
+
+def _ms(seconds: float) -> float:
+    return round(seconds * 1000, 1)
+
+
+def _text_size(result) -> int:
+    return sum(len(getattr(block, "text", "") or "") for block in getattr(result, "content", None) or [])
+
+
+class Trace:
+    """Spans of one agent run: phases before the run, every LLM step and every tool execution."""
+
+    def __init__(self, query: str):
+        self.id = uuid.uuid4().hex[:12]
+        self.started_at = datetime.now().isoformat(timespec="milliseconds")
+        self.started = time.monotonic()
+        self.query_chars = len(query)
+        self.status = "running"
+        self.error = None
+        self.duration_ms = None
+        self.run = None  # the supervisor's RunState, once the agent run starts
+        self.spans = []
+        self.dropped_spans = 0
+        self._last_mark = self.started
+        self._llm_open = {}  # LangChain run_id -> (span, start)
+
+    def offset_ms(self, at: float) -> float:
+        return _ms(at - self.started)
+
+    def add(self, span: dict):
+        if len(self.spans) < AGENT_TRACE_MAX_SPANS:
+            self.spans.append(span)
+        else:
+            self.dropped_spans += 1
+
+    def mark(self, phase: str):
+        """Close a phase (e.g. queueing for a slot) that started at the previous mark."""
+        now = time.monotonic()
+        self.add({"kind": "phase", "name": phase, "start_ms": self.offset_ms(self._last_mark),
+                  "duration_ms": _ms(now - self._last_mark)})
+        self._last_mark = now
+
+    def attach(self, run):
+        self.run = run
+
+    def to_dict(self) -> dict:
+        llm = [s for s in self.spans if s["kind"] == "llm"]
+        tools = [s for s in self.spans if s["kind"] == "tool"]
+        run = self.run
+        return {
+            "trace_id": self.id,
+            "started_at": self.started_at,
+            "duration_ms": self.duration_ms,
+            "status": self.status,
+            "error": self.error,
+            "query_type": run.query_type if run else None,
+            "query_chars": self.query_chars,
+            "llm": {
+                "calls": len(llm),
+                "ms": round(sum(s["duration_ms"] for s in llm), 1),
+                "input_tokens": sum(s.get("input_tokens") or 0 for s in llm),
+                "output_tokens": sum(s.get("output_tokens") or 0 for s in llm),
+            },
+            "tools": {
+                "calls": len(tools),
+                "ms": round(sum(s["duration_ms"] for s in tools), 1),
+                "errors": sum(1 for s in tools if s["status"] != "ok"),
+            },
+            "memo_hits": run.memo_hits if run else 0,
+            "interventions": dict(run.interventions) if run else {},
+            "spans": self.spans,
+            "dropped_spans": self.dropped_spans,
+        }
+
+
+_current_trace: ContextVar[Optional[Trace]] = ContextVar("agent_trace", default=None)
+
+
+def current_trace() -> Optional[Trace]:
+    return _current_trace.get()
+
+
+class _LLMCallbacks(AsyncCallbackHandler):
+    """LangChain callbacks turning each chat model call of the current run into a span."""
+
+    def __init__(self, tracer: "AgentTracer"):
+        self.tracer = tracer
+
+    async def on_chat_model_start(self, serialized, messages, *, run_id, metadata=None, **kwargs):
+        trace = _current_trace.get()
+        if trace is None:
+            return
+        model = (metadata or {}).get("ls_model_name") or "llm"
+        input_chars = sum(
+            len(m.content) if isinstance(m.content, str) else len(json.dumps(m.content, default=str))
+            for batch in messages for m in batch
+        )
+        span = {"kind": "llm", "name": model, "input_messages": sum(len(batch) for batch in messages),
+                "input_chars": input_chars}
+        trace._llm_open[run_id] = (span, time.monotonic())
+
+    async def on_llm_end(self, response, *, run_id, **kwargs):
+        self._close(run_id, response=response)
+
+    async def on_llm_error(self, error, *, run_id, **kwargs):
+        self._close(run_id, error=error)
+
+    def _close(self, run_id, response=None, error=None):
+        trace = _current_trace.get()
+        if trace is None or run_id not in trace._llm_open:
+            return
+        span, start = trace._llm_open.pop(run_id)
+        end = time.monotonic()
+        span["start_ms"] = trace.offset_ms(start)
+        span["duration_ms"] = _ms(end - start)
+        span["status"] = "error" if error is not None else "ok"
+        if response is not None:
+            generations = [g for batch in response.generations for g in batch]
+            message = getattr(generations[0], "message", None) if generations else None
+            usage = getattr(message, "usage_metadata", None) or {}
+            span["input_tokens"] = usage.get("input_tokens")
+            span["output_tokens"] = usage.get("output_tokens")
+            span["output_chars"] = sum(len(getattr(g, "text", "") or "") for g in generations)
+            span["tool_calls"] = len(getattr(message, "tool_calls", None) or [])
+        trace.add(span)
+        self.tracer.record(span)
+
+
+class AgentTracer(Middleware):
+    """
+    Structured per-run traces for /agent/traces.
+
+    A trace covers one run_query/stream_query: the wait for a run slot and the agent setup
+    (phases), each LLM step (LangChain callbacks: duration, token usage, payload sizes) and each
+    tool execution (mcp_use client middleware: duration, argument/result sizes, errors).
+    Install it after RunSupervisor and ToolMemo, so only real executions become tool spans
+    (memo hits and refused calls are counted on the trace instead).
+
+    Finished traces go into a ring buffer of the last AGENT_TRACE_BUFFER runs, and every span's
+    duration into per tool / model / phase samples for the p50/p95 in `stats()`.
+    Traces hold sizes and timings only, never query text, tool arguments or results.
+    """
+
+    def __init__(self, buffer: int = AGENT_TRACE_BUFFER):
+        self.traces = deque(maxlen=buffer)
+        self.samples = {}  # (kind, name) -> deque of durations in ms
+        self.errors = {}  # (kind, name) -> failed spans
+        self.callbacks = [_LLMCallbacks(self)]  # pass to MCPAgent(callbacks=...)
+
+    @contextmanager
+    def trace(self, query: str):
+        """Trace the agent run inside the block."""
+        trace = Trace(query)
+        previous = _current_trace.get()
+        _current_trace.set(trace)
+        try:
+            yield trace
+            trace.status = "ok"
+        except AgentBusy as e:
+            trace.status, trace.error = "busy", str(e)
+            raise
+        except asyncio.TimeoutError:
+            trace.status, trace.error = "timeout", "Run exceeded its time budget"
+            raise
+        except (asyncio.CancelledError, GeneratorExit):
+            trace.status = "cancelled"  # shutdown, or the streaming client went away
+            raise
+        except Exception as e:
+            trace.status, trace.error = "error", str(e)[:200]
+            raise
+        finally:
+            # set() rather than reset(): a streamed run can be closed from another task's context
+            _current_trace.set(previous)
+            trace.duration_ms = _ms(time.monotonic() - trace.started)
+            for span in trace.spans:
+                if span["kind"] == "phase":
+                    self.record(span)
+            self.traces.append(trace)
+            if trace.duration_ms >= AGENT_SLOW_RUN_SECONDS * 1000:
+                summary = trace.to_dict()
+                logger.warning(f"🐢 Slow agent run {trace.id}: {trace.duration_ms / 1000:.1f}s total, "
+                               f"LLM {summary['llm']['ms'] / 1000:.1f}s in {summary['llm']['calls']} calls, "
+                               f"tools {summary['tools']['ms'] / 1000:.1f}s in {summary['tools']['calls']} calls")
+
+    def record(self, span: dict):
+        key = (span["kind"], span["name"])
+        samples = self.samples.get(key)
+        if samples is None:
+            samples = self.samples[key] = deque(maxlen=LATENCY_SAMPLES)
+        samples.append(span["duration_ms"])
+        if span.get("status", "ok") != "ok":
+            self.errors[key] = self.errors.get(key, 0) + 1
+
+    async def on_call_tool(self, context, call_next):
+        trace = _current_trace.get()
+        if trace is None:
+            return await call_next(context)
+
+        name = context.params.name
+        span = {"kind": "tool", "name": name,
+                "args_chars": len(json.dumps(context.params.arguments or {}, default=str))}
+        start = time.monotonic()
+        try:
+            result = await call_next(context)
+            span["status"] = "error" if getattr(result, "isError", False) else "ok"
+            span["result_chars"] = _text_size(result)
+            return result
+        except BaseException:
+            span["status"] = "error"
+            raise
+        finally:
+            span["start_ms"] = trace.offset_ms(start)
+            span["duration_ms"] = _ms(time.monotonic() - start)
+            trace.add(span)
+            self.record(span)
+
+    def recent(self, limit: int = 20) -> list:
+        """The most recent traces, newest first."""
+        return [trace.to_dict() for trace in list(self.traces)[::-1][:max(0, limit)]]
+
+    def stats(self) -> dict:
+        """p50/p95 duration per tool, LLM model and phase over their recent spans."""
+        grouped = {"tool": {}, "llm": {}, "phase": {}}
+        for (kind, name), samples in self.samples.items():
+            ordered = sorted(samples)
+            grouped[kind][name] = {
+                "count": len(ordered),
+                "errors": self.errors.get((kind, name), 0),
+                "ms_p50": ordered[len(ordered) // 2],
+                "ms_p95": ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))],
+                "ms_max": ordered[-1],
+            }
+        return {"tools": grouped["tool"], "llm": grouped["llm"], "phases": grouped["phase"]}
@@ -0,0 +1,94 @@
+import os
+import tarfile
+import zipfile
+from pathlib import Path
+from typing import BinaryIO, Iterator
+from RAG.data_loader import SUPPORTED_EXTENSIONS
+
+ARCHIVE_SUFFIXES = ('.zip', '.tar', '.tar.gz', '.tgz', '.tar.bz2', '.tbz2', '.tar.xz', '.txz')
+COPY_BUFFER_SIZE = 1 << 20
+
+
+class UploadBudgetExceeded(ValueError):
+    """An upload (or archive inside it) holds more files or bytes than one request may ingest."""
+
+
+class UploadBudget:
+    """
+    Per-request limits on the number of ingested files and their total uncompressed size.
+    Bytes are counted while they are written, so a zip bomb is stopped mid-entry.
+    """
+
+    def __init__(self, max_files: int, max_bytes: int):
+        self.max_files = max_files
+        self.max_bytes = max_bytes
+        self.files = 0
+        self.bytes = 0
+
+    def charge_file(self, name: str):
+        self.files += 1
+        if self.files > self.max_files:
+            raise UploadBudgetExceeded(f"Upload exceeds {self.max_files} files (at '{name}').")
+
+    def charge_bytes(self, n: int, name: str):
+        self.bytes += n
+        if self.bytes > self.max_bytes:
+            raise UploadBudgetExceeded(f"Upload exceeds {self.max_bytes // (1024 * 1024)} MB uncompressed (at '{name}').")
+
+
+def is_archive(filename: str) -> bool:
+    return (filename or "").lower().endswith(ARCHIVE_SUFFIXES)
+
+
+def _wanted(name: str) -> bool:
+    base = os.path.basename(name)
+    # Skip macOS resource forks / hidden files and anything the loaders can't read
+    if not base or base.startswith(".") or "__MACOSX" in name.split("/"):
+        return False
+    return Path(base).suffix.lower() in SUPPORTED_EXTENSIONS
+
+
+def save_stream(src: BinaryIO, name: str, dest_dir: str, budget: UploadBudget) -> str:
+    """
+    Copy one file into its own numbered folder under dest_dir and return its path.
+    Only the base name is kept (no '../' escapes), and the folder keeps
+    duplicate names apart while `source` metadata stays the real file name.
+    """
+    budget.charge_file(name)
+    entry_dir = os.path.join(dest_dir, f"{budget.files:05d}")
+    os.makedirs(entry_dir, exist_ok=True)
+    path = os.path.join(entry_dir, os.path.basename(name.replace("\\", "/")))
+    with open(path, "wb") as out:
+        while True:
+            chunk = src.read(COPY_BUFFER_SIZE)
+            if not chunk:
+                break
+            budget.charge_bytes(len(chunk), name)
+            out.write(chunk)
+    return path
+
+
+def iter_archive_files(fileobj: BinaryIO, filename: str, dest_dir: str, budget: UploadBudget) -> Iterator[str]:
+    """
+    Extract the supported entries of a zip/tar upload one at a time, yielding each path as soon
+    as it is on disk so loaders can start before the rest of the archive is read.
+    Tar archives are read as a forward-only stream; zip needs the (already spooled) upload to seek
+    to its central directory, but entries are still decompressed one by one.
+    """
+    start_files, start_bytes = budget.files, budget.bytes
+    if filename.lower().endswith('.zip'):
+        with zipfile.ZipFile(fileobj) as archive:
+            for info in archive.infolist():
+                if info.is_dir() or not _wanted(info.filename):
+                    continue
+                with archive.open(info) as src:
+                    yield save_stream(src, info.filename, dest_dir, budget)
+    else:
+        with tarfile.open(fileobj=fileobj, mode="r|*") as archive:
+            for member in archive:
+                # Regular files only: symlinks, hardlinks and devices are never materialised
+                if not member.isfile() or not _wanted(member.name):
+                    continue
+                src = archive.extractfile(member)
+                yield save_stream(src, member.name, dest_dir, budget)
+    print(f"[INFO] Extracted {budget.files - start_files} files ({(budget.bytes - start_bytes) // 1024} KB) from {filename}")
@@ -39,7 +39,7 @@ def process_batches():
             # We pass RAG_OUTPUT_DIR as the persist directory.
             # FaissVectorStore will create a subdirectory named after 'bid' (Category) inside RAG_OUTPUT_DIR.
             try:
-                count = process_documents(bid=category, file_paths=pdf_files, persist_directory=RAG_OUTPUT_DIR)
+                count = process_documents(bid=category, file_paths=pdf_files, persist_directory=RAG_OUTPUT_DIR, with_digest=False)
                 print(f"[SUCCESS] Processed {count} chunks for category '{category}'")
             except Exception as e:
                 print(f"[ERROR] Failed to process category '{category}': {e}")
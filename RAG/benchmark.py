@@ -0,0 +1,348 @@
+"""
+Micro-benchmarks for the RAG layer.
+
+Run from the project root, e.g.:
+    python -m RAG.benchmark snapshots
+"""
+import os
+import sys
+import argparse
+import csv
+import shutil
+import tempfile
+import multiprocessing
+import time
+import numpy as np
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from RAG.vectorstore import FaissVectorStore
+
+EMBEDDING_DIM = 384  # all-MiniLM-L6-v2
+
+
+def _percentile(samples, pct):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+def _report(label, samples_ms):
+    print(f"{label:<28} n={len(samples_ms):<6} p50={_percentile(samples_ms, 50):7.2f} ms  "
+          f"p95={_percentile(samples_ms, 95):7.2f} ms  max={max(samples_ms):7.2f} ms")
+
+
+def _random_vectors(n, dim=EMBEDDING_DIM):
+    return np.random.rand(n, dim).astype('float32')
+
+
+def _ingest_loop(persist_dir, n_vectors, stop, saves):
+    writer = FaissVectorStore(bid="bench", persist_dir=persist_dir)
+    while not stop.is_set():
+        # Same-size rewrites, so any latency change comes from contention rather than a bigger index
+        writer.index = None
+        writer.metadata = []
+        writer.add_embeddings(_random_vectors(n_vectors), [{"text": ""}] * n_vectors)
+        writer.save()
+        with saves.get_lock():
+            saves.value += 1
+
+
+def bench_snapshots(n_vectors: int = 20000, seconds: float = 5.0):
+    """Load+search latency of a reader while a writer keeps publishing new snapshots."""
+    tmp = tempfile.mkdtemp(prefix="rag_bench_")
+    try:
+        writer = FaissVectorStore(bid="bench", persist_dir=tmp)
+        writer.add_embeddings(_random_vectors(n_vectors), [{"text": ""}] * n_vectors)
+        writer.save()
+
+        reader = FaissVectorStore(bid="bench", persist_dir=tmp)
+        query = _random_vectors(1)
+
+        def measure(duration):
+            samples = []
+            deadline = time.perf_counter() + duration
+            while time.perf_counter() < deadline:
+                start = time.perf_counter()
+                with reader.pinned():
+                    reader.search(query, top_k=5)
+                samples.append((time.perf_counter() - start) * 1000)
+            return samples
+
+        idle = measure(seconds)
+
+        # Ingestion runs in the API process while retrieval runs in the MCP server process,
+        # so the writer gets its own process here too.
+        stop = multiprocessing.Event()
+        saves = multiprocessing.Value("i", 0)
+        proc = multiprocessing.Process(target=_ingest_loop, args=(tmp, n_vectors, stop, saves), daemon=True)
+        proc.start()
+        busy = measure(seconds)
+        stop.set()
+        proc.join()
+
+        print(f"\n[BENCH] Snapshot load+search ({n_vectors} vectors)")
+        _report("idle", idle)
+        _report(f"during ingest ({saves.value} saves)", busy)
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+
+
+def bench_filters(n_vectors: int = 50000, n_sources: int = 50, queries: int = 200):
+    """Unfiltered vs bitmap-filtered search latency on one in-memory index."""
+    tmp = tempfile.mkdtemp(prefix="rag_bench_")
+    try:
+        store = FaissVectorStore(bid="bench", persist_dir=tmp)
+        metadatas = [
+            {"text": "", "source": f"doc_{i % n_sources}.pdf", "file_type": "pdf", "ingested_at": "2025-01-01T00:00:00"}
+            for i in range(n_vectors)
+        ]
+        store.add_embeddings(_random_vectors(n_vectors), metadatas)
+        query = _random_vectors(1)
+
+        start = time.perf_counter()
+        store._filter_bitmaps()
+        build_ms = (time.perf_counter() - start) * 1000
+
+        def measure(filters):
+            samples = []
+            for _ in range(queries):
+                start = time.perf_counter()
+                store.search(query, top_k=5, filters=filters)
+                samples.append((time.perf_counter() - start) * 1000)
+            return samples
+
+        print(f"\n[BENCH] Filtered search ({n_vectors} vectors, {n_sources} sources, bitmaps built in {build_ms:.1f} ms)")
+        _report("unfiltered", measure(None))
+        _report("source=doc_7.pdf", measure({"source": "doc_7.pdf"}))
+        _report("file_type+uploaded_after", measure({"file_type": "pdf", "uploaded_after": "2024-06-01"}))
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+
+
+def _noise(n, scale, dim=EMBEDDING_DIM):
+    """Gaussian noise with an expected norm of `scale`."""
+    return scale * np.random.randn(n, dim).astype('float32') / np.sqrt(dim)
+
+
+def _clustered_corpus(n_docs, chunks_per_doc, spread=1.4, dim=EMBEDDING_DIM):
+    """Unit-norm chunk vectors scattered around one topic vector per document, like real uploads."""
+    topics = np.random.randn(n_docs, dim).astype('float32')
+    topics /= np.linalg.norm(topics, axis=1, keepdims=True)
+    vectors = np.repeat(topics, chunks_per_doc, axis=0) + _noise(n_docs * chunks_per_doc, spread, dim)
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    metadatas = [{"text": "", "source": f"doc_{i // chunks_per_doc}.pdf"} for i in range(len(vectors))]
+    return vectors.astype('float32'), metadatas
+
+
+def bench_two_stage(chunks_per_doc: int = 200, doc_counts=(50, 200, 800), queries: int = 200, top_k: int = 5):
+    """Flat vs document->chunk search: latency and recall@k against the exact flat result."""
+    tmp = tempfile.mkdtemp(prefix="rag_bench_")
+    try:
+        print(f"\n[BENCH] Two-stage search ({chunks_per_doc} chunks/doc, recall@{top_k} vs flat)")
+        for n_docs in doc_counts:
+            store = FaissVectorStore(bid="bench", persist_dir=tmp)
+            vectors, metadatas = _clustered_corpus(n_docs, chunks_per_doc)
+            store.add_embeddings(vectors, metadatas)
+            store._document_index()
+            # Queries are perturbed chunks, so the true neighbours are not always in one document
+            picks = np.random.randint(0, len(vectors), queries)
+            probes = vectors[picks] + _noise(queries, 2.0)
+
+            def run(top_documents):
+                samples, hits = [], []
+                for probe in probes:
+                    q = probe.reshape(1, -1)
+                    start = time.perf_counter()
+                    res = store.search(q, top_k=top_k, top_documents=top_documents)
+                    samples.append((time.perf_counter() - start) * 1000)
+                    hits.append({int(r["index"]) for r in res})
+                return samples, hits
+
+            flat_ms, exact = run(None)
+            _report(f"docs={n_docs:<4} flat", flat_ms)
+            for top_documents in (2, 4, 8):
+                ms, hits = run(top_documents)
+                recall = np.mean([len(h & e) / len(e) for h, e in zip(hits, exact)])
+                _report(f"docs={n_docs:<4} top_docs={top_documents}", ms)
+                print(f"{'':<28} recall@{top_k}={recall:.3f}")
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+
+
+def _memory_kb():
+    """Pss/private/shared resident memory of this process (Linux /proc only)."""
+    fields = {}
+    with open("/proc/self/smaps_rollup") as f:
+        for line in f:
+            key, _, value = line.partition(":")
+            if value.strip().endswith("kB"):
+                fields[key] = int(value.split()[0])
+    return {
+        "pss": fields.get("Pss", 0),
+        "private": fields.get("Private_Clean", 0) + fields.get("Private_Dirty", 0),
+        "shared": fields.get("Shared_Clean", 0) + fields.get("Shared_Dirty", 0),
+    }
+
+
+def _memory_worker(persist_dir, read_only, ready, results):
+    store = FaissVectorStore(bid="bench", persist_dir=persist_dir, read_only=read_only)
+    baseline = _memory_kb()
+    store.load()
+    store.search(_random_vectors(1), top_k=5)  # a flat search touches every page of the index
+    # Wait until every worker has its copy resident, otherwise shared pages are not counted as shared
+    ready.wait()
+    after = _memory_kb()
+    results.put({key: after[key] - baseline[key] for key in after})
+    ready.wait()
+    store.release()
+
+
+def bench_mmap(n_vectors: int = 100000, worker_counts=(1, 2, 4)):
+    """Total memory N worker processes spend on one read-only index: private copies vs memory-mapped."""
+    if not os.path.exists("/proc/self/smaps_rollup"):
+        print("\n[BENCH] mmap: needs Linux /proc/self/smaps_rollup, skipping.")
+        return
+    tmp = tempfile.mkdtemp(prefix="rag_bench_")
+    try:
+        writer = FaissVectorStore(bid="bench", persist_dir=tmp)
+        writer.add_embeddings(_random_vectors(n_vectors), [{"text": ""}] * n_vectors)
+        writer.save()
+        index_mb = os.path.getsize(os.path.join(writer.snapshot_dir, "faiss.index")) / 1024 / 1024
+        del writer
+
+        print(f"\n[BENCH] Read-only index memory ({n_vectors} vectors, {index_mb:.0f} MB on disk; PSS = proportional share)")
+        for workers in worker_counts:
+            totals = {}
+            for read_only in (False, True):
+                ready = multiprocessing.Barrier(workers + 1)
+                results = multiprocessing.Queue()
+                procs = [multiprocessing.Process(target=_memory_worker, args=(tmp, read_only, ready, results))
+                         for _ in range(workers)]
+                for proc in procs:
+                    proc.start()
+                ready.wait()
+                reports = [results.get() for _ in procs]
+                ready.wait()
+                for proc in procs:
+                    proc.join()
+                totals[read_only] = sum(r["pss"] for r in reports) / 1024
+                label = "mmap" if read_only else "private"
+                print(f"  workers={workers} {label:<8} total PSS={totals[read_only]:8.1f} MB  "
+                      f"private/worker={sum(r['private'] for r in reports) / workers / 1024:7.1f} MB")
+            print(f"  workers={workers} saved    {totals[False] - totals[True]:8.1f} MB")
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+
+
+def _sample_files(directory, pages=50):
+    """Synthetic uploads: a text-heavy PDF, an image-heavy PDF, a TXT and a CSV."""
+    import pymupdf
+    paragraph = ("Our seasonal menu features single-origin espresso, oat milk lattes and house-baked pastries. "
+                 "Loyalty members get a free drink after nine visits. ") * 12
+    files = {}
+
+    text_pdf = pymupdf.open()
+    for _ in range(pages):
+        text_pdf.new_page().insert_textbox(pymupdf.Rect(40, 40, 560, 800), paragraph, fontsize=9)
+    files["pdf-text"] = os.path.join(directory, "text.pdf")
+    text_pdf.save(files["pdf-text"])
+
+    pixmap = pymupdf.Pixmap(pymupdf.csRGB, pymupdf.IRect(0, 0, 800, 800), False)
+    pixmap.set_rect(pixmap.irect, (200, 120, 40))
+    image = pixmap.tobytes("png")
+    image_pdf = pymupdf.open()
+    for _ in range(pages):
+        page = image_pdf.new_page()
+        page.insert_image(pymupdf.Rect(40, 40, 560, 560), stream=image)
+        page.insert_textbox(pymupdf.Rect(40, 580, 560, 800), paragraph[:400], fontsize=9)
+    files["pdf-images"] = os.path.join(directory, "images.pdf")
+    image_pdf.save(files["pdf-images"])
+
+    files["txt"] = os.path.join(directory, "notes.txt")
+    with open(files["txt"], "w") as f:
+        f.write(paragraph * pages)
+
+    files["csv"] = os.path.join(directory, "catalog.csv")
+    with open(files["csv"], "w") as f:
+        f.write("sku,name,price,description\n")
+        for i in range(pages * 100):
+            f.write(f"SKU{i},Item {i},{i % 50}.99,House blend number {i}\n")
+    return files
+
+
+def bench_parse(pages: int = 50, repeats: int = 3):
+    """Per-format parse time of RAG.data_loader, with both PDF backends."""
+    from RAG import data_loader
+
+    tmp = tempfile.mkdtemp(prefix="rag_bench_")
+    try:
+        files = _sample_files(tmp, pages)
+        print(f"\n[BENCH] Document parsing ({pages} pages / {pages * 100} CSV rows per file)")
+        for fmt, path in files.items():
+            backends = ("pypdf", "pymupdf") if fmt.startswith("pdf") else (None,)
+            for backend in backends:
+                samples = []
+                for _ in range(repeats):
+                    start = time.perf_counter()
+                    docs = data_loader.load_pdf(path, backend=backend) if backend else data_loader.load_single_document(path)
+                    samples.append((time.perf_counter() - start) * 1000)
+                _report(f"{fmt} {backend or ''}".strip() + f" ({len(docs)} docs)", samples)
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+
+
+def bench_tabular(rows: int = 50000):
+    """Documents (= vectors) and parse time for a spreadsheet upload: one per row vs grouped blocks."""
+    from langchain_community.document_loaders import CSVLoader
+    from RAG import data_loader
+
+    tmp = tempfile.mkdtemp(prefix="rag_bench_")
+    try:
+        csv_path = os.path.join(tmp, "catalog.csv")
+        with open(csv_path, "w") as f:
+            f.write("sku,name,price,category,description\n")
+            for i in range(rows):
+                f.write(f"SKU{i},Item {i},{i % 50}.99,cat-{i % 12},House blend number {i}\n")
+
+        print(f"\n[BENCH] Tabular ingestion ({rows} rows)")
+
+        def measure(label, load):
+            start = time.perf_counter()
+            docs = load()
+            elapsed = (time.perf_counter() - start) * 1000
+            chars = sum(len(d.page_content) for d in docs)
+            print(f"  {label:<26} docs={len(docs):<7} chars={chars:<9} parse={elapsed:8.1f} ms")
+
+        measure("csv per-row (CSVLoader)", lambda: CSVLoader(csv_path).load())
+        measure("csv grouped", lambda: list(data_loader.iter_csv_documents(csv_path)))
+        if data_loader.openpyxl is not None:
+            xlsx_path = os.path.join(tmp, "catalog.xlsx")
+            workbook = data_loader.openpyxl.Workbook(write_only=True)
+            sheet = workbook.create_sheet("catalog")
+            with open(csv_path, newline="") as f:
+                for row in csv.reader(f):
+                    sheet.append(row)
+            workbook.save(xlsx_path)
+            measure("xlsx grouped", lambda: list(data_loader.iter_excel_documents(xlsx_path)))
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+
+
+BENCHMARKS = {
+    "snapshots": bench_snapshots,
+    "filters": bench_filters,
+    "mmap": bench_mmap,
+    "two_stage": bench_two_stage,
+    "parse": bench_parse,
+    "tabular": bench_tabular,
+}
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="RAG micro-benchmarks")
+    parser.add_argument("names", nargs="*", help=f"benchmarks to run: {', '.join(BENCHMARKS)} (default: all)")
+    args = parser.parse_args()
+    unknown = [n for n in args.names if n not in BENCHMARKS]
+    if unknown:
+        parser.error(f"unknown benchmark(s): {', '.join(unknown)}")
+    for name in args.names or BENCHMARKS:
+        BENCHMARKS[name]()
@@ -1,9 +1,317 @@
+import os
+import csv
+import json
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
-from typing import List, Any
-from langchain_community.document_loaders import PyPDFLoader, TextLoader, CSVLoader
+from typing import List, Any, Iterable, Iterator
+from langchain_core.documents import Document
+from langchain_community.document_loaders import PyPDFLoader, TextLoader
 from langchain_community.document_loaders import Docx2txtLoader
 from langchain_community.document_loaders.excel import UnstructuredExcelLoader
-from langchain_community.document_loaders import JSONLoader
+
+try:
+    import pymupdf
+except ImportError:
+    pymupdf = None
+
+try:
+    import openpyxl
+except ImportError:
+    openpyxl = None
+
+# PDF parser: "pymupdf" (fast, C-based) or "pypdf" (langchain PyPDFLoader, pure Python).
+# Defaults to pymupdf whenever it is installed.
+PDF_BACKEND = os.getenv("RAG_PDF_BACKEND", "pymupdf" if pymupdf else "pypdf").lower()
+
+
+def load_pdf_pymupdf(file_path: Path) -> List[Any]:
+    """One Document per page, with the same source/page (0-based) metadata PyPDFLoader sets."""
+    documents = []
+    with pymupdf.open(str(file_path)) as pdf:
+        total_pages = pdf.page_count
+        for page in pdf:
+            documents.append(Document(
+                page_content=page.get_text(),
+                metadata={"source": str(file_path), "page": page.number, "total_pages": total_pages},
+            ))
+    return documents
+
+
+SUPPORTED_EXTENSIONS = ('.pdf', '.txt', '.csv', '.xlsx', '.docx', '.json', '.jsonl')
+# Formats read incrementally by iter_single_document; everything else is parsed whole
+STREAMING_EXTENSIONS = ('.csv', '.xlsx', '.json', '.jsonl')
+# Files parsed concurrently by iter_documents_from_paths (PyMuPDF and friends release the GIL)
+LOADER_WORKERS = int(os.getenv("RAG_LOADER_WORKERS", min(4, os.cpu_count() or 1)))
+
+# Spreadsheets and JSON records are grouped into blocks (spreadsheet header repeated in each)
+# instead of one Document per row/record. A block stays under the default 1000-char chunk
+# size, so it is embedded as a single chunk. Tokens are estimated as ~4 chars each.
+TABULAR_BLOCK_TOKENS = 240
+# Comma-separated (dotted) JSON fields to ingest, e.g. "title,description,price.amount".
+# Empty means every scalar field of each record.
+JSON_FIELDS = [f.strip() for f in os.getenv("RAG_JSON_FIELDS", "").split(",") if f.strip()]
+# Dotted key of the record list inside a top-level JSON object, e.g. "data.items".
+# Empty: the longest list in small files, the first list-valued key in streamed ones.
+JSON_RECORDS_PATH = os.getenv("RAG_JSON_RECORDS_PATH", "").strip()
+# .json files up to this size are parsed whole; larger ones are streamed at constant memory
+JSON_PARSE_WHOLE_BYTES = 4 << 20
+JSON_READ_SIZE = 1 << 16
+# A decode error this close to the end of the buffer may be a token cut off by the read size
+# (a partial number, literal such as "-Infinity", or \uXXXX escape)
+JSON_PARTIAL_TOKEN_CHARS = 8
+
+
+def _estimate_tokens(text: str) -> int:
+    return len(text) // 4 + 1
+
+
+def _format_row(values: Iterable[Any]) -> str:
+    return " | ".join("" if v is None else str(v).strip() for v in values)
+
+
+def iter_row_blocks(rows: Iterator[Iterable[Any]], source: str, extra_metadata: dict = None,
+                    max_tokens: int = TABULAR_BLOCK_TOKENS) -> Iterator[Any]:
+    """
+    Group a stream of rows (first row = header) into Documents of at most `max_tokens`,
+    each starting with the header line. Rows are consumed lazily, so the whole
+    sheet is never held in memory.
+    """
+    header = None
+    block, block_tokens, first_row = [], 0, None
+    for row_number, row in enumerate(rows, start=1):
+        line = _format_row(row)
+        if not line.strip(" |"):
+            continue  # blank row
+        if header is None:
+            header = line
+            header_tokens = _estimate_tokens(header)
+            continue
+        line_tokens = _estimate_tokens(line)
+        if block and header_tokens + block_tokens + line_tokens > max_tokens:
+            yield Document(page_content="\n".join([header] + block),
+                           metadata={"source": source, "first_row": first_row, "last_row": row_number - 1, **(extra_metadata or {})})
+            block, block_tokens = [], 0
+        if not block:
+            first_row = row_number
+        block.append(line)
+        block_tokens += line_tokens
+    if block:
+        yield Document(page_content="\n".join([header] + block),
+                       metadata={"source": source, "first_row": first_row, "last_row": row_number, **(extra_metadata or {})})
+
+
+def iter_csv_documents(file_path: Path) -> Iterator[Any]:
+    with open(file_path, newline="", encoding="utf-8-sig", errors="replace") as f:
+        yield from iter_row_blocks(csv.reader(f), str(file_path))
+
+
+def iter_excel_documents(file_path: Path) -> Iterator[Any]:
+    # read_only mode streams rows from the sheet XML instead of building the whole workbook
+    workbook = openpyxl.load_workbook(str(file_path), read_only=True, data_only=True)
+    try:
+        for sheet in workbook.worksheets:
+            yield from iter_row_blocks(sheet.iter_rows(values_only=True), str(file_path), {"sheet": sheet.title})
+    finally:
+        workbook.close()
+
+
+class _JsonStream:
+    """Reads one JSON value at a time from a text file, buffering only what hasn't been consumed yet."""
+
+    def __init__(self, f):
+        self.f = f
+        self.buf = ""
+        self.pos = 0
+        self.decoder = json.JSONDecoder()
+
+    def _read_more(self) -> bool:
+        more = self.f.read(JSON_READ_SIZE)
+        self.buf, self.pos = self.buf[self.pos:] + more, 0
+        return bool(more)
+
+    def peek(self) -> str:
+        """Next non-whitespace character ("" at the end of the file), without consuming it."""
+        while True:
+            while self.pos < len(self.buf) and self.buf[self.pos] in " \t\r\n":
+                self.pos += 1
+            if self.pos < len(self.buf) or not self._read_more():
+                return self.buf[self.pos:self.pos + 1]
+
+    def expect(self, chars: str) -> str:
+        """Consume the next character, which has to be one of `chars`."""
+        ch = self.peek()
+        if not ch:
+            raise ValueError("Truncated JSON document")
+        if ch not in chars:
+            raise ValueError(f"Invalid JSON: expected one of {chars!r}, got {ch!r}")
+        self.pos += 1
+        return ch
+
+    def value(self) -> Any:
+        """Decode the next complete value."""
+        self.peek()
+        while True:
+            try:
+                value, end = self.decoder.raw_decode(self.buf, self.pos)
+            except json.JSONDecodeError as e:
+                cut_off = e.msg.startswith("Unterminated string") or len(self.buf) - e.pos <= JSON_PARTIAL_TOKEN_CHARS
+                if not cut_off:
+                    # Malformed: fail here rather than buffering the rest of the file looking for an end
+                    raise ValueError(f"Invalid JSON: {e.msg} ({len(self.buf) - e.pos} chars before the read position)")
+                if not self._read_more():
+                    raise ValueError("Truncated JSON document")
+                continue
+            # A number ending exactly at the end of the buffer may continue in the next read
+            if end == len(self.buf) and self._read_more():
+                continue
+            self.pos = end
+            return value
+
+
+def _iter_json_array(stream: _JsonStream) -> Iterator[Any]:
+    """Items of the JSON array starting at the stream's position, decoded one by one."""
+    stream.expect("[")
+    if stream.peek() == "]":
+        stream.pos += 1
+        return
+    while True:
+        yield stream.value()
+        if stream.expect(",]") == "]":
+            return
+
+
+def _iter_json_object_records(stream: _JsonStream, path: List[str] = None) -> Iterator[Any]:
+    """
+    Items of the record list inside the JSON object at the stream's position: the list at `path`
+    (keys, outermost first), else the first list-valued key. Values before it are skipped.
+    """
+    stream.expect("{")
+    if stream.peek() == "}":
+        raise ValueError("No list of records in the JSON document")
+    while True:
+        key = stream.value()
+        stream.expect(":")
+        if not path or key == path[0]:
+            ch = stream.peek()
+            if path and len(path) > 1 and ch == "{":
+                yield from _iter_json_object_records(stream, path[1:])
+                return
+            if ch == "[" and (not path or len(path) == 1):
+                yield from _iter_json_array(stream)
+                return
+        stream.value()
+        if stream.expect(",}") == "}":
+            raise ValueError(f"No list of records {'at ' + '.'.join(path) + ' ' if path else ''}in the JSON document")
+
+
+def iter_json_records(file_path: Path) -> Iterator[Any]:
+    """
+    Records of a .json/.jsonl file: JSONL lines, the items of a top-level array, or the items of
+    the record list in a top-level object (RAG_JSON_RECORDS_PATH, e.g. {"data": {"items": [...]}}).
+    Files over JSON_PARSE_WHOLE_BYTES are streamed item by item; smaller ones are parsed whole.
+    """
+    records_path = JSON_RECORDS_PATH.split(".") if JSON_RECORDS_PATH else None
+    with open(file_path, encoding="utf-8-sig", errors="replace") as f:
+        if Path(file_path).suffix.lower() == ".jsonl":
+            for line_number, line in enumerate(f, start=1):
+                if not line.strip():
+                    continue
+                try:
+                    yield json.loads(line)
+                except json.JSONDecodeError as e:
+                    print(f"[WARN] Skipping invalid JSON on line {line_number} of {file_path}: {e}")
+            return
+
+        if os.path.getsize(file_path) <= JSON_PARSE_WHOLE_BYTES:
+            data = json.load(f)
+            if isinstance(data, dict) and records_path:
+                records = _pick(data, JSON_RECORDS_PATH)
+                if not isinstance(records, list):
+                    raise ValueError(f"No list of records at {JSON_RECORDS_PATH} in the JSON document")
+                yield from records
+            elif isinstance(data, dict):
+                # Exports usually wrap the records in one list-valued key; use the longest such list
+                lists = [v for v in data.values() if isinstance(v, list)]
+                yield from (max(lists, key=len) if lists else [data])
+            else:
+                yield from (data if isinstance(data, list) else [data])
+            return
+
+        stream = _JsonStream(f)
+        first = stream.peek()
+        if first == "[":
+            yield from _iter_json_array(stream)
+        elif first == "{":
+            yield from _iter_json_object_records(stream, records_path)
+        else:
+            yield stream.value()
+
+
+def _flatten(value: Any, prefix: str = "") -> Iterator[tuple]:
+    if isinstance(value, dict):
+        for key, item in value.items():
+            yield from _flatten(item, f"{prefix}.{key}" if prefix else str(key))
+    elif isinstance(value, list) and not any(isinstance(v, (dict, list)) for v in value):
+        yield prefix, ", ".join(str(v) for v in value)
+    elif isinstance(value, list):
+        for i, item in enumerate(value):
+            yield from _flatten(item, f"{prefix}[{i}]")
+    elif value not in (None, ""):
+        yield prefix, value
+
+
+def _pick(record: Any, path: str) -> Any:
+    for key in path.split("."):
+        if not isinstance(record, dict):
+            return None
+        record = record.get(key)
+    return record
+
+
+def format_json_record(record: Any, fields: List[str] = None) -> str:
+    """"field: value" lines for the selected (dotted) fields, or for every scalar field."""
+    if not isinstance(record, dict):
+        return str(record)
+    if fields:
+        pairs = [(path, value) for path in fields for path, value in _flatten(_pick(record, path), path)]
+    else:
+        pairs = list(_flatten(record))
+    return "\n".join(f"{key}: {value}" for key, value in pairs)
+
+
+def iter_json_documents(file_path: Path, fields: List[str] = None,
+                        max_tokens: int = TABULAR_BLOCK_TOKENS) -> Iterator[Any]:
+    """Stream JSON/JSONL records into Documents of several records each, at constant memory."""
+    fields = fields if fields is not None else JSON_FIELDS
+    block, block_tokens, first_record = [], 0, None
+    for record_number, record in enumerate(iter_json_records(file_path), start=1):
+        text = format_json_record(record, fields)
+        if not text:
+            continue
+        text_tokens = _estimate_tokens(text)
+        if block and block_tokens + text_tokens > max_tokens:
+            yield Document(page_content="\n\n".join(block),
+                           metadata={"source": str(file_path), "first_record": first_record, "last_record": record_number - 1})
+            block, block_tokens = [], 0
+        if not block:
+            first_record = record_number
+        block.append(text)
+        block_tokens += text_tokens
+    if block:
+        yield Document(page_content="\n\n".join(block),
+                       metadata={"source": str(file_path), "first_record": first_record, "last_record": record_number})
+
+
+def load_pdf(file_path: Path, backend: str = None) -> List[Any]:
+    backend = backend or PDF_BACKEND
+    if backend == "pymupdf":
+        if pymupdf is not None:
+            return load_pdf_pymupdf(file_path)
+        print("[WARN] RAG_PDF_BACKEND=pymupdf but pymupdf is not installed; using pypdf.")
+    elif backend != "pypdf":
+        print(f"[WARN] Unknown RAG_PDF_BACKEND '{backend}'; using pypdf.")
+    return PyPDFLoader(str(file_path)).load()
 
 
 def load_single_document(file_path: Path) -> List[Any]:
@@ -14,23 +322,23 @@ def load_single_document(file_path: Path) -> List[Any]:
     
     try:
         if ext == '.pdf':
-            loader = PyPDFLoader(str(file_path))
-            documents = loader.load()
+            documents = load_pdf(file_path)
         elif ext == '.txt':
             loader = TextLoader(str(file_path))
             documents = loader.load()
         elif ext == '.csv':
-            loader = CSVLoader(str(file_path))
-            documents = loader.load()
+            documents = list(iter_csv_documents(file_path))
         elif ext == '.xlsx':
-            loader = UnstructuredExcelLoader(str(file_path))
-            documents = loader.load()
+            if openpyxl is not None:
+                documents = list(iter_excel_documents(file_path))
+            else:
+                loader = UnstructuredExcelLoader(str(file_path))
+                documents = loader.load()
         elif ext == '.docx':
             loader = Docx2txtLoader(str(file_path))
             documents = loader.load()
-        elif ext == '.json':
-            loader = JSONLoader(str(file_path))
-            documents = loader.load()
+        elif ext in ('.json', '.jsonl'):
+            documents = list(iter_json_documents(file_path))
         else:
             print(f"[WARN] Unsupported file type: {ext}")
             return []
@@ -41,6 +349,47 @@ def load_single_document(file_path: Path) -> List[Any]:
         print(f"[ERROR] Failed to load {file_path}: {e}")
         return []
 
+def iter_single_document(file_path: Path) -> Iterator[Any]:
+    """Like load_single_document, but streams the formats that can be read incrementally."""
+    file_path = Path(file_path)
+    ext = file_path.suffix.lower()
+    streams = {'.csv': iter_csv_documents, '.json': iter_json_documents, '.jsonl': iter_json_documents}
+    if ext == '.xlsx' and openpyxl is not None:
+        streams['.xlsx'] = iter_excel_documents
+    if ext not in streams:
+        yield from load_single_document(file_path)
+        return
+    count = 0
+    try:
+        for document in streams[ext](file_path):
+            count += 1
+            yield document
+    except Exception as e:
+        print(f"[ERROR] Failed to load {file_path} after {count} docs: {e}")
+        return
+    print(f"[DEBUG] Loaded {count} docs from {file_path}")
+
+def iter_documents_from_paths(file_paths: Iterable[str], workers: int = LOADER_WORKERS) -> Iterator[Any]:
+    """
+    Documents from a list of files, produced lazily so callers can process them in batches.
+    `file_paths` may itself be a generator (e.g. archive entries being extracted).
+    Whole-file formats (PDF, DOCX, TXT) are parsed on a thread pool, a few files ahead;
+    streaming formats are read in the calling thread. Documents come out in file order.
+    """
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        pending = deque()
+        for fp in file_paths:
+            if Path(fp).suffix.lower() in STREAMING_EXTENSIONS:
+                while pending:
+                    yield from pending.popleft().result()
+                yield from iter_single_document(Path(fp))
+                continue
+            pending.append(pool.submit(load_single_document, Path(fp)))
+            while len(pending) > workers or (pending and pending[0].done()):
+                yield from pending.popleft().result()
+        while pending:
+            yield from pending.popleft().result()
+
 def load_documents_from_paths(file_paths: List[str]) -> List[Any]:
     """Load documents from a specific list of file paths."""
     print(f"[DEBUG] Loading {len(file_paths)} specific files...")
@@ -54,7 +403,7 @@ def load_documents_from_paths(file_paths: List[str]) -> List[Any]:
 def load_all_documents(data_dir: str) -> List[Any]:
     """
     Load all supported files from the data directory and convert to LangChain document structure.
-    Supported: PDF, TXT, CSV, Excel, Word, JSON
+    Supported: PDF, TXT, CSV, Excel, Word, JSON/JSONL
     """
     # Use project root data folder
     data_path = Path(data_dir).resolve()
@@ -62,9 +411,8 @@ def load_all_documents(data_dir: str) -> List[Any]:
     
     # Collect all files
     all_files = []
-    extensions = ['*.pdf', '*.txt', '*.csv', '*.xlsx', '*.docx', '*.json']
-    for ext in extensions:
-        all_files.extend(list(data_path.glob(f'**/{ext}')))
+    for ext in SUPPORTED_EXTENSIONS:
+        all_files.extend(list(data_path.glob(f'**/*{ext}')))
         
     print(f"[DEBUG] Found {len(all_files)} files in directory.")
     return load_documents_from_paths([str(f) for f in all_files])
@@ -0,0 +1,140 @@
+import os
+import re
+import json
+from typing import List, Optional
+from dotenv import load_dotenv
+from llm_client import get_chat_model
+
+load_dotenv()
+
+DIGEST_MODEL = "openai/gpt-oss-120b"
+DIGEST_CONTEXT_CHARS = 12000  # sample of the uploaded text the profile is built from
+
+# Profile fields and the words that say which of them a profile question is about.
+PROFILE_FIELDS = {
+    "brand_voice": ["brand voice", "tone of voice", "tone", "voice", "personality", "style guide", "brand style", "how we sound"],
+    "key_products": ["product", "products", "menu", "service", "services", "offering", "catalog", "catalogue", "sell"],
+    "offers": ["offer", "offers", "discount", "promotion", "promo", "deal", "sale", "coupon", "pricing"],
+    "audience": ["audience", "customer", "customers", "target market", "demographic", "persona", "who we serve"],
+}
+
+# Only requests for a whole profile field are answered from the digest, e.g. "what is our tone?"
+# or "describe our target audience". Anything narrower ("what is our return policy for sale items",
+# "who is our audience on tiktok") or merely mentioning a field ("write a post about our new
+# product") goes through full retrieval, which gets the digest prepended instead.
+PROFILE_QUESTION = re.compile(
+    r"^\s*(?:(?:what|which|who)(?:'s|'re| is| are| do| does)?|describe|summari[sz]e|list|remind me of|tell me about)"
+    r"\s+(?:(?:is|are|do|does|we|i)\s+)?(?:our|my|the business'?s?|the company'?s?|the brand'?s?)\s+"
+)
+# Words that may surround the field keywords without narrowing the question
+FIELD_MODIFIERS = {"key", "main", "core", "current", "target", "brand", "ideal", "typical", "overall", "all", "and", "&"}
+
+FIELD_TITLES = {
+    "brand_voice": "Brand Voice",
+    "key_products": "Key Products / Services",
+    "offers": "Current Offers",
+    "audience": "Target Audience",
+}
+
+
+def _sample_texts(texts: List[str], budget: int = DIGEST_CONTEXT_CHARS) -> str:
+    """Evenly spaced chunks up to the character budget, so large uploads are covered end to end."""
+    if not texts:
+        return ""
+    per_chunk = max(1, sum(len(t) for t in texts) // budget + 1)
+    picked, used = [], 0
+    for text in texts[::per_chunk]:
+        if used + len(text) > budget:
+            break
+        picked.append(text)
+        used += len(text)
+    return "\n\n".join(picked)
+
+
+def build_digest(texts: List[str], previous: Optional[dict] = None) -> Optional[dict]:
+    """
+    Summarise uploaded business documents into a compact profile
+    (brand_voice, key_products, offers, audience). Runs once per ingestion.
+    When a previous digest exists it is updated rather than replaced.
+    """
+    sample = _sample_texts(texts)
+    if not sample:
+        return previous
+
+    groq_api_key = os.getenv("GROQ_API_KEY")
+    if not groq_api_key:
+        print("[WARN] GROQ_API_KEY not set; skipping business digest.")
+        return previous
+
+    previous_block = f"Existing profile (update it, keep what still holds):\n{json.dumps(previous, indent=2)}\n" if previous else ""
+    prompt = f"""
+You are building a compact business profile from the company's own documents.
+{previous_block}
+Documents:
+\"\"\"{sample}\"\"\"
+
+Return JSON only, with exactly these keys:
+- brand_voice: 1-3 sentences on tone and style
+- key_products: list of the main products or services (max 10, short phrases)
+- offers: list of current offers, discounts or promotions (empty list if none)
+- audience: 1-2 sentences on who the customers are
+Use only facts from the documents. Do not invent details.
+"""
+    try:
+        llm = get_chat_model(DIGEST_MODEL)
+        raw = llm.invoke([prompt]).content
+        match = re.search(r"```(?:json)?(.*?)```", raw, re.DOTALL)
+        if match:
+            raw = match.group(1)
+        data = json.loads(raw.strip())
+    except Exception as e:
+        print(f"[WARN] Failed to build business digest: {e}")
+        return previous
+
+    digest = {field: data.get(field) for field in PROFILE_FIELDS if data.get(field)}
+    print(f"[INFO] Built business digest with fields: {list(digest)}")
+    return digest or previous
+
+
+def match_digest_fields(query: str) -> List[str]:
+    """
+    Profile fields a whole-field question is asking about, e.g. ["key_products"] for
+    "what are our key products?". Empty if the query needs full retrieval.
+    """
+    q = query.lower()
+    question = PROFILE_QUESTION.match(q)
+    if not question:
+        return []
+    rest = re.sub(r"[?.!,;:]", " ", q[question.end():])
+    fields = []
+    for field, keywords in PROFILE_FIELDS.items():
+        for keyword in sorted(keywords, key=len, reverse=True):
+            pattern = rf"\b{re.escape(keyword)}s?\b"
+            if re.search(pattern, rest):
+                rest = re.sub(pattern, " ", rest)
+                if field not in fields:
+                    fields.append(field)
+    # Any other word is a qualifier the four-field digest can't answer
+    if any(word not in FIELD_MODIFIERS for word in rest.split()):
+        return []
+    return fields
+
+
+def format_digest_answer(digest: dict, fields: List[str]) -> Optional[str]:
+    """Render the requested profile fields, or None if the digest doesn't cover them."""
+    parts = []
+    for field in fields:
+        value = digest.get(field)
+        if not value:
+            return None  # a requested field is missing, let full RAG answer
+        if isinstance(value, list):
+            value = "\n".join(f"- {item}" for item in value)
+        parts.append(f"{FIELD_TITLES[field]}:\n{value}")
+    return "\n\n".join(parts) if parts else None
+
+
+def format_digest_context(digest: Optional[dict]) -> Optional[str]:
+    """Every field the digest has, as a block to put in front of the retrieved chunks."""
+    if not digest:
+        return None
+    return format_digest_answer(digest, [field for field in PROFILE_FIELDS if digest.get(field)])
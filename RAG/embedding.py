@@ -2,13 +2,24 @@ from typing import List, Any
 from langchain_text_splitters import RecursiveCharacterTextSplitter
 from sentence_transformers import SentenceTransformer
 import numpy as np
+import threading
+
+_models = {}
+_models_lock = threading.Lock()
+
+def get_embedding_model(model_name: str) -> SentenceTransformer:
+    """One SentenceTransformer per model name per process, shared by every store and pipeline."""
+    with _models_lock:
+        if model_name not in _models:
+            _models[model_name] = SentenceTransformer(model_name)
+            print(f"[INFO] Loaded embedding model: {model_name}")
+        return _models[model_name]
 
 class EmbeddingPipeline:
     def __init__(self, model_name: str = "all-MiniLM-L6-v2", chunk_size: int = 1000, chunk_overlap: int = 200):
         self.chunk_size = chunk_size
         self.chunk_overlap = chunk_overlap
-        self.model = SentenceTransformer(model_name)
-        print(f"[INFO] Loaded embedding model: {model_name}")
+        self.model = get_embedding_model(model_name)
 
     def chunk_documents(self, documents: List[Any]) -> List[Any]:
         splitter = RecursiveCharacterTextSplitter(
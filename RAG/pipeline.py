@@ -1,30 +1,34 @@
-from typing import List, Any
+from typing import List, Any, Iterable
 from sqlalchemy.orm import Session
 import uuid
 import os
+from datetime import datetime
+from itertools import islice
 import numpy as np
 
-from RAG.data_loader import load_documents_from_paths
-from RAG.vectorstore import FaissVectorStore
+from RAG.data_loader import iter_documents_from_paths
+from RAG.vectorstore import FaissVectorStore, build_chunk_metadata
 from RAG.embedding import EmbeddingPipeline
+from RAG.digest import build_digest
 
+# Documents are chunked and embedded this many at a time, so a large export
+# (product feed, post history) never has to be held in memory all at once.
+INGEST_BATCH_DOCUMENTS = 256
 
-def process_documents(bid: Any, file_paths: List[str], persist_directory: str = None):
+
+def process_documents(bid: Any, file_paths: Iterable[str], persist_directory: str = None, with_digest: bool = True):
     """
     Process a list of files for a specific Business ID (bid).
-    1. Load documents
-    2. Chunk and Embed
-    3. Store in bid-specific VectorStore
+    `file_paths` may be a generator (e.g. entries extracted from an uploaded archive);
+    if it raises midway nothing is saved, so a rejected upload never publishes a partial index.
+    1. Stream documents (whole-file formats are parsed in parallel)
+    2. Chunk and Embed (in batches of INGEST_BATCH_DOCUMENTS)
+    3. Build/refresh the business digest (skipped with with_digest=False, e.g. for industry corpora)
+    4. Store in bid-specific VectorStore
     """
-    print(f"[INFO] Processing {len(file_paths)} files for BID {bid}...")
-    
-    # 1. Load
-    docs = load_documents_from_paths(file_paths)
-    if not docs:
-        print("[WARN] No documents loaded.")
-        return 0
+    print(f"[INFO] Processing {len(file_paths) if hasattr(file_paths, '__len__') else 'streamed'} files for BID {bid}...")
 
-    # 2. Setup Pipeline Components
+    # 1. Setup Pipeline Components
     # Note: Using default model/chunk settings from vectorstore/embedding classes
     # If persist_directory is explicit, use it. Otherwise rely on default or implicit logic.
     if persist_directory:
@@ -42,30 +46,43 @@ def process_documents(bid: Any, file_paths: List[str], persist_directory: str =
                                  chunk_size=store.chunk_size, 
                                  chunk_overlap=store.chunk_overlap)
 
-    # 3. Chunk
-    print("[INFO] Chunking documents...")
-    chunks = emb_pipe.chunk_documents(docs)
-    if not chunks:
-        print("[WARN] No chunks generated.")
-        return 0
-
-    # 4. Embed
-    print(f"[INFO] Embedding {len(chunks)} chunks...")
-    embeddings = emb_pipe.embed_chunks(chunks)
-
-    # 5. Store in FAISS
     start_idx = 0
     if store.index is not None:
         start_idx = store.index.ntotal
-    
-    # Prepare metadata for FAISS (keeping it simple for retrieval)
-    faiss_metadatas = [{"text": chunk.page_content, "source": chunk.metadata.get("source", "")} for chunk in chunks]
-    
-    store.add_embeddings(np.array(embeddings).astype('float32'), faiss_metadatas)
+
+    # 2. Load -> Chunk -> Embed -> add to FAISS, one batch of documents at a time
+    # Metadata: text for retrieval + source/page/file_type/ingested_at for filtering
+    ingested_at = datetime.now().isoformat()
+    documents = iter_documents_from_paths(file_paths)
+    total_chunks = 0
+    while True:
+        batch = list(islice(documents, INGEST_BATCH_DOCUMENTS))
+        if not batch:
+            break
+        chunks = emb_pipe.chunk_documents(batch)
+        if not chunks:
+            continue
+        print(f"[INFO] Embedding {len(chunks)} chunks...")
+        embeddings = emb_pipe.embed_chunks(chunks)
+        faiss_metadatas = [build_chunk_metadata(chunk, ingested_at) for chunk in chunks]
+        store.add_embeddings(np.array(embeddings).astype('float32'), faiss_metadatas)
+        total_chunks += len(chunks)
+
+    if not total_chunks:
+        print("[WARN] No documents loaded or no chunks generated.")
+        return 0
+
+    # 3. Compact profile (brand voice, products, offers, audience) saved in the same snapshot,
+    # so common retrievals can be answered without a search + LLM round trip.
+    if with_digest:
+        print("[INFO] Updating business digest...")
+        store.digest = build_digest([m["text"] for m in store.metadata[start_idx:]], previous=store.digest)
+
+    # 4. Publish
     store.save()
 
-    # 6. Store in SQL DB (DocDetails) - REMOVED
+    # 5. Store in SQL DB (DocDetails) - REMOVED
     
-    print(f"[INFO] Successfully processed {len(chunks)} chunks for BID {bid}.")
+    print(f"[INFO] Successfully processed {total_chunks} chunks for BID {bid}.")
         
-    return len(chunks)
+    return total_chunks
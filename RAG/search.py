@@ -13,7 +13,7 @@ except ImportError:
     # Fallback for direct script execution if package structure isn't recognized
     from vectorstore import FaissVectorStore
 
-from langchain_groq import ChatGroq
+from llm_client import get_chat_model
 
 # Load .env explicitly from the project root
 project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
@@ -45,7 +45,7 @@ class RAGSearch:
         if not groq_api_key:
              print("[WARN] GROQ_API_KEY not found in environment variables.")
              
-        self.llm = ChatGroq(groq_api_key=groq_api_key, model_name=llm_model)
+        self.llm = get_chat_model(llm_model)
         print(f"[INFO] Groq LLM initialized: {llm_model}")
 
     def search_and_summarize(self, query: str, top_k: int = 5) -> str:
@@ -1,10 +1,11 @@
 from typing import Optional
 from langchain.tools import tool
-from sqlalchemy.orm import Session
-from database import SessionLocal
-from models import BusinessInfo
+from tenant_cache import tenant_cache
 from RAG.vectorstore import FaissVectorStore
+from RAG.digest import match_digest_fields, format_digest_answer, format_digest_context
 import os
+import threading
+from contextlib import contextmanager
 
 # Base paths - typically these would be configured in environment or passed in, 
 # but for now we hardcode relative to the project structure as requested.
@@ -15,7 +16,60 @@ PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 PDFS_VECTORIZED_DIR = os.path.join(PROJECT_ROOT, "RAG", "pdfs_vectorized")
 USER_DOCS_STORE_DIR = os.path.join(PROJECT_ROOT, "faiss_store") # RAG/vectorstore.py default is "faiss_store", let's check exact logic.
 
-def search_social_sphere_context(bid: int, query: str) -> str:
+# Industry corpora are read-only and identical for every tenant, so each process keeps one
+# memory-mapped handle per industry instead of re-reading the index on every query.
+# A handle is never reloaded in place: a newly published snapshot gets a new store object, and
+# the old one keeps its lease (so GC leaves its files alone) until the last query using it ends.
+_industry_stores = {}
+_industry_stores_lock = threading.Lock()
+
+class _SharedStore:
+    __slots__ = ("store", "users", "retired")
+
+    def __init__(self, store: FaissVectorStore):
+        self.store = store
+        self.users = 0  # queries currently running against this snapshot
+        self.retired = False  # superseded by a newer snapshot
+
+@contextmanager
+def industry_store(industry: str):
+    """Shared read-only store for an industry corpus, pinned to one snapshot for the whole block."""
+    with _industry_stores_lock:
+        shared = _industry_stores.get(industry)
+        if shared is None or shared.store.current_version() != shared.store.loaded_version:
+            store = FaissVectorStore(bid=industry, persist_dir=PDFS_VECTORIZED_DIR, read_only=True)
+            store.load()
+            if shared is not None:
+                shared.retired = True
+                if not shared.users:
+                    shared.store.release()
+            shared = _industry_stores[industry] = _SharedStore(store)
+        shared.users += 1
+    try:
+        yield shared.store
+    finally:
+        with _industry_stores_lock:
+            shared.users -= 1
+            if shared.retired and not shared.users:
+                shared.store.release()
+
+def lookup_business_digest(bid: int, query: str) -> Optional[str]:
+    """
+    Answer a generic profile question (brand voice, products, offers, audience) straight from
+    the business digest built at ingestion. Returns None when the query needs full retrieval.
+    """
+    fields = match_digest_fields(query)
+    if not fields:
+        return None
+    digest = FaissVectorStore(bid=bid, persist_dir=USER_DOCS_STORE_DIR).read_digest()
+    if not digest:
+        return None
+    answer = format_digest_answer(digest, fields)
+    if answer:
+        print(f"[TOOL] Answered from digest for BID: {bid}, fields: {fields}")
+    return answer
+
+def search_social_sphere_context(bid: int, query: str, filters: Optional[dict] = None) -> str:
     """
     Search for context related to a business query.
     Combines insights from broad industry knowledge (PDFs) and specific business documents.
@@ -23,28 +77,28 @@ def search_social_sphere_context(bid: int, query: str) -> str:
     Args:
         bid: Business ID to scope the search.
         query: The search query string.
+        filters: Optional metadata filters for the business documents
+            (source, file_type, uploaded_after, uploaded_before).
+            When given, only the business's own documents are searched.
     """
-    print(f"[TOOL] Searching context for BID: {bid}, Query: '{query}'")
+    print(f"[TOOL] Searching context for BID: {bid}, Query: '{query}', Filters: {filters}")
     
-    # 1. Get Industry from DB
-    db: Session = SessionLocal()
+    # 1. Get Industry (tenant cache, DB on a miss)
     industry: Optional[str] = None
     try:
-        business_info = db.query(BusinessInfo).filter(BusinessInfo.bid == bid).first()
-        if business_info:
-            industry = business_info.industry
+        profile = tenant_cache.get_by_bid(bid)
+        if profile and profile.industry:
+            industry = profile.industry
             print(f"[TOOL] Found Industry: {industry}")
         else:
             print(f"[TOOL] properties not found for BID {bid}")
     except Exception as e:
         print(f"[TOOL] DB Error: {e}")
-    finally:
-        db.close()
 
     context_parts = []
 
-    # 2. Context 1: Industry PDFs
-    if industry:
+    # 2. Context 1: Industry PDFs (skipped when the caller asked for specific business documents)
+    if industry and not filters:
         # The folder name might need sanitization or matching. Assuming direct match for now.
         # RAG/pdfs_vectorized/<Industry>
         # FaissVectorStore expects 'persist_dir' to be the PARENT of the specific index if 'bid' is passed, 
@@ -54,19 +108,16 @@ def search_social_sphere_context(bid: int, query: str) -> str:
         # So we can pass persist_dir=PDFS_VECTORIZED_DIR and bid=industry (if industry is used as folder name)
         
         try:
-            # We treat 'industry' as the 'bid' (ID) for the vector store logic to point to the right subfolder
-            industry_store = FaissVectorStore(bid=industry, persist_dir=PDFS_VECTORIZED_DIR)
-            try:
-                industry_store.load()
-                results = industry_store.query(query, top_k=3)
-                if results:
-                    texts = [r["metadata"].get("text", "") for r in results if r.get("metadata")]
-                    if texts:
-                        context_parts.append(f"--- Industry Context ({industry}) ---\n" + "\n".join(texts))
-            except Exception as e:
-                print(f"[TOOL] Industry vector store not found/loaded: {e}")
+            # We treat 'industry' as the 'bid' (ID) for the vector store logic to point to the right subfolder.
+            # The mapped snapshot stays leased for as long as this process serves from it.
+            with industry_store(industry) as store:
+                results = store.query(query, top_k=3)
+            if results:
+                texts = [r["metadata"].get("text", "") for r in results if r.get("metadata")]
+                if texts:
+                    context_parts.append(f"--- Industry Context ({industry}) ---\n" + "\n".join(texts))
         except Exception as e:
-            print(f"[TOOL] Error initializing industry store: {e}")
+            print(f"[TOOL] Industry vector store not found/loaded: {e}")
 
     # 3. Context 2: User Uploaded Docs
     try:
@@ -79,13 +130,17 @@ def search_social_sphere_context(bid: int, query: str) -> str:
         user_store_path = os.path.join(PROJECT_ROOT, "faiss_store")
         user_store = FaissVectorStore(bid=bid, persist_dir=user_store_path)
         try:
-            user_store.load()
-            results = user_store.query(query, top_k=3)
+            with user_store.pinned():
+                results = user_store.query(query, top_k=3, filters=filters)
+            profile = format_digest_context(user_store.digest) if not filters else None
+            if profile:
+                # The business profile goes first, ahead of industry and document chunks
+                context_parts.insert(0, f"--- Business Profile ---\n{profile}")
             if results:
                 texts = [r["metadata"].get("text", "") for r in results if r.get("metadata")]
                 if texts:
                     context_parts.append(f"--- Business Specific Context ---\n" + "\n".join(texts))
-        except Exception:
+        except Exception as e:
             # User context is optional. If not found, we simply skip it.
             # This is expected behavior for businesses that haven't uploaded documents yet.
             print(f"[TOOL] User vector store not found/loaded: {e}")
@@ -126,15 +126,15 @@ def fetch_todays_emails(bid: int, db: Session):
         print(f"Error fetching emails: {e}")
         raise e
 
-from langchain_groq import ChatGroq
+from llm_client import get_chat_model
 
 def get_groq_llm():
-    """Initializes Groq LLM."""
+    """Shared Groq LLM."""
     api_key = os.getenv("GROQ_API_KEY")
     if not api_key:
         print("Warning: GROQ_API_KEY not found.")
         return None
-    return ChatGroq(groq_api_key=api_key, model_name="openai/gpt-oss-120b")
+    return get_chat_model("openai/gpt-oss-120b")
 
 def summarize_emails_with_groq(email_text_blob: str):
     """Summarizes email text using Groq."""
@@ -0,0 +1,168 @@
+import asyncio
+import os
+from collections import deque
+from typing import Callable, List, Optional
+from loguru import logger
+from database import SessionLocal
+from tenant_cache import tenant_cache
+
+# Defaults, overridable from .env
+HISTORY_FLUSH_INTERVAL_SECONDS = float(os.getenv("HISTORY_FLUSH_INTERVAL_SECONDS", 1.0))
+HISTORY_BATCH_SIZE = int(os.getenv("HISTORY_BATCH_SIZE", 200))
+HISTORY_MAX_QUEUED = int(os.getenv("HISTORY_MAX_QUEUED", 10000))
+HISTORY_WRITE_ATTEMPTS = 3
+
+
+class _Record:
+    __slots__ = ("row", "bid", "on_flushed")
+
+    def __init__(self, row, bid, on_flushed):
+        self.row = row  # model instance, built by log() so bad fields fail at the call site
+        self.bid = bid
+        self.on_flushed = on_flushed
+
+
+class HistoryWriter:
+    """
+    Write-behind logging of ChatHistory / PostHistory rows.
+
+    `log()` only appends the row to an in-memory queue, so request handlers and tools never
+    wait on a SQLite commit. A background task (started on first use) writes the queue in
+    batches, one transaction per batch, from a worker thread; if a batch can't be written, its
+    rows are retried one by one so a single bad row doesn't take the others with it. Rows logged
+    by business id get their username resolved at flush time from the tenant cache.
+    `start()` binds the writer to the running event loop (it is also started on first use);
+    `stop()` drains whatever is still queued (application / MCP server shutdown).
+    """
+
+    def __init__(self, flush_interval: float = HISTORY_FLUSH_INTERVAL_SECONDS,
+                 batch_size: int = HISTORY_BATCH_SIZE, max_queued: int = HISTORY_MAX_QUEUED):
+        self.flush_interval = flush_interval
+        self.batch_size = max(1, batch_size)
+        self.max_queued = max_queued
+        self._queue = deque()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._wakeup: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+        self._stopping = False
+        self.written = 0
+        self.batches = 0
+        self.dropped = 0
+
+    def start(self):
+        """Start the background flusher on the running event loop."""
+        self._loop = asyncio.get_running_loop()
+        self._ensure_running()
+
+    def log(self, model, *, bid=None, on_flushed: Optional[Callable[[], None]] = None, **fields):
+        """
+        Queue one `model(**fields)` row. Without a `username`, it is looked up from `bid`.
+        `on_flushed` is called (on the event loop) once the row is committed.
+        Raises TypeError right away for fields the model doesn't have.
+        """
+        record = _Record(model(**fields), bid, on_flushed)
+        try:
+            asyncio.get_running_loop()
+        except RuntimeError:
+            # Called from a worker thread: hand the row over to the writer's loop
+            if self._loop is None:
+                raise RuntimeError("HistoryWriter.log() called outside the event loop before start()")
+            self._loop.call_soon_threadsafe(self._enqueue, record)
+            return
+        self._enqueue(record)
+
+    def _enqueue(self, record: _Record):
+        if len(self._queue) >= self.max_queued:
+            self.dropped += 1
+            logger.error(f"History queue full, dropped a {type(record.row).__name__} row")
+            return
+        self._queue.append(record)
+        self._ensure_running()
+        if len(self._queue) >= self.batch_size:
+            self._wakeup.set()
+
+    def _ensure_running(self):
+        if self._task is None or self._task.done():
+            self._loop = asyncio.get_running_loop()
+            self._wakeup = asyncio.Event()
+            self._task = asyncio.create_task(self._run())
+
+    async def _run(self):
+        while not self._stopping:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            await self.flush()
+
+    async def flush(self):
+        """Write everything queued so far, in batches."""
+        while self._queue:
+            batch = [self._queue.popleft() for _ in range(min(self.batch_size, len(self._queue)))]
+            written = await self._write_batch(batch)
+            self.written += len(written)
+            self.batches += 1
+            for record in written:
+                if record.on_flushed:
+                    try:
+                        record.on_flushed()
+                    except Exception as e:
+                        logger.error(f"History flush callback failed: {e}")
+
+    async def _write_batch(self, batch: List[_Record]) -> List[_Record]:
+        """Write the batch in one transaction (a few attempts), else row by row. Returns the rows written."""
+        for attempt in range(1, HISTORY_WRITE_ATTEMPTS + 1):
+            try:
+                await asyncio.to_thread(self._write, batch)
+                return batch
+            except Exception as e:
+                logger.warning(f"History batch write failed (attempt {attempt}): {e}")
+                if attempt < HISTORY_WRITE_ATTEMPTS:
+                    await asyncio.sleep(0.5 * attempt)
+
+        written = []
+        for record in batch:
+            try:
+                await asyncio.to_thread(self._write, [record])
+                written.append(record)
+            except Exception as e:
+                self.dropped += 1
+                logger.error(f"Dropped a {type(record.row).__name__} history row: {e}")
+        return written
+
+    def _write(self, batch: List[_Record]):
+        with SessionLocal() as db:
+            for record in batch:
+                if not record.row.username:
+                    profile = tenant_cache.get_by_bid(record.bid)
+                    record.row.username = (profile.email if profile else None) or f"Unknown_bid_{record.bid}"
+            db.add_all([record.row for record in batch])
+            db.commit()
+            # Detached from the closed session, so a row can be written again by the row-by-row fallback
+            db.expunge_all()
+
+    async def stop(self):
+        """Stop the background task and write out the rest of the queue."""
+        task, self._task = self._task, None
+        pending = len(self._queue)
+        if task is not None:
+            # Let an in-progress batch finish rather than cancelling it halfway through
+            self._stopping = True
+            self._wakeup.set()
+            await asyncio.gather(task, return_exceptions=True)
+            self._stopping = False
+        await self.flush()
+        if pending:
+            logger.info(f"✅ History writer drained {pending} queued rows.")
+
+    def metrics(self) -> dict:
+        return {
+            "queued": len(self._queue),
+            "written": self.written,
+            "batches": self.batches,
+            "dropped": self.dropped,
+        }
+
+
+history_writer = HistoryWriter()
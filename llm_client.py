@@ -0,0 +1,91 @@
+import os
+import threading
+from typing import Optional
+import httpx
+from dotenv import load_dotenv
+from groq import AsyncGroq
+from langchain_groq import ChatGroq
+
+load_dotenv()
+
+# Defaults, overridable from .env
+GROQ_TIMEOUT_SECONDS = float(os.getenv("GROQ_TIMEOUT_SECONDS", 60))
+GROQ_CONNECT_TIMEOUT_SECONDS = float(os.getenv("GROQ_CONNECT_TIMEOUT_SECONDS", 10))
+GROQ_MAX_RETRIES = int(os.getenv("GROQ_MAX_RETRIES", 2))
+GROQ_MAX_CONNECTIONS = int(os.getenv("GROQ_MAX_CONNECTIONS", 50))
+GROQ_KEEPALIVE_CONNECTIONS = int(os.getenv("GROQ_KEEPALIVE_CONNECTIONS", 20))
+GROQ_KEEPALIVE_SECONDS = float(os.getenv("GROQ_KEEPALIVE_SECONDS", 60))
+
+_lock = threading.Lock()
+_http_client: Optional[httpx.Client] = None
+_async_http_client: Optional[httpx.AsyncClient] = None
+_async_groq: Optional[AsyncGroq] = None
+_chat_models = {}  # model -> ChatGroq
+
+
+def _timeout() -> httpx.Timeout:
+    return httpx.Timeout(GROQ_TIMEOUT_SECONDS, connect=GROQ_CONNECT_TIMEOUT_SECONDS)
+
+
+def _limits() -> httpx.Limits:
+    return httpx.Limits(
+        max_connections=GROQ_MAX_CONNECTIONS,
+        max_keepalive_connections=GROQ_KEEPALIVE_CONNECTIONS,
+        keepalive_expiry=GROQ_KEEPALIVE_SECONDS,
+    )
+
+
+def _http_clients():
+    """The process-wide connection pools (created on first use). Returns (sync, async)."""
+    global _http_client, _async_http_client
+    with _lock:
+        if _http_client is None:
+            _http_client = httpx.Client(timeout=_timeout(), limits=_limits())
+            _async_http_client = httpx.AsyncClient(timeout=_timeout(), limits=_limits())
+    return _http_client, _async_http_client
+
+
+def get_async_groq() -> AsyncGroq:
+    """Shared async Groq SDK client; awaiting it needs no worker thread."""
+    global _async_groq
+    _, async_http_client = _http_clients()
+    with _lock:
+        if _async_groq is None:
+            _async_groq = AsyncGroq(api_key=os.getenv("GROQ_API_KEY"), http_client=async_http_client,
+                                    timeout=_timeout(), max_retries=GROQ_MAX_RETRIES)
+    return _async_groq
+
+
+def get_chat_model(model: str) -> ChatGroq:
+    """
+    LangChain chat model for `model`, built once per process and reused by every caller.
+    All models share the same pooled HTTP connections, so only the first request pays for
+    the TCP/TLS handshake.
+    """
+    chat_model = _chat_models.get(model)
+    if chat_model is not None:
+        return chat_model
+    http_client, async_http_client = _http_clients()
+    chat_model = ChatGroq(
+        model=model,
+        groq_api_key=os.getenv("GROQ_API_KEY"),
+        request_timeout=_timeout(),
+        max_retries=GROQ_MAX_RETRIES,
+        http_client=http_client,
+        http_async_client=async_http_client,
+    )
+    with _lock:
+        return _chat_models.setdefault(model, chat_model)
+
+
+async def aclose():
+    """Close the pooled connections (application shutdown)."""
+    global _http_client, _async_http_client, _async_groq
+    with _lock:
+        http_client, async_http_client = _http_client, _async_http_client
+        _http_client = _async_http_client = _async_groq = None
+        _chat_models.clear()
+    if async_http_client is not None:
+        await async_http_client.aclose()
+    if http_client is not None:
+        http_client.close()
@@ -17,14 +17,22 @@ pwd_context = CryptContext(schemes=["pbkdf2_sha256"], deprecated="auto")
 
 from contextlib import asynccontextmanager
 from Agents.agent_service import agent_service
+from history_writer import history_writer
+from tenant_cache import tenant_cache
+import llm_client
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     # Startup: Start Agent Service
     await agent_service.start()
+    history_writer.start()
+    await job_runner.start()
     yield
     # Shutdown: Stop Agent Service
+    await job_runner.stop()
+    await history_writer.stop()
     await agent_service.stop()
+    await llm_client.aclose()
 
 from starlette.middleware.sessions import SessionMiddleware
 from fastapi import Request
@@ -140,6 +148,9 @@ def register_user(user: schemas.UserRegister, db: Session = Depends(get_db)):
         print(f"Database Commit Error: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Database error: {str(e)}")
 
+    # Drop anything cached for this bid/email (e.g. from before a retried registration)
+    tenant_cache.invalidate(bid=bid, email=user.Email)
+
     return {"message": "User registered successfully", "bid": bid}
 
 @app.post("/login")
@@ -213,27 +224,39 @@ import shutil
 import os
 from RAG.pipeline import process_documents
 from RAG.vectorstore import FaissVectorStore
+from RAG.archive import UploadBudget, UploadBudgetExceeded, is_archive, iter_archive_files, save_stream
 from dotenv import load_dotenv
 load_dotenv()
+
+# Per-request ingestion budget (replaces the old 10-file cap). Archive entries count
+# individually, and sizes are measured uncompressed.
+UPLOAD_MAX_FILES = int(os.getenv("UPLOAD_MAX_FILES", 500))
+UPLOAD_MAX_MB = int(os.getenv("UPLOAD_MAX_MB", 200))
+
 @app.post("/upload-documents/{bid}")
 def upload_documents(bid: int, files: List[UploadFile] = File(...), db: Session = Depends(get_db)):
-    if len(files) > 10:
-        raise HTTPException(status_code=400, detail="Maximum 10 files allowed.")
-    
-    saved_files = []
+    """
+    Ingest documents for a business. Accepts individual files and/or zip/tar archives;
+    archives are extracted entry by entry and every entry is handed to the loaders as
+    soon as it is written, so parsing overlaps with extraction.
+    """
+    budget = UploadBudget(max_files=UPLOAD_MAX_FILES, max_bytes=UPLOAD_MAX_MB * 1024 * 1024)
     temp_dir = f"temp_uploads_{bid}"
     os.makedirs(temp_dir, exist_ok=True)
-    
-    try:
+
+    def upload_paths():
         for file in files:
-            file_path = os.path.join(temp_dir, file.filename)
-            with open(file_path, "wb") as buffer:
-                shutil.copyfileobj(file.file, buffer)
-            saved_files.append(file_path)
-            
-        count = process_documents(bid, saved_files)
-        return {"message": "Documents processed successfully", "chunks_added": count}
-        
+            if is_archive(file.filename):
+                yield from iter_archive_files(file.file, file.filename, temp_dir, budget)
+            else:
+                yield save_stream(file.file, file.filename, temp_dir, budget)
+
+    try:
+        count = process_documents(bid, upload_paths())
+        return {"message": "Documents processed successfully", "chunks_added": count, "files_processed": budget.files}
+
+    except UploadBudgetExceeded as e:
+        raise HTTPException(status_code=413, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
         
@@ -370,8 +393,8 @@ def get_daily_stats(bid: int, db: Session = Depends(get_db)):
     """
     try:
         # 1. Get user email for this bid to filter history
-        user = db.query(models.UserCredentials).filter(models.UserCredentials.bid == bid).first()
-        if not user:
+        user = tenant_cache.get_by_bid(bid)
+        if not user or not user.email:
             # Fallback if no user found (shouldn't happen for valid bid views)
             return {"posts_generated": 0, "posters_created": 0}
         
@@ -421,8 +444,8 @@ def get_calendar_stats(bid: int, db: Session = Depends(get_db)):
     """
     try:
         # 1. Get user email
-        user = db.query(models.UserCredentials).filter(models.UserCredentials.bid == bid).first()
-        if not user:
+        user = tenant_cache.get_by_bid(bid)
+        if not user or not user.email:
              logger.warning(f"Calendar Stats: No user found for BID {bid}")
              return {}
         
@@ -467,21 +490,31 @@ def get_calendar_stats(bid: int, db: Session = Depends(get_db)):
 # MCP Agent Endpoint
 # ---------------------------------------------------------------------
 from pydantic import BaseModel
+from fastapi.responses import StreamingResponse
+import asyncio
+import json
 from Agents.agent_service import agent_service
+from Agents.scheduler import AgentBusy
+
+# Seconds clients are told to wait before retrying when the agent is at capacity
+AGENT_BUSY_RETRY_AFTER_SECONDS = 5
 
 class AgentRequest(BaseModel):
     query: str
 
-@app.post("/agent/chat")
-async def chat_with_agent(request: AgentRequest, req: Request):
-    """
-    Endpoint to interact with the AI Agent (MCP + Groq).
-    Uses backend session to provide context (bid, tokens, etc.) to the agent.
-    """
-    if not request.query:
-        raise HTTPException(status_code=400, detail="Query is required")
-    
-    # Extract Context from Session
+@app.get("/agent/metrics")
+def agent_metrics():
+    """Agent pool size, hit/miss and eviction counters, MCP worker state and run queue depth."""
+    return {**agent_service.metrics(), "jobs": job_runner.metrics(), "history": history_writer.metrics(),
+            "tenant_cache": tenant_cache.metrics()}
+
+@app.get("/agent/traces")
+def agent_traces(limit: int = 20):
+    """Recent agent run traces (newest first: phases, LLM steps, tool calls) and p50/p95 latency per tool and model."""
+    return {"traces": agent_service.tracer.recent(limit), "latency": agent_service.tracer.stats()}
+
+def _agent_context(req: Request):
+    """Extract the agent context (bid, email, connector ids/tokens) from the backend session."""
     user_session = req.session.get("user", {})
     bid = req.session.get("bid")
     
@@ -497,45 +530,145 @@ async def chat_with_agent(request: AgentRequest, req: Request):
         "instagram_token": user_session.get("instagramApiKey"), # Assuming UI maps this key
         "linkedin_token": user_session.get("linkedinAccessToken")
     }
+    return user_session, bid, context
+
+def _log_chat_turn(user_session: dict, bid, query: str, response_text: str):
+    """Queue one agent turn for ChatHistory; the user's rolling summary is refreshed once it is written."""
+    try:
+        # Basic logic to detect if "posted" (very naive, can be improved)
+        is_posted = "Successfully Published" in response_text or "Successfully posted" in response_text
+        email = user_session.get("email")
+
+        # Written in the background (batched), so the response doesn't wait on the commit
+        history_writer.log(
+            models.ChatHistory,
+            on_flushed=lambda: agent_service.schedule_summary_update(email),
+            username=email or f"Unknown_bid_{bid}",
+            input_message=query,
+            agent_response=response_text,
+            image_url=None,
+            timestamp=datetime.now().isoformat(),
+            posted=is_posted
+        )
+    except Exception as log_e:
+        logger.error(f"Failed to log chat history: {log_e}")
+
+@app.post("/agent/chat")
+async def chat_with_agent(request: AgentRequest, req: Request):
+    """
+    Endpoint to interact with the AI Agent (MCP + Groq).
+    Uses backend session to provide context (bid, tokens, etc.) to the agent.
+    """
+    if not request.query:
+        raise HTTPException(status_code=400, detail="Query is required")
+    
+    user_session, bid, context = _agent_context(req)
 
     try:
         # Run the agent asynchronously with context
         agent_res = await agent_service.run_query(request.query, context=context)
         response_text = str(agent_res)
         
-        # Log to ChatHistory
-        try:
-            # Re-obtain session since it's a dependency usually but we can use SessionLocal here manually 
-            # or refactor to inject db. simpler to just use SessionLocal for this side-effect.
-            # However, depends(get_db) is not in this async function signature.
-            db_log = SessionLocal()
-            
-            # Basic logic to detect if "posted" (very naive, can be improved)
-            is_posted = "Successfully Published" in response_text or "Successfully posted" in response_text
-            
-            # Attempt to extract image_url if present in response_text (simple check)
-            # This is heuristic. Ideally agent returns structured data.
-            # For now, we leave image_url null unless we find a clear url in the text? 
-            # or maybe the context had it? The prompt request said "Image url(url)".
-            # If the user SENT an image, we don't handle that yet in input. 
-            # usage: `1 explainableproject@gmail.com , {image_url} . text , timestamp , Facebook` in previous request.
-            # In this request: `Image url(url)`
-            # We will leave as None for now.
-            
-            chat_record = models.ChatHistory(
-                username=user_session.get("email") or f"Unknown_bid_{bid}",
-                input_message=request.query,
-                agent_response=response_text,
-                image_url=None, 
-                timestamp=datetime.now().isoformat(),
-                posted=is_posted
-            )
-            db_log.add(chat_record)
-            db_log.commit()
-            db_log.close()
-        except Exception as log_e:
-            logger.error(f"Failed to log chat history: {log_e}")
+        _log_chat_turn(user_session, bid, request.query, response_text)
 
         return {"response": response_text}
+    except AgentBusy as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": str(AGENT_BUSY_RETRY_AFTER_SECONDS)})
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Agent failed: {str(e)}")
+
+
+from typing import Optional
+from Agents.jobs import AgentJobRunner, JobQueueFull, InvalidCallbackUrl
+
+class AgentJobRequest(BaseModel):
+    query: str
+    callback_url: Optional[str] = None
+
+def _log_job_turn(job):
+    """Finished jobs are logged to ChatHistory like /agent/chat turns."""
+    _log_chat_turn({"email": job.username}, job.bid, job.query, job.result or job.error or "")
+
+job_runner = AgentJobRunner(agent_service.run_query, on_finished=_log_job_turn)
+
+@app.post("/agent/jobs", status_code=status.HTTP_202_ACCEPTED)
+async def submit_agent_job(request: AgentJobRequest, req: Request):
+    """
+    Queue an agent query and return its job id immediately.
+    Poll GET /agent/jobs/{job_id}, or pass callback_url to have the finished job POSTed to it.
+    """
+    if not request.query:
+        raise HTTPException(status_code=400, detail="Query is required")
+    user_session, bid, context = _agent_context(req)
+    if not context.get("email"):
+        raise HTTPException(status_code=401, detail="Not authenticated")
+
+    try:
+        job = await job_runner.submit(context["email"], bid, request.query, request.callback_url)
+    except InvalidCallbackUrl as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except JobQueueFull as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": str(AGENT_BUSY_RETRY_AFTER_SECONDS)})
+    return {"job_id": job["job_id"], "status": job["status"]}
+
+@app.get("/agent/jobs/{job_id}")
+def get_agent_job(job_id: str, req: Request):
+    """Status of a submitted job, with its result once it has finished."""
+    email = req.session.get("user", {}).get("email")
+    job = job_runner.get(job_id)
+    # Other users' jobs are reported as missing
+    if job is None or job.pop("username") != email:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
+
+# Seconds without agent activity before a keep-alive comment is sent, so proxies don't time out
+SSE_KEEPALIVE_SECONDS = 15
+
+@app.post("/agent/chat/stream")
+async def chat_with_agent_stream(request: AgentRequest, req: Request):
+    """
+    Streaming variant of /agent/chat (Server-Sent Events).
+    Emits `start` immediately, then `token`, `tool_start` and `tool_end` events as the agent
+    works, and finally `final` (same text /agent/chat returns) or `error`.
+    """
+    if not request.query:
+        raise HTTPException(status_code=400, detail="Query is required")
+
+    user_session, bid, context = _agent_context(req)
+
+    def sse(event: dict) -> str:
+        return f"event: {event['type']}\ndata: {json.dumps(event, default=str)}\n\n"
+
+    async def event_stream():
+        yield sse({"type": "start"})
+        queue = asyncio.Queue()
+
+        async def pump():
+            try:
+                async for event in agent_service.stream_query(request.query, context=context):
+                    await queue.put(event)
+            finally:
+                await queue.put(None)
+
+        task = asyncio.create_task(pump())
+        try:
+            while True:
+                try:
+                    event = await asyncio.wait_for(queue.get(), timeout=SSE_KEEPALIVE_SECONDS)
+                except asyncio.TimeoutError:
+                    yield ": keep-alive\n\n"
+                    continue
+                if event is None:
+                    break
+                if event["type"] == "final":
+                    _log_chat_turn(user_session, bid, request.query, str(event["response"]))
+                yield sse(event)
+        finally:
+            task.cancel()  # client went away: stop the agent run too
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
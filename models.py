@@ -67,3 +67,28 @@ class ChatHistory(Base):
     image_url = Column(String, nullable=True)
     timestamp = Column(String)
     posted = Column(Boolean, default=False)
+
+class ChatSummary(Base):
+    __tablename__ = "chat_summary"
+
+    id = Column(Integer, primary_key=True, index=True)
+    username = Column(String, unique=True, index=True) # email
+    summary = Column(String) # Rolling summary of the conversation so far
+    last_chat_id = Column(Integer, default=0) # Last ChatHistory.id folded into the summary
+    updated_at = Column(String)
+
+class AgentJob(Base):
+    __tablename__ = "agent_jobs"
+
+    id = Column(String, primary_key=True, index=True) # uuid4 hex
+    username = Column(String, index=True) # email of the submitting user
+    bid = Column(Integer, nullable=True)
+    query = Column(String)
+    callback_url = Column(String, nullable=True) # POSTed the job once it finishes
+    status = Column(String, index=True, default="queued") # queued | running | succeeded | failed
+    result = Column(String, nullable=True)
+    error = Column(String, nullable=True)
+    attempts = Column(Integer, default=0)
+    created_at = Column(String)
+    started_at = Column(String, nullable=True)
+    finished_at = Column(String, nullable=True)
@@ -0,0 +1,135 @@
+import os
+import threading
+import time
+from typing import Optional
+from database import SessionLocal
+import models
+
+# Defaults, overridable from .env
+# Other processes (the stdio tool servers) only see updates once their entry expires
+TENANT_CACHE_TTL_SECONDS = float(os.getenv("TENANT_CACHE_TTL_SECONDS", 300))
+TENANT_CACHE_MAX_ENTRIES = int(os.getenv("TENANT_CACHE_MAX_ENTRIES", 10000))
+
+
+class TenantProfile:
+    """What request paths need to know about a business: who it is and what it does."""
+
+    __slots__ = ("bid", "email", "industry", "business_name")
+
+    def __init__(self, bid: int, email: Optional[str], industry: Optional[str], business_name: Optional[str]):
+        self.bid = bid
+        self.email = email
+        self.industry = industry
+        self.business_name = business_name
+
+
+class TenantCache:
+    """
+    Process-wide TTL cache of tenant profiles (UserCredentials + BusinessInfo), by bid and by email.
+
+    Only found tenants are cached, so a business registered after a miss is seen on the next
+    lookup. Call `invalidate()` after changing a tenant's credentials or business info.
+    Safe to use from worker threads (RAG tools, the history writer).
+    """
+
+    def __init__(self, ttl: float = TENANT_CACHE_TTL_SECONDS, max_entries: int = TENANT_CACHE_MAX_ENTRIES):
+        self.ttl = ttl
+        self.max_entries = max(1, max_entries)
+        self._lock = threading.Lock()
+        self._by_bid = {}  # bid -> (TenantProfile, expires at)
+        self._bid_by_email = {}  # email -> bid
+        self.hits = 0
+        self.misses = 0
+
+    def get_by_bid(self, bid) -> Optional[TenantProfile]:
+        if bid is None:
+            return None
+        profile = self._cached(bid)
+        if profile is not None:
+            return profile
+        with SessionLocal() as db:
+            user = db.query(models.UserCredentials).filter(models.UserCredentials.bid == bid).first()
+            info = db.query(models.BusinessInfo).filter(models.BusinessInfo.bid == bid).first()
+            if user is None and info is None:
+                return None
+            profile = self._profile(bid, user, info)
+        self._store(profile)
+        return profile
+
+    def get_by_email(self, email: str) -> Optional[TenantProfile]:
+        if not email:
+            return None
+        email = email.lower()
+        with self._lock:
+            bid = self._bid_by_email.get(email)
+            if bid is None:
+                self.misses += 1
+        profile = self._cached(bid) if bid is not None else None
+        if profile is not None and profile.email == email:
+            return profile
+        with SessionLocal() as db:
+            user = db.query(models.UserCredentials).filter(models.UserCredentials.email == email).first()
+            if user is None:
+                return None
+            info = db.query(models.BusinessInfo).filter(models.BusinessInfo.bid == user.bid).first()
+            profile = self._profile(user.bid, user, info)
+        self._store(profile)
+        return profile
+
+    def invalidate(self, bid=None, email: Optional[str] = None):
+        """Drop the entries for `bid` and for `email`, including the bid the email was cached under."""
+        with self._lock:
+            bids = {bid} if bid is not None else set()
+            if email:
+                bid_of_email = self._bid_by_email.pop(email.lower(), None)
+                if bid_of_email is not None:
+                    bids.add(bid_of_email)
+            for stale in bids:
+                entry = self._by_bid.pop(stale, None)
+                if entry is not None and entry[0].email and self._bid_by_email.get(entry[0].email) == stale:
+                    del self._bid_by_email[entry[0].email]
+
+    def clear(self):
+        with self._lock:
+            self._by_bid.clear()
+            self._bid_by_email.clear()
+
+    @staticmethod
+    def _profile(bid, user, info) -> TenantProfile:
+        return TenantProfile(
+            bid=bid,
+            email=user.email.lower() if user is not None and user.email else None,
+            industry=info.industry if info is not None else None,
+            business_name=info.business_name if info is not None else None,
+        )
+
+    def _cached(self, bid) -> Optional[TenantProfile]:
+        with self._lock:
+            entry = self._by_bid.get(bid)
+            if entry is not None and entry[1] > time.monotonic():
+                self.hits += 1
+                self._by_bid[bid] = self._by_bid.pop(bid)  # most recently used last
+                return entry[0]
+            if entry is not None:
+                del self._by_bid[bid]
+            self.misses += 1
+            return None
+
+    def _store(self, profile: TenantProfile):
+        with self._lock:
+            self._by_bid.pop(profile.bid, None)
+            self._by_bid[profile.bid] = (profile, time.monotonic() + self.ttl)
+            if profile.email:
+                self._bid_by_email[profile.email] = profile.bid
+            while len(self._by_bid) > self.max_entries:
+                # Least recently used first: hits and reloads move an entry to the end
+                old_bid, (old, _) = next(iter(self._by_bid.items()))
+                del self._by_bid[old_bid]
+                if old.email and self._bid_by_email.get(old.email) == old_bid:
+                    del self._bid_by_email[old.email]
+
+    def metrics(self) -> dict:
+        return {"entries": len(self._by_bid), "hits": self.hits, "misses": self.misses, "ttl_seconds": self.ttl}
+
+
+tenant_cache = TenantCache()
@@ -0,0 +1,111 @@
+"""
+Regression checks for Agents/agent_pool.AgentPool eviction (LRU, idle TTL, memory cap and
+worker restarts), with fake agents (no LLM or MCP servers needed):
+    python verify_agent_pool.py
+"""
+import os
+import sys
+import time
+
+PROJECT_ROOT = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, PROJECT_ROOT)
+
+from Agents.agent_pool import AgentPool, AGENT_BASE_BYTES
+
+
+class FakeAgent:
+    """Stands in for MCPAgent: only its conversation history is measured."""
+
+    def __init__(self, history_chars=0):
+        self.history = ["x" * history_chars] if history_chars else []
+
+    def get_conversation_history(self):
+        return self.history
+
+
+def check_lru():
+    pool = AgentPool(max_size=2)
+    pool.put("a", FakeAgent())
+    pool.put("b", FakeAgent())
+    pool.get("a")  # "b" is now the least recently used
+    pool.put("c", FakeAgent())
+    metrics = pool.metrics()
+    if "a" in pool and "c" in pool and "b" not in pool and metrics["evictions"]["lru"] == 1 \
+            and (metrics["hits"], metrics["misses"]) == (1, 0):
+        print("✅ Least recently used agent evicted at max_size.")
+        return True
+    print(f"❌ LRU: sessions {list(pool._entries)}, metrics {metrics}")
+    return False
+
+
+def check_idle_ttl():
+    pool = AgentPool(idle_ttl=0.2)
+    pool.put("idle", FakeAgent())
+    pool.put("busy", FakeAgent())
+    time.sleep(0.12)
+    pool.get("busy")
+    time.sleep(0.12)
+    idle, busy = pool.get("idle"), pool.get("busy")
+    if idle is None and busy is not None and pool.evictions["ttl"] == 1 and len(pool) == 1:
+        print("✅ Idle agents expire after idle_ttl; recently used ones are kept.")
+        return True
+    print(f"❌ TTL: idle={idle is not None}, busy={busy is not None}, evictions {pool.evictions}")
+    return False
+
+
+def check_memory_cap():
+    ok = True
+    pool = AgentPool(max_bytes=int(AGENT_BASE_BYTES * 2.5))
+    for session_id in ("a", "b"):
+        pool.put(session_id, FakeAgent())
+    pool.put("c", FakeAgent())
+    if "a" in pool or pool.evictions["memory"] != 1 or pool.metrics()["approx_bytes"] > pool.max_bytes:
+        print(f"❌ Memory cap on put: sessions {list(pool._entries)}, metrics {pool.metrics()}")
+        ok = False
+
+    # A conversation growing past the cap evicts the others, never the agent that just ran
+    agent = pool.get("c")
+    agent.history.append("x" * AGENT_BASE_BYTES)
+    pool.update_size("c")
+    if list(pool._entries) != ["c"] or pool.evictions["memory"] != 2:
+        print(f"❌ Memory cap after growth: sessions {list(pool._entries)}, evictions {pool.evictions}")
+        ok = False
+    pool.put("d", FakeAgent())
+    if "d" not in pool or "c" in pool:
+        print(f"❌ New agent did not displace the oversized one: sessions {list(pool._entries)}")
+        ok = False
+    if pool.metrics()["approx_bytes"] != sum(entry.size_bytes for entry in pool._entries.values()):
+        print("❌ approx_bytes drifted from the sizes of the pooled agents.")
+        ok = False
+    if ok:
+        print("✅ Memory cap evicts the oldest agents and keeps the one in use.")
+    return ok
+
+
+def check_evict_worker():
+    pool = AgentPool()
+    worker_a, worker_b = object(), object()
+    pool.put("s1", FakeAgent(), worker=worker_a, prompt_key="k1")
+    pool.put("s2", FakeAgent(), worker=worker_b)
+    pool.put("s3", FakeAgent(), worker=worker_a)
+    pool.evict_worker(worker_a)
+    if list(pool._entries) == ["s2"] and pool.worker_of("s2") is worker_b and pool.prompt_key_of("s1") is None \
+            and pool.evictions["worker_restart"] == 2:
+        print("✅ evict_worker drops only the agents bound to the restarted worker.")
+        return True
+    print(f"❌ evict_worker: sessions {list(pool._entries)}, evictions {pool.evictions}")
+    return False
+
+
+def main():
+    results = [
+        check_lru(),
+        check_idle_ttl(),
+        check_memory_cap(),
+        check_evict_worker(),
+    ]
+    return all(results)
+
+
+if __name__ == "__main__":
+    sys.exit(0 if main() else 1)
@@ -0,0 +1,59 @@
+"""
+Regression checks for RAG/digest.match_digest_fields: which queries are answered from the
+business digest and which must go through full retrieval (no LLM or vector store needed):
+    python verify_digest_routing.py
+"""
+import os
+import sys
+
+PROJECT_ROOT = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, PROJECT_ROOT)
+
+from RAG.digest import match_digest_fields
+
+# Whole-field questions: answered straight from the digest
+FROM_DIGEST = {
+    "what is our tone": ["brand_voice"],
+    "Describe our brand voice.": ["brand_voice"],
+    "What are our key products?": ["key_products"],
+    "what's our pricing": ["offers"],
+    "tell me about our current offers": ["offers"],
+    "describe our target audience": ["audience"],
+    "who are our customers?": ["audience"],
+    "what are our products and services": ["key_products"],
+}
+
+# Specific facts, or requests that only mention a field: must run RAG
+NEEDS_RETRIEVAL = [
+    "what is our return policy for sale items",
+    "what is our discount code expiry date",
+    "what are our best selling products last quarter",
+    "tell me about our new product launch plans",
+    "who is our audience on tiktok compared to instagram",
+    "what is our menu price for the large pizza",
+    "write a post about our new product",
+    "Create an Instagram caption in our brand voice for the summer sale",
+    "what products do we sell",
+    "what is our opening time",
+]
+
+
+def main():
+    ok = True
+    for query, expected in FROM_DIGEST.items():
+        fields = match_digest_fields(query)
+        if fields != expected:
+            print(f"❌ {query!r}: expected {expected}, got {fields}")
+            ok = False
+    for query in NEEDS_RETRIEVAL:
+        fields = match_digest_fields(query)
+        if fields:
+            print(f"❌ {query!r} would be answered from the digest ({fields}) instead of retrieval")
+            ok = False
+    if ok:
+        print(f"✅ {len(FROM_DIGEST)} whole-field questions use the digest; {len(NEEDS_RETRIEVAL)} other queries go to RAG.")
+    return ok
+
+
+if __name__ == "__main__":
+    sys.exit(0 if main() else 1)
@@ -0,0 +1,83 @@
+"""
+Regression checks for history_writer.HistoryWriter, run against a throwaway SQLite database:
+    python verify_history_writer.py
+"""
+import asyncio
+import os
+import sys
+import tempfile
+import threading
+
+# database.py opens ./social_sphere_new.db, so run from a scratch directory
+PROJECT_ROOT = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, PROJECT_ROOT)
+os.chdir(tempfile.mkdtemp())
+
+import models
+from database import engine, SessionLocal
+from history_writer import HistoryWriter
+
+models.Base.metadata.create_all(bind=engine)
+
+
+def count(model):
+    with SessionLocal() as db:
+        return db.query(model).count()
+
+
+async def check_bad_field_fails_at_call_site():
+    writer = HistoryWriter()
+    try:
+        writer.log(models.ChatHistory, username="a@b.c", chat_id="gen_1")
+    except TypeError:
+        print("✅ Unknown field rejected by log().")
+        return True
+    print("❌ log() accepted a field the model doesn't have.")
+    return False
+
+
+async def check_failed_batch_keeps_good_rows():
+    writer = HistoryWriter(flush_interval=60)
+    before = count(models.PostHistory)
+    writer.log(models.PostHistory, username="a@b.c", text="fb", timestamp="now", media_used="Facebook")
+    # Fails when the batch is written (SQLite can't bind an object), not in log()
+    writer.log(models.PostHistory, username="a@b.c", text=object(), timestamp="now", media_used="X")
+    writer.log(models.PostHistory, username="a@b.c", text="ig", timestamp="now", media_used="Instagram")
+    await writer.stop()
+    metrics = writer.metrics()
+    written = count(models.PostHistory) - before
+    if written == 2 and metrics["written"] == 2 and metrics["dropped"] == 1:
+        print(f"✅ Failed batch fell back to row-by-row writes: {metrics}")
+        return True
+    print(f"❌ Expected 2 rows written and 1 dropped, got {written} rows, {metrics}")
+    return False
+
+
+async def check_log_from_thread():
+    writer = HistoryWriter(flush_interval=0.1)
+    writer.start()
+    before = count(models.ChatHistory)
+    thread = threading.Thread(target=lambda: writer.log(
+        models.ChatHistory, username="a@b.c", input_message="q", agent_response="r", timestamp="now"))
+    thread.start()
+    thread.join()
+    await asyncio.sleep(0.5)
+    await writer.stop()
+    if count(models.ChatHistory) - before == 1:
+        print("✅ Row logged from a worker thread was written.")
+        return True
+    print("❌ Row logged from a worker thread was not written.")
+    return False
+
+
+async def main():
+    results = [
+        await check_bad_field_fails_at_call_site(),
+        await check_failed_batch_keeps_good_rows(),
+        await check_log_from_thread(),
+    ]
+    return all(results)
+
+
+if __name__ == "__main__":
+    sys.exit(0 if asyncio.run(main()) else 1)
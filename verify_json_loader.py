@@ -0,0 +1,122 @@
+"""
+Regression checks for RAG/data_loader.iter_json_records, on files in a scratch directory:
+    python verify_json_loader.py
+"""
+import json
+import os
+import sys
+import tempfile
+import tracemalloc
+
+PROJECT_ROOT = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, PROJECT_ROOT)
+
+import RAG.data_loader as data_loader
+from RAG.data_loader import iter_json_records
+
+SCRATCH = tempfile.mkdtemp()
+# Items with strings, escapes, numbers and literals, so tiny reads cut through every kind of token
+RECORDS = [
+    {"id": i, "title": f"Item \"{i}\" café \\ {'x' * (i % 7)}", "price": -12.5e-1 * i, "tags": ["a", "b"],
+     "in_stock": i % 2 == 0, "discount": None}
+    for i in range(50)
+]
+
+
+def write(name, text):
+    path = os.path.join(SCRATCH, name)
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(text)
+    return path
+
+
+def records(path, streamed=True, read_size=7, records_path=""):
+    # Streamed with reads of a few characters, or parsed whole like a small file
+    data_loader.JSON_PARSE_WHOLE_BYTES = -1 if streamed else 4 << 20
+    data_loader.JSON_READ_SIZE = read_size
+    data_loader.JSON_RECORDS_PATH = records_path
+    return list(iter_json_records(path))
+
+
+def fails(path, message, **kwargs):
+    try:
+        records(path, **kwargs)
+    except ValueError as e:
+        return message in str(e)
+    return False
+
+
+def check_array():
+    path = write("array.json", json.dumps(RECORDS, ensure_ascii=False, indent=1))
+    if records(path) == RECORDS and records(path, streamed=False) == RECORDS and records(write("empty.json", " [ ] ")) == []:
+        print("✅ Top-level array streamed item by item.")
+        return True
+    print("❌ Top-level array records differ from the input.")
+    return False
+
+
+def check_wrapped_object():
+    ok = True
+    path = write("wrapped.json", json.dumps({"meta": {"count": 50, "note": "[not this]"}, "products": RECORDS}))
+    if records(path) != RECORDS or records(path, streamed=False) != RECORDS:
+        print("❌ Wrapped {\"products\": [...]} records differ from the input.")
+        ok = False
+    nested = write("nested.json", json.dumps({"tags": ["x"], "data": {"page": 1, "items": RECORDS}}))
+    if records(nested, records_path="data.items") != RECORDS or records(nested, streamed=False, records_path="data.items") != RECORDS:
+        print("❌ Records at RAG_JSON_RECORDS_PATH=data.items differ from the input.")
+        ok = False
+    if not fails(write("nolist.json", json.dumps({"a": 1, "b": {"c": 2}})), "No list of records"):
+        print("❌ Object without a record list was not reported.")
+        ok = False
+    if ok:
+        print("✅ Wrapped and nested record lists streamed.")
+    return ok
+
+
+def check_jsonl_with_bad_line():
+    lines = [json.dumps(r) for r in RECORDS[:3]]
+    path = write("feed.jsonl", "\n".join([lines[0], "{broken", "", lines[1], lines[2]]) + "\n")
+    if records(path) == RECORDS[:3]:
+        print("✅ Invalid JSONL line skipped, the others kept.")
+        return True
+    print("❌ JSONL with a bad line did not yield the good records.")
+    return False
+
+
+def check_truncated_and_malformed():
+    ok = True
+    text = json.dumps(RECORDS)
+    if not fails(write("truncated.json", text[:len(text) // 2]), "Truncated"):
+        print("❌ Truncated array was not reported as truncated.")
+        ok = False
+    if not fails(write("cut.json", text[:-1]), "Truncated"):
+        print("❌ Array missing its closing bracket was not reported as truncated.")
+        ok = False
+
+    # A bad item near the start of a large file must fail without buffering the rest of it
+    tail = ", ".join(json.dumps(r) for r in RECORDS * 400)
+    path = write("malformed.json", '[{"id": 1}, {"id": 2 "title": "missing comma"}, ' + tail + "]")
+    tracemalloc.start()
+    failed = fails(path, "Invalid JSON", read_size=1 << 16)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    if not failed or peak > os.path.getsize(path) // 4:
+        print(f"❌ Malformed item: raised={failed}, peak memory {peak} bytes for a {os.path.getsize(path)} byte file")
+        ok = False
+    if ok:
+        print("✅ Truncated input reported; a malformed item fails without reading the rest of the file.")
+    return ok
+
+
+def main():
+    results = [
+        check_array(),
+        check_wrapped_object(),
+        check_jsonl_with_bad_line(),
+        check_truncated_and_malformed(),
+    ]
+    return all(results)
+
+
+if __name__ == "__main__":
+    sys.exit(0 if main() else 1)
@@ -0,0 +1,85 @@
+"""
+Regression checks for Agents/scheduler.RunScheduler timeouts (no agent or MCP servers needed):
+    python verify_scheduler.py
+"""
+import asyncio
+import os
+import sys
+
+PROJECT_ROOT = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, PROJECT_ROOT)
+
+from Agents.scheduler import RunScheduler, AgentBusy
+
+
+async def hold(scheduler, session_id, seconds, started=None):
+    async with scheduler.slot(session_id):
+        if started:
+            started.set()
+        await asyncio.sleep(seconds)
+
+
+async def try_run(scheduler, session_id):
+    try:
+        async with scheduler.slot(session_id):
+            return "ran"
+    except AgentBusy:
+        return "busy"
+
+
+async def check_session_timeout():
+    scheduler = RunScheduler(max_concurrent=4, queue_timeout=0.1)
+    started = asyncio.Event()
+    first = asyncio.create_task(hold(scheduler, "s1", 0.3, started))
+    await started.wait()
+    timed_out = await try_run(scheduler, "s1")
+    await first
+    after = await try_run(scheduler, "s1")
+    if timed_out == "busy" and after == "ran" and not scheduler._sessions and scheduler.queued == 0:
+        print("✅ Session timeout raised AgentBusy and left the session usable.")
+        return True
+    print(f"❌ Session timeout: got {timed_out!r} then {after!r}, metrics {scheduler.metrics()}")
+    return False
+
+
+async def check_slot_timeout():
+    scheduler = RunScheduler(max_concurrent=1, queue_timeout=0.1)
+    started = asyncio.Event()
+    first = asyncio.create_task(hold(scheduler, "s1", 0.3, started))
+    await started.wait()
+    timed_out = await try_run(scheduler, "s2")
+    await first
+    after = await try_run(scheduler, "s2")
+    if timed_out == "busy" and after == "ran" and not scheduler._slots.locked():
+        print("✅ Slot timeout raised AgentBusy and released the session lock.")
+        return True
+    print(f"❌ Slot timeout: got {timed_out!r} then {after!r}, metrics {scheduler.metrics()}")
+    return False
+
+
+async def check_release_at_deadline():
+    """The holder finishes right at the waiter's deadline, many times: no lock may be leaked."""
+    scheduler = RunScheduler(max_concurrent=1, queue_timeout=0.01)
+    for _ in range(200):
+        first = asyncio.create_task(hold(scheduler, "s1", 0.01))
+        await asyncio.sleep(0)
+        await try_run(scheduler, "s1")
+        await first
+        if await try_run(scheduler, "s1") != "ran" or scheduler._slots._value != scheduler.max_concurrent:
+            print(f"❌ Lock or slot leaked by a timeout at the release: {scheduler.metrics()}")
+            return False
+    print("✅ Timeouts racing a release never leaked the session lock or slot.")
+    return True
+
+
+async def main():
+    results = [
+        await check_session_timeout(),
+        await check_slot_timeout(),
+        await check_release_at_deadline(),
+    ]
+    return all(results)
+
+
+if __name__ == "__main__":
+    sys.exit(0 if asyncio.run(main()) else 1)
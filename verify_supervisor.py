@@ -0,0 +1,117 @@
+"""
+Regression checks for repeated tool calls in Agents/supervisor.RunSupervisor and
+Agents/tool_memo.ToolMemo, with fake tools (no agent or MCP servers needed):
+    python verify_supervisor.py
+"""
+import asyncio
+import os
+import sys
+from types import SimpleNamespace
+
+PROJECT_ROOT = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, PROJECT_ROOT)
+
+from mcp.types import CallToolResult, TextContent
+from Agents.supervisor import RunSupervisor
+from Agents.tool_memo import ToolMemo
+
+
+def call(name, **arguments):
+    return SimpleNamespace(params=SimpleNamespace(name=name, arguments=arguments))
+
+
+def result(text, is_error=False):
+    return CallToolResult(content=[TextContent(type="text", text=text)], isError=is_error)
+
+
+class FlakyTool:
+    """Fails the first `failures` executions, then succeeds."""
+
+    def __init__(self, failures=1, delay=0.0):
+        self.failures = failures
+        self.delay = delay
+        self.executions = 0
+
+    async def __call__(self, context):
+        self.executions += 1
+        await asyncio.sleep(self.delay)
+        if self.executions <= self.failures:
+            return result("upstream timed out", is_error=True)
+        return result(f"ok #{self.executions}")
+
+
+def through(memo, supervisor, tool):
+    """memo -> supervisor -> tool, the order AgentService installs them in."""
+    async def run(context):
+        return await memo.on_call_tool(context, lambda ctx: supervisor.on_call_tool(ctx, tool))
+    return run
+
+
+async def check_retry_after_error():
+    supervisor = RunSupervisor()
+    tool = FlakyTool(failures=1)
+    with supervisor.run("research coffee trends"):
+        first = await supervisor.on_call_tool(call("tavily_search", q="coffee"), tool)
+        retry = await supervisor.on_call_tool(call("tavily_search", q="coffee"), tool)
+        repeat = await supervisor.on_call_tool(call("tavily_search", q="coffee"), tool)
+    if first.isError and not retry.isError and repeat.isError and tool.executions == 2:
+        print("✅ Failed call retried once; repeat of the successful call refused.")
+        return True
+    print(f"❌ Retry after error: executions={tool.executions}, results={[first.isError, retry.isError, repeat.isError]}")
+    return False
+
+
+async def check_retries_are_bounded():
+    supervisor = RunSupervisor()
+    tool = FlakyTool(failures=10)
+    with supervisor.run("research coffee trends") as run:
+        for _ in range(4):
+            await supervisor.on_call_tool(call("tavily_search", q="coffee"), tool)
+    if tool.executions == 2 and run.interventions["failed_retry"] == 2:
+        print("✅ A call that keeps failing is not retried indefinitely.")
+        return True
+    print(f"❌ Persistent failure executed {tool.executions} times, interventions {dict(run.interventions)}")
+    return False
+
+
+async def check_memo_retry_path():
+    supervisor, memo = RunSupervisor(), ToolMemo()
+    memo.idempotent.add("retrieve_business_context")
+    tool = FlakyTool(failures=1, delay=0.05)
+    run_tool = through(memo, supervisor, tool)
+    with supervisor.run("write a caption"):
+        # Concurrent identical calls share the first execution; it fails, so the waiter runs it again
+        first, second = await asyncio.gather(run_tool(call("retrieve_business_context", query="menu")),
+                                             run_tool(call("retrieve_business_context", query="menu")))
+    if first.isError and not second.isError and tool.executions == 2:
+        print("✅ ToolMemo's retry after a failed first call reaches the tool.")
+        return True
+    print(f"❌ Memo retry: executions={tool.executions}, results={[first.isError, second.isError]}")
+    return False
+
+
+async def check_concurrent_duplicates():
+    supervisor = RunSupervisor()
+    tool = FlakyTool(failures=0, delay=0.05)
+    with supervisor.run("publish this to instagram"):
+        results = await asyncio.gather(*(supervisor.on_call_tool(call("post_to_instagram", caption="hi"), tool)
+                                         for _ in range(3)))
+    if tool.executions == 1 and sum(not r.isError for r in results) == 1:
+        print("✅ Concurrent identical calls executed only once.")
+        return True
+    print(f"❌ Concurrent identical calls executed {tool.executions} times")
+    return False
+
+
+async def main():
+    results = [
+        await check_retry_after_error(),
+        await check_retries_are_bounded(),
+        await check_memo_retry_path(),
+        await check_concurrent_duplicates(),
+    ]
+    return all(results)
+
+
+if __name__ == "__main__":
+    sys.exit(0 if asyncio.run(main()) else 1)
@@ -0,0 +1,125 @@
+"""
+Regression checks for tenant_cache.TenantCache (TTL expiry, LRU eviction and invalidation
+as done by /register), against a scratch SQLite database:
+    python verify_tenant_cache.py
+"""
+import os
+import sys
+import tempfile
+import time
+
+# database.py opens ./social_sphere_new.db
+PROJECT_ROOT = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, PROJECT_ROOT)
+SCRATCH = tempfile.mkdtemp()
+os.chdir(SCRATCH)
+
+from database import SessionLocal, engine
+import models
+from tenant_cache import TenantCache
+
+models.Base.metadata.create_all(bind=engine)
+
+
+def register(bid, email, industry="Bakery", business_name=None):
+    with SessionLocal() as db:
+        db.add(models.BusinessInfo(bid=bid, industry=industry, business_name=business_name or f"Business {bid}"))
+        db.add(models.UserCredentials(bid=bid, email=email, password="x"))
+        db.commit()
+
+
+def set_industry(bid, industry):
+    with SessionLocal() as db:
+        db.query(models.BusinessInfo).filter(models.BusinessInfo.bid == bid).update({"industry": industry})
+        db.commit()
+
+
+def unregister(bid):
+    with SessionLocal() as db:
+        db.query(models.UserCredentials).filter(models.UserCredentials.bid == bid).delete()
+        db.query(models.BusinessInfo).filter(models.BusinessInfo.bid == bid).delete()
+        db.commit()
+
+
+def check_ttl_expiry():
+    register(1, "ttl@example.com")
+    cache = TenantCache(ttl=0.2)
+    first = cache.get_by_bid(1)
+    set_industry(1, "Cafe")
+    cached = cache.get_by_bid(1)
+    by_email = cache.get_by_email("TTL@example.com")
+    time.sleep(0.3)
+    expired = cache.get_by_bid(1)
+    metrics = cache.metrics()
+    if (first.industry, cached.industry, by_email.bid, expired.industry) == ("Bakery", "Bakery", 1, "Cafe") \
+            and metrics["hits"] == 2 and metrics["misses"] == 2:
+        print("✅ Entries served from cache until their TTL, then reloaded.")
+        return True
+    print(f"❌ TTL: industries {[p.industry for p in (first, cached, expired)]}, metrics {metrics}")
+    return False
+
+
+def check_lru_eviction():
+    for bid in (11, 12, 13):
+        register(bid, f"lru{bid}@example.com")
+    cache = TenantCache(max_entries=2)
+    cache.get_by_bid(11)
+    cache.get_by_bid(12)
+    cache.get_by_bid(11)  # 12 is now the least recently used
+    cache.get_by_email("lru13@example.com")
+    hits = cache.hits
+    ok = True
+    if set(cache._by_bid) != {11, 13} or "lru12@example.com" in cache._bid_by_email:
+        print(f"❌ LRU: cached bids {sorted(cache._by_bid)}, emails {sorted(cache._bid_by_email)}")
+        ok = False
+    cache.get_by_bid(11)
+    cache.get_by_bid(12)
+    if cache.hits != hits + 1 or cache.metrics()["entries"] != 2:
+        print(f"❌ LRU: expected one hit (bid 11) and one reload (bid 12), metrics {cache.metrics()}")
+        ok = False
+    if ok:
+        print("✅ Least recently used entry evicted at max_entries.")
+    return ok
+
+
+def check_register_invalidation():
+    cache = TenantCache()
+    ok = True
+    if cache.get_by_bid(21) is not None or cache.metrics()["entries"] != 0:
+        print("❌ Unknown bid was cached.")
+        ok = False
+    register(21, "owner@example.com")
+    if cache.get_by_bid(21) is None:
+        print("❌ Business registered after a miss was not found.")
+        ok = False
+
+    # The email is registered again under a new bid; /register then invalidates the new bid and email
+    unregister(21)
+    register(22, "owner@example.com", industry="Florist")
+    if cache.get_by_email("owner@example.com").bid != 21:
+        print("❌ Setup: the old email -> bid mapping should still be cached before invalidation.")
+        ok = False
+    cache.invalidate(bid=22, email="Owner@Example.com")
+    profile = cache.get_by_email("owner@example.com")
+    if profile is None or (profile.bid, profile.industry) != (22, "Florist"):
+        print(f"❌ After invalidation the email resolved to {profile and (profile.bid, profile.industry)}")
+        ok = False
+    if cache.get_by_bid(21) is not None:
+        print("❌ The email's previous bid was still served from the cache.")
+        ok = False
+    if ok:
+        print("✅ Invalidation on registration drops the stale email -> bid mapping and its profile.")
+    return ok
+
+
+def main():
+    results = [
+        check_ttl_expiry(),
+        check_lru_eviction(),
+        check_register_invalidation(),
+    ]
+    return all(results)
+
+
+if __name__ == "__main__":
+    sys.exit(0 if main() else 1)
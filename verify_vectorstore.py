@@ -0,0 +1,188 @@
+"""
+Regression checks for RAG/vectorstore.py snapshots and search, on random vectors in a scratch directory
+(no embedding model needed):
+    python verify_vectorstore.py
+"""
+import os
+import sys
+import tempfile
+import numpy as np
+
+# database.py (imported via RAG.tools -> tenant_cache) opens ./social_sphere_new.db
+PROJECT_ROOT = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, PROJECT_ROOT)
+SCRATCH = tempfile.mkdtemp()
+os.chdir(SCRATCH)
+
+import RAG.tools as rag_tools
+from RAG.vectorstore import FaissVectorStore, LEASES_DIRNAME, DOCUMENTS_FILENAME
+
+DIM = 16
+rng = np.random.default_rng(7)
+
+
+def vectors(n):
+    return rng.random((n, DIM), dtype=np.float32)
+
+
+def chunk(source, ingested_at="2025-01-01T00:00:00"):
+    return {"text": source, "source": source, "file_type": os.path.splitext(source)[1].lstrip("."),
+            "ingested_at": ingested_at}
+
+
+def leases(snapshot_dir):
+    return os.listdir(os.path.join(snapshot_dir, LEASES_DIRNAME))
+
+
+def check_gc_keeps_leased_snapshots():
+    writer = FaissVectorStore(persist_dir=os.path.join(SCRATCH, "snapshots"))
+    writer.add_embeddings(vectors(5), [chunk("a.pdf")] * 5)
+    writer.save()
+
+    ok = True
+    reader = FaissVectorStore(persist_dir=writer.persist_dir)
+    with reader.pinned():
+        pinned_snapshot = reader.snapshot_dir
+        # Enough newer snapshots that the pinned one is past KEEP_PREVIOUS_SNAPSHOTS
+        for _ in range(3):
+            writer.add_embeddings(vectors(5), [chunk("a.pdf")] * 5)
+            writer.save()
+        if not os.path.isdir(pinned_snapshot) or reader.search(vectors(1), top_k=5)[0]["metadata"] is None:
+            print("❌ A snapshot was garbage-collected while a reader held its lease.")
+            ok = False
+    if reader._lease_path is not None or leases(pinned_snapshot):
+        print("❌ pinned() did not release its lease.")
+        ok = False
+    writer.collect_garbage()
+    if os.path.isdir(pinned_snapshot):
+        print("❌ Unleased old snapshot was not garbage-collected.")
+        ok = False
+    latest = FaissVectorStore(persist_dir=writer.persist_dir)
+    latest.load()
+    if latest.index.ntotal != 20 or latest.loaded_version != writer.current_version():
+        print("❌ Load did not pick up the snapshot CURRENT points to.")
+        ok = False
+    if ok:
+        print("✅ Leased snapshots survive GC; released ones are collected.")
+    return ok
+
+
+def check_reload_swaps_store():
+    rag_tools.PDFS_VECTORIZED_DIR = os.path.join(SCRATCH, "industries")
+    writer = FaissVectorStore(bid="Bakery", persist_dir=rag_tools.PDFS_VECTORIZED_DIR)
+    writer.add_embeddings(vectors(10), [chunk("a.pdf")] * 10)
+    writer.save()
+
+    ok = True
+    query = vectors(1)
+    with rag_tools.industry_store("Bakery") as old:
+        old_snapshot = old.snapshot_dir
+        # A new snapshot is published while a query is still running on the old one
+        writer.add_embeddings(vectors(5), [chunk("b.pdf")] * 5)
+        writer.save()
+        with rag_tools.industry_store("Bakery") as new:
+            if new is old or new.index.ntotal != 15:
+                print("❌ Reload did not hand out a new store for the new snapshot.")
+                ok = False
+        if old.index.ntotal != 10 or len(old.metadata) != 10 or len(old.search(query, top_k=3)) != 3:
+            print("❌ Store in use was modified by the reload.")
+            ok = False
+        if not leases(old_snapshot):
+            print("❌ Old snapshot lost its lease while a query was still using it.")
+            ok = False
+    if leases(old_snapshot):
+        print("❌ Old snapshot still leased after its last query finished.")
+        ok = False
+    if ok:
+        print("✅ Reload swapped in a new store; the old one stayed intact until released.")
+    return ok
+
+
+def check_filtered_search():
+    store = FaissVectorStore(persist_dir=os.path.join(SCRATCH, "filters"))
+    metadatas = ([chunk("menu.pdf", "2025-01-01T00:00:00")] * 20 + [chunk("prices.docx", "2025-03-01T00:00:00")] * 20
+                 + [chunk("notes.txt", "2025-06-01T00:00:00")] * 20)
+    store.add_embeddings(vectors(60), metadatas)
+    query = vectors(1)
+
+    cases = [
+        ({"source": "menu.pdf"}, {"menu.pdf"}),
+        ({"source": "menu"}, {"menu.pdf"}),
+        ({"file_type": ["docx", ".txt"]}, {"prices.docx", "notes.txt"}),
+        ({"uploaded_after": "2025-02-01"}, {"prices.docx", "notes.txt"}),
+        ({"uploaded_before": "2025-02-01", "file_type": "pdf"}, {"menu.pdf"}),
+        ({"source": "menu.pdf", "file_type": "txt"}, set()),
+    ]
+    ok = True
+    for filters, expected in cases:
+        results = store.search(query, top_k=10, filters=filters)
+        sources = {r["metadata"]["source"] for r in results}
+        if sources != expected or (expected and len(results) != 10):
+            print(f"❌ Filters {filters}: expected {sorted(expected)}, got {len(results)} results from {sorted(sources)}")
+            ok = False
+    if ok:
+        print("✅ Filtered searches only returned matching chunks.")
+    return ok
+
+
+def check_document_centroids():
+    persist_dir = os.path.join(SCRATCH, "documents")
+    ok = True
+    empty = FaissVectorStore(persist_dir=persist_dir)
+    empty.add_embeddings(np.zeros((0, DIM), dtype=np.float32))
+    empty.save()
+    if os.path.exists(os.path.join(empty.snapshot_dir, DOCUMENTS_FILENAME)):
+        print("❌ Empty store wrote a documents file.")
+        ok = False
+
+    # Two batches, the second adding to a file from the first, saved and reloaded in between
+    first, second = vectors(40), vectors(30)
+    sources = [f"doc_{i % 20}.pdf" for i in range(70)]
+    writer = FaissVectorStore(persist_dir=persist_dir)
+    writer.add_embeddings(first, [chunk(s) for s in sources[:40]])
+    writer.save()
+    writer = FaissVectorStore(persist_dir=persist_dir)
+    writer.load()
+    writer.add_embeddings(second, [chunk(s) for s in sources[40:]])
+    writer.save()
+
+    reader = FaissVectorStore(persist_dir=persist_dir, read_only=True)
+    reader.load()
+    _, centroids, chunk_ids, offsets = reader._document_index()
+    everything = np.concatenate([first, second])
+    for centroid, start, end in zip(centroids, offsets[:-1], offsets[1:]):
+        ids = chunk_ids[start:end]
+        if {sources[i] for i in ids} != {sources[ids[0]]} or not np.allclose(centroid, everything[ids].mean(axis=0), atol=1e-5):
+            print(f"❌ Centroid for {sources[ids[0]]} doesn't match its chunks.")
+            ok = False
+            break
+    if sorted(chunk_ids.tolist()) != list(range(70)):
+        print("❌ Document groups don't cover every chunk exactly once.")
+        ok = False
+
+    query = vectors(1)
+    flat = [r["index"] for r in reader.search(query, top_k=5)]
+    exact = np.argsort(((everything - query[0]) ** 2).sum(axis=1))[:5].tolist()
+    if flat != exact:
+        print("❌ Default search is not an exact scan.")
+        ok = False
+    if len(reader.search(query, top_k=5, top_documents=4)) != 5:
+        print("❌ Two-stage search over the loaded documents file failed.")
+        ok = False
+    if ok:
+        print("✅ Per-file centroids built from added vectors; default search stays exact.")
+    return ok
+
+
+def main():
+    results = [
+        check_gc_keeps_leased_snapshots(),
+        check_reload_swaps_store(),
+        check_filtered_search(),
+        check_document_centroids(),
+    ]
+    return all(results)
+
+
+if __name__ == "__main__":
+    sys.exit(0 if main() else 1)